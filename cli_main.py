@@ -1,22 +1,33 @@
+import time
+
+_STARTUP_BEGIN = time.perf_counter()
+
 import argparse
 import asyncio
+import atexit
 from datetime import datetime, timedelta
 from os.path import exists
 from pathlib import Path
 import json
 import tempfile
 import os
-import nest_asyncio
 
 from conf import BASE_DIR
-from uploader.douyin_uploader.main import douyin_setup, DouYinVideo
-from uploader.ks_uploader.main import ks_setup, KSVideo
-from uploader.tencent_uploader.main import weixin_setup, TencentVideo
-from uploader.tk_uploader.main_chrome import tiktok_setup, TiktokVideo
-from utils.base_social_media import get_supported_social_media, get_cli_action, SOCIAL_MEDIA_DOUYIN, \
-    SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_KUAISHOU, load_workflow_config, run_workflow
-from utils.constant import TencentZoneTypes
-from utils.files_times import get_title_and_hashtags, generate_schedule_time_next_day
+# 这里只导入轻量模块；各平台的 uploader(以及 playwright)由注册表在真正使用时才导入
+from utils.base_social_media import get_supported_social_media, get_cli_action, get_uploader, get_account_file, \
+    PLATFORM_REGISTRY, PLATFORM_IMPORT_TIMES, load_workflow_config
+from utils.archive import get_archive
+from utils.publish_plan import DEFAULT_HORIZON_DAYS
+from utils.workflow import run_workflow
+
+_STARTUP_IMPORTS_DONE = time.perf_counter()
+
+
+def print_import_profile():
+    """打印 CLI 启动以及按需导入平台模块的耗时，用于 --profile-imports。"""
+    print(f"[profile] cli startup imports: {(_STARTUP_IMPORTS_DONE - _STARTUP_BEGIN) * 1000:.1f} ms")
+    for module_path, cost in PLATFORM_IMPORT_TIMES.items():
+        print(f"[profile] lazy import {module_path}: {cost * 1000:.1f} ms")
 
 
 def parse_schedule(schedule_raw):
@@ -33,11 +44,60 @@ async def main():
     parser.add_argument("platform", metavar='platform', nargs='?', choices=get_supported_social_media(), help="Choose social-media platform: douyin tencent tiktok kuaishou")
 
     parser.add_argument("account_name", type=str, nargs='?', help="Account name for the platform: xiaoA")
+    parser.add_argument("--profile-imports", action="store_true", help="Print import timings on exit")
     subparsers = parser.add_subparsers(dest="action", metavar='action', help="Choose action", required=True)
 
     # Add workflow subcommand
     workflow_parser = subparsers.add_parser('workflow', help='Run the multi-account workflow')
     workflow_parser.add_argument('-c', '--config', help='Path to the workflow configuration file', required=True)
+    workflow_parser.add_argument('-w', '--workers', type=int, default=1,
+                                 help='Number of worker processes, jobs are sharded by account (default: 1)')
+
+    # 分布式模式：enqueue 把 workflow 任务写入共享队列，各上传机运行 worker 领取执行
+    enqueue_parser = subparsers.add_parser('enqueue', help='Put workflow jobs into the shared job queue')
+    enqueue_parser.add_argument('-c', '--config', help='Path to the workflow configuration file', required=True)
+    enqueue_parser.add_argument('-q', '--queue', help='Path to the job queue database', default=None)
+    worker_parser = subparsers.add_parser('worker', help='Claim and run jobs from the shared job queue')
+    worker_parser.add_argument('-q', '--queue', help='Path to the job queue database', default=None)
+    worker_parser.add_argument('-c', '--config', help='Workflow config for memory budget, rate limits and the publish archive', default=None)
+    worker_parser.add_argument('--worker-id', help='Worker id, defaults to host-pid-random', default=None)
+    worker_parser.add_argument('--concurrency', type=int, default=2, help='Jobs run at the same time (default: 2)')
+    keepalive_parser = subparsers.add_parser('keepalive', help='Periodically refresh account sessions to avoid re-login')
+    keepalive_parser.add_argument('--once', action='store_true', help='Run a single round and exit')
+    keepalive_parser.add_argument('--interval', type=int, default=3600, help='Seconds between rounds (default: 3600)')
+    keepalive_parser.add_argument('--http-concurrency', type=int, default=10, help='Concurrent HTTP refreshes (default: 10)')
+    keepalive_parser.add_argument('--browsers', type=int, default=1, help='Browsers open at the same time (default: 1)')
+    keepalive_parser.add_argument('--browser-visits', type=int, default=5,
+                                  help='Max browser refreshes per round (default: 5)')
+    login_batch_parser = subparsers.add_parser('login-batch', help='Log in many accounts at once by scanning QR codes on a local page')
+    login_batch_parser.add_argument('-c', '--config', default=None,
+                                    help='Workflow config listing the accounts, defaults to every cookie file')
+    login_batch_parser.add_argument('--platform', default=None, help='Only log in accounts of this platform')
+    login_batch_parser.add_argument('--all', action='store_true', help='Also log in accounts whose cookies are still valid')
+    login_batch_parser.add_argument('--port', type=int, default=8765, help='Port of the QR code page (default: 8765)')
+    login_batch_parser.add_argument('--timeout', type=int, default=600, help='Seconds to wait for each scan (default: 600)')
+    login_batch_parser.add_argument('--concurrency', type=int, default=10,
+                                    help='Login pages open at the same time (default: 10)')
+    cookies_parser = subparsers.add_parser('cookies', help='List accounts in the cookie store, or import/export json files')
+    cookies_parser.add_argument('--import', dest='import_files', action='store_true',
+                                help='Import cookies/<platform>_uploader/*.json into the store')
+    cookies_parser.add_argument('--export', dest='export_files', action='store_true',
+                                help='Export every account in the store to its cookie json file')
+    cookies_parser.add_argument('--force', action='store_true', help='Import even if the store is newer')
+    cookies_parser.add_argument('--platform', default=None, help='Only list accounts of this platform')
+    cookies_parser.add_argument('--valid', action='store_true', help='Only list accounts whose last check passed')
+    profiles_parser = subparsers.add_parser('profiles', help='List or clean up persistent browser profiles')
+    profiles_parser.add_argument('--clean', action='store_true', help='Remove stale profiles and trim oversized caches')
+    profiles_parser.add_argument('--max-idle-days', type=int, default=30,
+                                 help='Profiles unused for longer than this are removed (default: 30)')
+    profiles_parser.add_argument('--max-mb', type=int, default=300, help='Size cap per profile in MB (default: 300)')
+    store_parser = subparsers.add_parser('store', help='Deduplicate videos into the content-addressed store')
+    store_parser.add_argument('--ingest', action='store_true',
+                              help='Move videos/ into the store, replacing duplicates with hardlinks')
+    store_parser.add_argument('--add', default=None, help='Video file to add to the store')
+    store_parser.add_argument('--to', action='append', default=[],
+                              help='Target <account>/<type> under videos/ for --add, can be repeated')
+    store_parser.add_argument('--gc', action='store_true', help='Remove blobs no longer linked from any account')
 
     actions = get_cli_action()
     # Add navigate action to supported actions
@@ -56,6 +116,8 @@ async def main():
 
     # 解析命令行参数
     args = parser.parse_args()
+    if args.profile_imports:
+        atexit.register(print_import_profile)
     # 参数校验
     if args.action == 'upload':
         if not exists(args.video_file):
@@ -63,24 +125,86 @@ async def main():
         if args.publish_type == 1 and not args.schedule:
             parser.error("The schedule must must be specified for scheduled publishing.")
 
-    account_file = Path(BASE_DIR / "cookies" / f"{args.platform}_{args.account_name}.json")
-    account_file.parent.mkdir(exist_ok=True)
+    # login / upload 针对单个账号，必须给出平台和账号名
+    if args.action in ('login', 'upload') and not (args.platform and args.account_name):
+        parser.error(f"platform and account_name are required for {args.action}")
+    if args.platform and args.account_name:
+        account_file = get_account_file(args.platform, args.account_name)
+        account_file.parent.mkdir(parents=True, exist_ok=True)
 
     # 根据 action 处理不同的逻辑
     if args.action == 'login':
         print(f"Logging in with account {args.account_name} on platform {args.platform}")
-        if args.platform == SOCIAL_MEDIA_DOUYIN:
-            await douyin_setup(str(account_file), handle=True)
-        elif args.platform == SOCIAL_MEDIA_TIKTOK:
-            await tiktok_setup(str(account_file), handle=True)
-        elif args.platform == SOCIAL_MEDIA_TENCENT:
-            await weixin_setup(str(account_file), handle=True)
-        elif args.platform == SOCIAL_MEDIA_KUAISHOU:
-            await ks_setup(str(account_file), handle=True)
+        await get_uploader(args.platform, account_file).setup(handle=True)
     elif args.action == 'workflow':
         print(f"Running workflow with config file: {args.config}")
         # Call a function to handle the workflow
-        await run_workflow(args.config)
+        await run_workflow(args.config, workers=args.workers)
+    elif args.action == 'enqueue':
+        from utils.job_queue import DEFAULT_QUEUE_PATH
+        from utils.workflow import enqueue_workflow
+        await enqueue_workflow(args.config, args.queue or DEFAULT_QUEUE_PATH)
+    elif args.action == 'worker':
+        from utils.job_queue import DEFAULT_QUEUE_PATH, run_queue_worker
+        workflow_config = load_workflow_config(args.config) if args.config else {}
+        await run_queue_worker(args.queue or DEFAULT_QUEUE_PATH, args.worker_id, args.concurrency,
+                               memory_budget=workflow_config.get('memory_budget_mb'),
+                               rate_limits=workflow_config.get('rate_limits'), workflow_config=workflow_config)
+    elif args.action == 'keepalive':
+        from utils.keep_alive import KeepAliveScheduler
+        scheduler = KeepAliveScheduler(args.http_concurrency, args.browsers, args.browser_visits)
+        if args.once:
+            for name, result in (await scheduler.run_round()).items():
+                print(f"{result:>8}  {name}")
+        else:
+            await scheduler.run_forever(args.interval)
+    elif args.action == 'login-batch':
+        from utils.batch_login import batch_login, expired_accounts, login_candidates
+        accounts = login_candidates(load_workflow_config(args.config) if args.config else None, args.platform)
+        if not args.all:
+            accounts = await expired_accounts(accounts)
+        if not accounts:
+            print("No account needs to log in.")
+            return
+        results = await batch_login(accounts, args.concurrency, args.port, args.timeout)
+        for name, status in results.items():
+            print(f"{status:>8}  {name}")
+    elif args.action == 'cookies':
+        from utils.cookie_store import get_cookie_store
+        store = get_cookie_store()
+        if args.import_files:
+            print(f"Imported {store.import_files(force=args.force)} cookie files into {store.path}")
+        elif args.export_files:
+            print(f"Exported {store.export_files()} accounts from {store.path}")
+        else:
+            for platform, account, version, updated, valid, checked in store.accounts(args.platform, True if args.valid else None):
+                status = {None: 'unchecked', 1: 'valid', 0: 'invalid'}[valid]
+                print(f"{platform:>10} {account:<30} v{version:<4} {datetime.fromtimestamp(updated):%Y-%m-%d %H:%M} {status}")
+    elif args.action == 'profiles':
+        from utils.browser_profile import cleanup_profiles
+        results = cleanup_profiles(args.max_idle_days, args.max_mb * 1024 * 1024, dry_run=not args.clean)
+        for directory, action, size in results:
+            print(f"{action:>8} {size / 1024 / 1024:8.1f} MB  {directory.relative_to(BASE_DIR)}")
+        if not args.clean:
+            print("Dry run, use --clean to apply.")
+    elif args.action == 'store':
+        from utils.video_store import VideoStore
+        store = VideoStore()
+        if args.add:
+            if not args.to:
+                parser.error("--add needs at least one --to <account>/<type>")
+            for target in store.add(args.add, args.to):
+                print(f"Linked {target.relative_to(BASE_DIR)}")
+        if args.ingest:
+            stats = store.ingest()
+            print(f"Ingested {stats['files']} videos, {stats['deduplicated']} duplicates replaced by hardlinks, "
+                  f"{stats['saved_bytes'] / 1024 / 1024:.1f} MB freed")
+        removed = store.gc(dry_run=not args.gc)
+        print(f"{'Removed' if args.gc else 'Unreferenced'} {len(removed)} blobs, "
+              f"{sum(size for _, size in removed) / 1024 / 1024:.1f} MB" + ("" if args.gc else ", use --gc to remove"))
+        stats = store.stats()
+        print(f"Store {store.store_dir}: {stats['blobs']} blobs, {stats['stored_bytes'] / 1024 / 1024:.1f} MB on disk "
+              f"for {stats['linked_bytes'] / 1024 / 1024:.1f} MB of linked videos")
     elif args.action == 'navigate':
         await show_navigation_menu()
 
@@ -169,30 +293,13 @@ async def manage_cookies_menu():
     
     # Construct cookie file path
     account_name = selected_account.get('name')
-    base_cookies_path = Path(BASE_DIR) / "cookies"
-    cookie_file = base_cookies_path / f"{selected_platform}_uploader" / f"{account_name}.json"
+    cookie_file = get_account_file(selected_platform, account_name)
     cookie_file.parent.mkdir(exist_ok=True)
     
     # Call the appropriate setup function based on platform
     try:
-        if selected_platform == SOCIAL_MEDIA_DOUYIN:
-            await douyin_setup(str(cookie_file), handle=True)
-        elif selected_platform == SOCIAL_MEDIA_KUAISHOU:
-            await ks_setup(str(cookie_file), handle=True)
-        elif selected_platform == SOCIAL_MEDIA_TENCENT:
-            await weixin_setup(str(cookie_file), handle=True)
-        elif selected_platform == 'bilibili': # 处理 bilibili 平台
-            print("\n----------------------------------------------------------------")
-            print("要获取账户 '{}' 的 Bilibili Cookie，请在终端中运行以下命令：".format(selected_account.get('name')))
-            # 使用双引号确保路径正确解析
-            biliup_command = f'uploader/bilibili_uploader/biliup.exe -u \"{str(cookie_file)}\" login'
-            print(biliup_command)
-            print("\nCookie 文件将会保存在: {}.json (该路径已包含在上面的命令中)".format(str(cookie_file).rsplit('.', 1)[0])) # 打印保存路径，去掉.json
-            print("运行命令后，请按照 biliup.exe 的提示完成登录。")
-            print("----------------------------------------------------------------")
-        # elif selected_platform == SOCIAL_MEDIA_TIKTOK:
-        #     await tiktok_setup(str(cookie_file), handle=True)
-        # Add other platforms as needed
+        if selected_platform in PLATFORM_REGISTRY:
+            await get_uploader(selected_platform, cookie_file).setup(handle=True)
         else:
             print(f"Cookie management for platform '{selected_platform}' is not yet supported in this menu.")
             
@@ -233,7 +340,8 @@ async def run_workflow_interactively():
         try:
             account_choice = int(input(f"Enter account number (1-{len(accounts) + 1}): ")) - 1
             if 0 <= account_choice < len(accounts):
-                selected_account_config = {"accounts": [accounts[account_choice]]}
+                # 保留 archive / staging / rate_limits 等全局设置，只换掉账号列表
+                selected_account_config = dict(config, accounts=[accounts[account_choice]])
                 print(f"Running workflow for account: {accounts[account_choice].get('name')}")
                 break
             elif account_choice == len(accounts):
@@ -304,10 +412,18 @@ async def run_workflow_interactively():
                                 date_str = input("Enter custom start date in YYYY-MM-DD format (e.g., 2024-12-31): ")
                                 try:
                                     start_date = datetime.strptime(date_str, '%Y-%m-%d')
-                                    print(f"Workflow will start scheduling from: {start_date.strftime('%Y-%m-%d')}")
-                                    break
                                 except ValueError:
                                     print("Invalid date format. Please use YYYY-MM-DD.")
+                                    continue
+                                # 平台只能定时到 horizon_days 天内，更晚的开始日期一个都排不上
+                                horizon_days = (config.get('publish_plan') or {}).get('horizon_days', DEFAULT_HORIZON_DAYS)
+                                last_date = datetime.now().date() + timedelta(days=horizon_days - 1)
+                                if not datetime.now().date() <= start_date.date() <= last_date:
+                                    print(f"Start date must be between today and {last_date.strftime('%Y-%m-%d')} "
+                                          f"(platforms schedule at most {horizon_days} days ahead).")
+                                    continue
+                                print(f"Workflow will start scheduling from: {start_date.strftime('%Y-%m-%d')}")
+                                break
                             break
                         else:
                             print("Invalid choice. Please enter 1 or 2.")
@@ -319,6 +435,7 @@ async def run_workflow_interactively():
                             total_videos_in_selection = 0
                             # Need to calculate total videos based on selected types and account path
                             base_videos_path = Path(BASE_DIR) / "videos"
+                            archive = get_archive(config)
                             for video_type in selected_types:
                                 for account in selected_account_config["accounts"]:
                                     account_name = account.get('name')
@@ -328,9 +445,12 @@ async def run_workflow_interactively():
                                         print(f"Path exists: {video_type_path.exists()}")
                                         print(f"Path is directory: {video_type_path.is_dir()}")
                                         if video_type_path.exists() and video_type_path.is_dir():
-                                            # Count .mp4 files recursively
-                                            for _ in video_type_path.glob("**/*.mp4"):
-                                                total_videos_in_selection += 1
+                                            # Count pending .mp4 files recursively (archived ones are skipped)
+                                            if archive:
+                                                total_videos_in_selection += len(archive.pending_videos(video_type_path))
+                                            else:
+                                                for _ in video_type_path.glob("**/*.mp4"):
+                                                    total_videos_in_selection += 1
 
 
                             if total_videos_in_selection == 0:
@@ -345,48 +465,13 @@ async def run_workflow_interactively():
                                 print("Videos per day must be a positive integer.")
                                 continue # Ask again
 
-                            # Calculate the number of days required
-                            import math
-                            days_to_schedule = math.ceil(total_videos_in_selection / videos_per_day)
-                            end_date = start_date + timedelta(days=days_to_schedule - 1)
-                            print(f"This will schedule videos over approximately {days_to_schedule} days, ending around {end_date.strftime('%Y-%m-%d')}.")
-
-
-                            # Generate schedule times based on the selected start date and videos per day
-                            # We need to modify generate_schedule_time_next_day or create a new function
-                            # that takes a start_date and generates times.
-                            # For now, let's adapt the existing function call assuming it can handle a start day offset.
-                            # The generate_schedule_time_next_day seems to start from the *next* day (start_days=0 means tomorrow).
-                            # We need a function that can start from a specific date.
-                            # Let's manually generate the dates and times for now based on the start_date.
-
-                            schedule_times = []
-                            current_date = start_date
-                            videos_scheduled_count = 0
-
-                            # Assuming a default time like 10:00 AM for each day
-                            default_time = "10:00" # You could make this configurable later
-
-                            while videos_scheduled_count < total_videos_in_selection:
-                                for i in range(videos_per_day):
-                                    if videos_scheduled_count < total_videos_in_selection:
-                                        schedule_time_str = f"{current_date.strftime('%Y-%m-%d')} {default_time}"
-                                        schedule_times.append(schedule_time_str)
-                                        videos_scheduled_count += 1
-                                    else:
-                                        break # Stop if all videos are scheduled
-                                current_date += timedelta(days=1) # Move to the next day
-
-                            print(f"Generated {len(schedule_times)} schedule times starting from {start_date.strftime('%Y-%m-%d')}.")
-                            # print("Schedule times:", schedule_times) # Optional: print schedule for verification
-
-                            # Attach the generated schedule times to the config for run_workflow to use
-                            # We need a way to pass this schedule to the video processing loop in run_workflow
-                            # One way is to add it to the selected_account_config, perhaps under a new key
-                            # This requires run_workflow to be updated to look for this schedule.
-                            # For now, the schedule is added to selected_account_config and we pass that via temp file.
-                            # Assuming run_workflow is updated to read 'generated_schedule' from the config.
-                            selected_account_config['generated_schedule'] = schedule_times
+                            # 每个 (账号, 平台) 每天最多发 videos_per_day 个，具体时刻由 publish_plan 分配
+                            plan_config = dict(config.get('publish_plan') or {})
+                            plan_config['start'] = start_date.strftime('%Y-%m-%d')
+                            plan_config['daily_cap'] = videos_per_day
+                            selected_account_config['publish_plan'] = plan_config
+                            print(f"Videos will be scheduled from {start_date.strftime('%Y-%m-%d')}, "
+                                  f"at most {videos_per_day} per account and platform per day.")
 
                             break # Exit scheduling loop
 
@@ -424,6 +509,7 @@ async def run_workflow_interactively():
 
 
 if __name__ == "__main__":
+    import nest_asyncio
     nest_asyncio.apply()
     asyncio.run(main())
     
\ No newline at end of file
@@ -3,3 +3,13 @@ from pathlib import Path
 BASE_DIR = Path(__file__).parent.resolve()
 XHS_SERVER = "http://127.0.0.1:11901"
 LOCAL_CHROME_PATH = "C:/Program Files/Google/Chrome/Application/chrome.exe"
+# 日志文件按行输出 JSON(包含 job/account/platform 字段)，也可用环境变量 SAU_LOG_JSON=1 打开
+LOG_JSON_LINES = False
+# 上传失败时额外保存 Playwright trace(logs/diagnostics/)，也可用环境变量 SAU_DIAG_TRACE=1 打开
+DIAGNOSTICS_TRACE = False
+# 同一进程内所有 B 站上传共用的分块上传线程数，各文件公平分配；也可用环境变量 SAU_BILI_CHUNK_THREADS 设置
+BILIBILI_CHUNK_THREADS = 8
+# 上传时为每个账号使用持久化的浏览器 profile(browser_profiles/)，保留磁盘缓存；也可用环境变量 SAU_PERSISTENT_PROFILE=1 打开
+BROWSER_PERSISTENT_PROFILES = False
+# 浏览器上传时各账号共享静态 JS/CSS/字体缓存(asset_cache/)；也可用环境变量 SAU_ASSET_CACHE=1 打开
+ASSET_CACHE_ENABLED = False
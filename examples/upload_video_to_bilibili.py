@@ -1,10 +1,11 @@
-import time
 from pathlib import Path
 
-from uploader.bilibili_uploader.main import read_cookie_json_file, extract_keys_from_json, random_emoji, BilibiliUploader
+from uploader.bilibili_uploader.main import read_cookie_json_file, extract_keys_from_json, random_emoji, BilibiliUploader, \
+    BilibiliSession
 from conf import BASE_DIR
 from utils.constant import VideoZoneTypes
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
+from utils.rate_limit import TokenBucket
 
 if __name__ == '__main__':
     filepath = Path(BASE_DIR) / "videos"
@@ -23,6 +24,11 @@ if __name__ == '__main__':
     files = list(folder_path.glob("*.mp4"))
     file_num = len(files)
     timestamps = generate_schedule_time_next_day(file_num, 1, daily_times=[16], timestamps=True)
+    # life is beautiful don't so rush. be kind be patience
+    # 平均每 30 秒最多上传一个，只有真的连续上传时才会等待
+    rate_limiter = TokenBucket(interval=30, burst=1)
+    # 所有视频共用一个登录会话和连接池
+    session = BilibiliSession(cookie_data=cookie_data)
 
     for index, file in enumerate(files):
         title, tags = get_title_and_hashtags(str(file))
@@ -35,8 +41,7 @@ if __name__ == '__main__':
         print(f"Hashtag：{tags}")
         # I set desc same as title, do what u like.
         desc = title
-        bili_uploader = BilibiliUploader(cookie_data, file, title, desc, tid, tags, timestamps[index])
-        bili_uploader.upload()
-
-        # life is beautiful don't so rush. be kind be patience
-        time.sleep(30)
+        rate_limiter.acquire_sync()
+        bili_uploader = BilibiliUploader(cookie_data, file, title, desc, tid, tags, timestamps[index], session=session)
+        bili_uploader.upload_sync()
+    session.close()
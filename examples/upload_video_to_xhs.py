@@ -1,12 +1,12 @@
 import configparser
 from pathlib import Path
-from time import sleep
 
 from xhs import XhsClient
 
 from conf import BASE_DIR
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
 from uploader.xhs_uploader.main import sign_local, beauty_print
+from utils.rate_limit import TokenBucket
 
 config = configparser.RawConfigParser()
 config.read(Path(BASE_DIR / "uploader" / "xhs_uploader" / "accounts.ini"))
@@ -31,6 +31,8 @@ if __name__ == '__main__':
         exit()
 
     publish_datetimes = generate_schedule_time_next_day(file_num, 1, daily_times=[16])
+    # 平均每 30 秒最多发布一个，避免风控（必要）
+    rate_limiter = TokenBucket(interval=30, burst=1)
 
     for index, file in enumerate(files):
         title, tags = get_title_and_hashtags(str(file))
@@ -57,6 +59,7 @@ if __name__ == '__main__':
 
         hash_tags_str = ' ' + ' '.join(['#' + tag + '[话题]#' for tag in hash_tags])
 
+        rate_limiter.acquire_sync()
         note = xhs_client.create_video_note(title=title[:20], video_path=str(file),
                                             desc=title + tags_str + hash_tags_str,
                                             topics=topics,
@@ -64,5 +67,3 @@ if __name__ == '__main__':
                                             post_time=publish_datetimes[index].strftime("%Y-%m-%d %H:%M:%S"))
 
         beauty_print(note)
-        # 强制休眠30s，避免风控（必要）
-        sleep(30)
@@ -7,9 +7,12 @@ import os
 import asyncio
 
 from conf import LOCAL_CHROME_PATH
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, BaseUploader, PlatformCapabilities, SOCIAL_MEDIA_BAIJIAHAO
+from utils.batch_login import login_interactively
+from utils.browser_profile import open_context, close_context
 from utils.log import baijiahao_logger
 from utils.network import async_retry
+from utils.storage_state import save_storage_state
 
 
 async def baijiahao_cookie_gen(account_file):
@@ -25,12 +28,11 @@ async def baijiahao_cookie_gen(account_file):
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
         context = await set_init_script(context)
-        # Pause the page, and start recording manually.
         page = await context.new_page()
         await page.goto("https://baijiahao.baidu.com/builder/theme/bjh/login")
-        await page.pause()
-        # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+        # 扫码登录后检测到登录 cookie 自动保存；检测不到时退回到在 Inspector 里人工点继续
+        await login_interactively(page, SOCIAL_MEDIA_BAIJIAHAO)
+        await save_storage_state(context, account_file)
         baijiahao_logger.success("cookie saved")
 
 
@@ -118,9 +120,10 @@ class BaiJiaHaoVideo(object):
 
     async def upload(self, playwright: Playwright) -> None:
         # 使用 Chromium 浏览器启动一个浏览器实例
-        browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path, proxy=self.proxy_setting)
         # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}", user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.4324.150 Safari/537.36')
+        browser, context = await open_context(playwright.chromium, self.account_file, headless=False,
+                                              executable_path=self.local_executable_path, proxy=self.proxy_setting,
+                                              user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.4324.150 Safari/537.36')
         # context = await set_init_script(context)
         await context.grant_permissions(['geolocation'])
 
@@ -175,12 +178,10 @@ class BaiJiaHaoVideo(object):
         await page.wait_for_url("https://baijiahao.baidu.com/builder/rc/clue**", timeout=5000)
         baijiahao_logger.success("视频发布成功")
 
-        await context.storage_state(path=self.account_file)  # 保存cookie
+        await save_storage_state(context, self.account_file)  # 保存cookie
         baijiahao_logger.info('cookie更新完毕！')
-        await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
         # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+        await close_context(browser, context)
 
 
     @async_retry(timeout=300)  # 例如，最多重试3次，超时时间为180秒
@@ -246,3 +247,16 @@ class BaiJiaHaoVideo(object):
         async with async_playwright() as playwright:
             await self.upload(playwright)
 
+
+class BaiJiaHaoUploader(BaseUploader):
+    platform = SOCIAL_MEDIA_BAIJIAHAO
+    capabilities = PlatformCapabilities(max_concurrent_sessions=1, min_spacing=120, needs_browser=True, memory_cost=600)
+
+    async def setup(self, handle=False):
+        return await baijiahao_setup(self.account_file, handle=handle)
+
+    async def upload(self, job):
+        app = BaiJiaHaoVideo(job.title, job.video_file, job.tags, job.publish_date, self.account_file)
+        await app.main()
+        return True
+
@@ -0,0 +1,130 @@
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from conf import BASE_DIR
+from utils.log import bilibili_logger
+
+# 与 biliup 的 upos 线路一致
+UPOS_LINES = {
+    "bda2": {"os": "upos", "query": "upcdn=bda2&probe_version=20221109",
+             "probe_url": "//upos-sz-upcdnbda2.bilivideo.com/OK"},
+    "ws": {"os": "upos", "query": "upcdn=ws&probe_version=20221109",
+           "probe_url": "//upos-sz-upcdnws.bilivideo.com/OK"},
+    "qn": {"os": "upos", "query": "upcdn=qn&probe_version=20221109",
+           "probe_url": "//upos-sz-upcdnqn.bilivideo.com/OK"},
+}
+LINE_RANK_FILE = Path(BASE_DIR) / "upload_state" / "bilibili" / "line_rank.json"
+LINE_RANK_TTL = 6 * 3600  # 同一出口网络下探测结果缓存 6 小时
+PROBE_PAYLOAD_SIZE = 512 * 1024  # 测速上传的数据量
+PROBE_RTT_SAMPLES = 3
+MIN_THREADS = 2
+MAX_THREADS = 8
+RTT_PER_THREAD = 0.05  # 单连接吞吐约等于 窗口/RTT，RTT 每多 50ms 多开一个连接来填满带宽
+
+_cache_lock = threading.Lock()
+
+
+def egress_key(session: requests.Session) -> str:
+    """当前出口网络的标识(公网 IP + 运营商)，网络切换后会重新探测。"""
+    try:
+        data = session.get("https://api.bilibili.com/x/web-interface/zone", timeout=5).json().get('data') or {}
+        return f"{data.get('addr', '')}|{data.get('isp', '')}"
+    except (requests.RequestException, ValueError):
+        return "unknown"
+
+
+def measure_line(session: requests.Session, line: dict, use_get: bool) -> dict:
+    """RTT 取几次小请求的最小值；接口允许 POST 时再上传一小段数据测吞吐(MB/s)。"""
+    url = f"https:{line['probe_url']}"
+    rtt = None
+    for _ in range(PROBE_RTT_SAMPLES):
+        start = time.perf_counter()
+        session.get(url, timeout=10)
+        cost = time.perf_counter() - start
+        rtt = cost if rtt is None else min(rtt, cost)
+    throughput = None
+    if not use_get:
+        start = time.perf_counter()
+        session.post(url, data=bytes(PROBE_PAYLOAD_SIZE), timeout=30)
+        throughput = PROBE_PAYLOAD_SIZE / 1000 / 1000 / max(time.perf_counter() - start, 0.001)
+    return dict(line, rtt=rtt, throughput=throughput)
+
+
+def probe_lines(session: requests.Session) -> list:
+    """探测所有 upos 线路，按吞吐(没有时按 RTT)从好到差排序。"""
+    ret = session.get('https://member.bilibili.com/preupload?r=probe', timeout=5).json()
+    use_get = bool(ret['probe'].get('get'))
+    results = []
+    for line in ret['lines']:
+        if line.get('os') != 'upos':
+            continue
+        try:
+            results.append(measure_line(session, line, use_get))
+        except requests.RequestException as e:
+            bilibili_logger.warning(f"[-] 线路 {line['query']} 探测失败: {e}")
+    results.sort(key=lambda x: (-(x['throughput'] or 0), x['rtt']))
+    return results
+
+
+def threads_for(line: dict) -> int:
+    return max(MIN_THREADS, min(MAX_THREADS, math.ceil((line.get('rtt') or 0) / RTT_PER_THREAD) + 1))
+
+
+def _load_cache() -> dict:
+    try:
+        with open(LINE_RANK_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache: dict):
+    LINE_RANK_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = LINE_RANK_FILE.with_suffix('.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, LINE_RANK_FILE)
+
+
+def ranked_lines(session: requests.Session, refresh=False) -> list:
+    """返回当前出口网络下的线路排名，缓存未过期时不重新探测。"""
+    key = egress_key(session)
+    with _cache_lock:
+        cache = _load_cache()
+        entry = cache.get(key)
+        if not refresh and entry and time.time() - entry['time'] < LINE_RANK_TTL and entry['lines']:
+            return entry['lines']
+        lines = probe_lines(session)
+        if lines:
+            cache = {k: v for k, v in cache.items() if time.time() - v['time'] < LINE_RANK_TTL}
+            cache[key] = {"time": time.time(), "lines": lines}
+            _save_cache(cache)
+            best = lines[0]
+            bilibili_logger.info(f"[+] 线路探测({key}): {best['query']} rtt={best['rtt'] * 1000:.0f}ms "
+                                 f"throughput={best['throughput'] or 0:.2f}MB/s")
+        return lines
+
+
+def select_line(session: requests.Session, line='AUTO', threads=None):
+    """
+    返回 (线路, 线程数)。line 为 UPOS_LINES 里的名字时直接使用；AUTO 时用缓存的探测排名里最好的一条。
+    threads 为 None 时按该线路的 RTT 自动选择。
+    """
+    if line in UPOS_LINES:
+        return UPOS_LINES[line], threads or MIN_THREADS + 1
+    try:
+        lines = ranked_lines(session)
+    except (requests.RequestException, ValueError, KeyError) as e:
+        # 探测接口不可用或返回格式变了，不影响上传，退回默认线路
+        bilibili_logger.warning(f"[-] 线路探测失败，使用默认线路 bda2: {e}")
+        lines = []
+    if not lines:
+        return UPOS_LINES["bda2"], threads or MIN_THREADS + 1
+    best = lines[0]
+    return {k: best[k] for k in ('os', 'query', 'probe_url')}, threads or threads_for(best)
@@ -1,10 +1,16 @@
+import asyncio
+import atexit
 import json
 import pathlib
 import random
 from biliup.plugins.bili_webup import BiliBili, Data
 from datetime import datetime
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+from uploader.bilibili_uploader.upos import UposUploader, new_http_session
+from utils.base_social_media import BaseUploader, PlatformCapabilities, SOCIAL_MEDIA_BILIBILI
 from utils.log import bilibili_logger
 
 
@@ -41,9 +47,92 @@ def random_emoji():
     return random.choice(emoji_list)
 
 
+class BilibiliSession(object):
+    """
+    一个账号的 B 站会话：biliup 的 BiliBili(用于投稿)和上传分块用的 requests 会话在整个 workflow 期间复用，
+    同一账号的所有视频共用一次 login_by_cookies 和同一个连接池。
+    传 account_file 时，cookie 文件被重新登录更新(mtime 变化)或接口返回未登录时才重新读取 cookie 并登录。
+    """
+
+    def __init__(self, account_file=None, cookie_data=None):
+        self.account_file = account_file
+        self.cookie_data = cookie_data
+        self.bili = None
+        self.http = None
+        self._cookie_mtime = None
+        self._lock = threading.Lock()
+
+    def _ensure_login(self):
+        if self.account_file:
+            mtime = os.path.getmtime(self.account_file)
+            if mtime != self._cookie_mtime:
+                self.cookie_data = extract_keys_from_json(read_cookie_json_file(self.account_file))
+                self._cookie_mtime = mtime
+                self.close()
+        if self.bili is None:
+            self.bili = BiliBili(Data())
+            self.bili.login_by_cookies(self.cookie_data)
+            self.bili.access_token = self.cookie_data.get('access_token')
+            self.http = new_http_session(self.cookie_data)
+
+    def upload_file(self, file, lines='AUTO', threads=None):
+        with self._lock:
+            self._ensure_login()
+            http = self.http
+        return UposUploader(http, lines, threads).upload(file)
+
+    def submit(self, data: Data):
+        with self._lock:
+            self._ensure_login()
+            self.bili.video = data
+            try:
+                return self.bili.submit()
+            except Exception as e:
+                if '-101' not in str(e):
+                    raise
+                # 账号未登录：cookie 可能已在别处刷新，重新读取后再试一次
+                bilibili_logger.info('[+] 登录状态失效，重新读取 cookie 后重试投稿')
+                self._cookie_mtime = None
+                self.close()
+                self._ensure_login()
+                self.bili.video = data
+                return self.bili.submit()
+
+    def close(self):
+        if self.bili is not None:
+            self.bili.close()
+            self.bili = None
+        if self.http is not None:
+            self.http.close()
+            self.http = None
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_bilibili_session(account_file) -> BilibiliSession:
+    """按 cookie 文件取该账号共享的 BilibiliSession，进程退出时统一关闭。"""
+    key = os.path.abspath(str(account_file))
+    with _sessions_lock:
+        if key not in _sessions:
+            if not _sessions:
+                atexit.register(close_bilibili_sessions)
+            _sessions[key] = BilibiliSession(account_file=key)
+        return _sessions[key]
+
+
+def close_bilibili_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
 class BilibiliUploader(object):
-    def __init__(self, cookie_data, file: pathlib.Path, title, desc, tid, tags, dtime):
-        self.upload_thread_num = 3
+    def __init__(self, cookie_data, file: pathlib.Path, title, desc, tid, tags, dtime, session: BilibiliSession = None,
+                 parts=None):
+        self.upload_thread_num = None  # None 表示按线路探测结果自动选择
         self.copyright = 1
         self.lines = 'AUTO'
         self.cookie_data = cookie_data
@@ -53,6 +142,9 @@ class BilibiliUploader(object):
         self.tid = tid
         self.tags = tags
         self.dtime = dtime
+        self.session = session  # 为 None 时本次上传单独登录
+        # 多P投稿：[(文件, 分P标题), ...]，为 None 时只有 file 一个分P
+        self.parts = parts or [(file, title)]
         self._init_data()
 
     def _init_data(self):
@@ -69,17 +161,75 @@ class BilibiliUploader(object):
             self.data.dtime = self.dtime # Keep it as is (likely 0 for immediate publish)
 
     async def upload(self):
-        with BiliBili(self.data) as bili:
-            bili.login_by_cookies(self.cookie_data)
-            bili.access_token = self.cookie_data.get('access_token')
-            video_part = bili.upload_file(str(self.file), lines=self.lines,
-                                          tasks=self.upload_thread_num)  # 上传视频，默认线路AUTO自动选择，线程数量3。
-            video_part['title'] = self.title
-            self.data.append(video_part)
-            ret = bili.submit()  # 提交视频
-            if ret.get('code') == 0:
-                bilibili_logger.success(f'[+] {os.path.basename(str(self.file))}上传 成功')
-                return True
-            else:
-                bilibili_logger.error(f'[-] {os.path.basename(str(self.file))}上传 失败, error messge: {ret.get("message")}')
-                return False
+        return self.upload_sync()
+
+    def _upload_parts(self, session):
+        """分P并发上传，分块线程由进程共用的 ChunkScheduler 在各分P间公平分配；按原顺序返回 video_part。"""
+        if len(self.parts) == 1:
+            video_part = session.upload_file(self.parts[0][0], self.lines, self.upload_thread_num)
+            video_part['title'] = self.parts[0][1]
+            return [video_part]
+
+        def upload_part(part):
+            file, title = part
+            video_part = session.upload_file(file, self.lines, self.upload_thread_num)
+            video_part['title'] = title
+            return video_part
+
+        bilibili_logger.info(f'[+] 多P投稿：{len(self.parts)} 个分P同时上传')
+        # 这里的线程只负责预上传和等待分块完成，实际上传并发受 BILIBILI_CHUNK_THREADS 限制
+        with ThreadPoolExecutor(max_workers=len(self.parts)) as executor:
+            return list(executor.map(upload_part, self.parts))
+
+    def upload_sync(self):
+        """阻塞式上传，在 workflow 中由 BilibiliUploaderAdapter 放到线程里执行。"""
+        session = self.session or BilibiliSession(cookie_data=self.cookie_data)
+        try:
+            # 可断点续传的分块上传，默认线路AUTO按缓存的探测排名选择，线程数按线路 RTT 选择；
+            # 进程中断后重新上传同一文件会从已确认的分块继续
+            for video_part in self._upload_parts(session):
+                self.data.append(video_part)
+            ret = session.submit(self.data)  # 所有分P上传完后一次提交
+        finally:
+            if session is not self.session:
+                session.close()
+        if ret.get('code') == 0:
+            bilibili_logger.success(f'[+] {os.path.basename(str(self.file))}上传 成功')
+            return True
+        else:
+            bilibili_logger.error(f'[-] {os.path.basename(str(self.file))}上传 失败, error messge: {ret.get("message")}')
+            return False
+
+
+class BilibiliUploaderAdapter(BaseUploader):
+    """
+    biliup 走 HTTP 接口上传，不需要浏览器；cookie 文件是 biliup 登录生成的 json，而不是 playwright 的 storage_state。
+    """
+    platform = SOCIAL_MEDIA_BILIBILI
+    capabilities = PlatformCapabilities(max_concurrent_sessions=2, min_spacing=30, needs_browser=False, memory_cost=150)
+
+    async def setup(self, handle=False):
+        if os.path.exists(self.account_file):
+            try:
+                cookie_data = extract_keys_from_json(read_cookie_json_file(self.account_file))
+                if cookie_data.get('SESSDATA'):
+                    return True
+            except (KeyError, ValueError) as e:
+                bilibili_logger.error(f'[-] cookie 文件格式错误: {e}')
+        if handle:
+            bilibili_logger.info('[+] cookie文件不存在或已失效，请在终端中运行以下命令扫码登录：')
+            bilibili_logger.info(f'uploader/bilibili_uploader/biliup.exe -u "{self.account_file}" login')
+        return False
+
+    async def upload(self, job):
+        return await asyncio.to_thread(self._upload_blocking, job)
+
+    def _upload_blocking(self, job):
+        # 分块上传和投稿都是同步 HTTP 请求，整个过程在工作线程里执行
+        session = get_bilibili_session(self.account_file)
+        tid = job.options.get('bilibili_tid', 255)
+        # cookie 由共享的 session 读取和刷新
+        parts = [(pathlib.Path(part['video_file']), part['title']) for part in job.parts] if job.parts else None
+        uploader = BilibiliUploader(None, pathlib.Path(job.video_file), job.title, job.title, tid,
+                                    job.tags, job.publish_date, session=session, parts=parts)
+        return uploader.upload_sync()
@@ -0,0 +1,335 @@
+import functools
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from conf import BASE_DIR, BILIBILI_CHUNK_THREADS
+from uploader.bilibili_uploader.line_probe import select_line
+from utils.log import bilibili_logger
+
+# 断点续传状态：每个视频一个 json，记录 upload_id、线路和已确认的分块
+UPLOAD_STATE_DIR = Path(BASE_DIR) / "upload_state" / "bilibili"
+UPLOAD_STATE_TTL = 20 * 3600  # upos 的 upload_id 大约一天后失效，过期的状态直接丢弃重新上传
+CHUNK_RETRIES = 5
+COMPLETE_RETRIES = 5
+READ_BLOCK_SIZE = 1024 * 1024
+
+HEADERS = {
+    'user-agent': "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/63.0.3239.108",
+    'referer': "https://www.bilibili.com/",
+    'connection': 'keep-alive',
+}
+
+
+def chunk_thread_budget() -> int:
+    return max(1, int(os.environ.get("SAU_BILI_CHUNK_THREADS") or BILIBILI_CHUNK_THREADS))
+
+
+def new_http_session(cookie_data: dict, pool_size=None) -> requests.Session:
+    """带登录 cookie 的 requests 会话，连接池大小要不小于上传线程数。"""
+    pool_size = pool_size or chunk_thread_budget()
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                          max_retries=Retry(total=5)))
+    session.headers.update(HEADERS)
+    requests.utils.add_dict_to_cookiejar(session.cookies, {k: v for k, v in cookie_data.items() if k != 'access_token'})
+    return session
+
+
+class FileSlice(object):
+    """
+    文件中 [offset, offset + length) 的一段，作为 requests 的 data 逐块读出发送，
+    不会把整个分块(常见为 10MB 以上)读进内存；每个分片用自己的文件句柄，多线程上传互不影响。
+    """
+
+    def __init__(self, path, offset, length, block_size=READ_BLOCK_SIZE):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.block_size = block_size
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                block = f.read(min(self.block_size, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                yield block
+
+
+class ChunkBatch(object):
+    """一个文件待上传的分块，由 ChunkScheduler 的工作线程执行；max_parallel 限制该文件同时在传的分块数。"""
+
+    def __init__(self, tasks, max_parallel=None):
+        self.pending = deque(tasks)
+        self.max_parallel = max_parallel or len(self.pending)
+        self.running = 0
+        self.error = None
+
+    @property
+    def finished(self):
+        return self.running == 0 and not self.pending
+
+    def runnable(self):
+        return bool(self.pending) and self.running < self.max_parallel
+
+
+class ChunkScheduler(object):
+    """
+    进程内所有 B 站上传共用的分块线程池：总并发固定为 workers，不随同时上传的文件数增长，
+    避免多个任务各开一组线程抢上行带宽触发限速。各文件的分块按轮转方式取出，
+    每个在传的文件大致平分线程，后加入的文件不会排在大文件的全部分块之后。
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._cond = threading.Condition()
+        self._batches = deque()
+        self._threads = []
+
+    def _ensure_threads(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"bili-chunk-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_task(self):
+        """轮转取下一个可运行文件的一个分块，取完后把该文件移到队尾。"""
+        for _ in range(len(self._batches)):
+            batch = self._batches[0]
+            self._batches.rotate(-1)
+            if batch.runnable():
+                batch.running += 1
+                return batch, batch.pending.popleft()
+        return None, None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                batch, task = self._next_task()
+                while task is None:
+                    self._cond.wait()
+                    batch, task = self._next_task()
+            try:
+                task()
+            except Exception as e:
+                with self._cond:
+                    if batch.error is None:
+                        batch.error = e
+                    # 有分块彻底失败就不再继续，状态文件保留，下次从已确认的分块继续
+                    batch.pending.clear()
+            finally:
+                with self._cond:
+                    batch.running -= 1
+                    self._cond.notify_all()
+
+    def run(self, tasks, max_parallel=None):
+        """提交一个文件的全部分块并阻塞到完成，任一分块失败时抛出它的异常。"""
+        batch = ChunkBatch(tasks, max_parallel)
+        with self._cond:
+            self._ensure_threads()
+            self._batches.append(batch)
+            self._cond.notify_all()
+            while not batch.finished:
+                self._cond.wait()
+            self._batches.remove(batch)
+        if batch.error is not None:
+            raise batch.error
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_chunk_scheduler() -> ChunkScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ChunkScheduler(chunk_thread_budget())
+        return _scheduler
+
+
+class UploadState(object):
+    """单个文件的断点续传状态，已确认的分块写盘后才算完成。"""
+
+    def __init__(self, filepath):
+        self.filepath = str(Path(filepath).resolve())
+        stat = os.stat(self.filepath)
+        self.size = stat.st_size
+        self.mtime = int(stat.st_mtime)
+        key = hashlib.sha1(f"{self.filepath}|{self.size}|{self.mtime}".encode('utf-8')).hexdigest()
+        self.path = UPLOAD_STATE_DIR / f"{key}.json"
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> bool:
+        """读取未过期的状态，返回是否可以续传。"""
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if time.time() - data.get('created', 0) > UPLOAD_STATE_TTL:
+            self.clear()
+            return False
+        self.data = data
+        return True
+
+    def start(self, line, threads, preupload, upload_id):
+        self.data = {
+            "file": self.filepath,
+            "size": self.size,
+            "created": time.time(),
+            "line": line,
+            "threads": threads,
+            "preupload": preupload,
+            "upload_id": upload_id,
+            "parts": [],
+        }
+        self.save()
+
+    def mark_done(self, part_number):
+        with self._lock:
+            self.data["parts"].append(part_number)
+            self.save()
+
+    def save(self):
+        UPLOAD_STATE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+
+class UposUploader(object):
+    """
+    可断点续传的 upos 分块上传，替代 biliup 的 upload_file：
+    分块确认一个记录一个，进程重启后对同一文件跳过已确认的分块，复用原来的 upload_id 和线路。
+    返回的 video_part 与 biliup 相同，可直接 Data.append。
+    """
+
+    def __init__(self, session: requests.Session, line='AUTO', threads=None):
+        self.session = session
+        self.line = line
+        self.threads = threads  # None 时按探测到的线路 RTT 自动选择
+
+    def _preupload(self, line, filepath, size):
+        query = {
+            'r': 'upos',
+            'profile': 'ugcupos/bup',
+            'ssl': 0,
+            'version': '2.8.12',
+            'build': 2081200,
+            'name': os.path.basename(filepath),
+            'size': size,
+        }
+        ret = self.session.get(f"https://member.bilibili.com/preupload?{line['query']}", params=query,
+                               timeout=5).json()
+        if 'upos_uri' not in ret:
+            raise RuntimeError(f"preupload failed: {ret}")
+        return {key: ret[key] for key in ('chunk_size', 'auth', 'endpoint', 'biz_id', 'upos_uri')}
+
+    @staticmethod
+    def _url(preupload):
+        return f"https:{preupload['endpoint']}/{preupload['upos_uri'].replace('upos://', '')}"
+
+    def _put_chunk(self, filepath, state, index, chunks):
+        preupload = state.data['preupload']
+        chunk_size = preupload['chunk_size']
+        start = index * chunk_size
+        size = min(chunk_size, state.size - start)
+        params = {
+            'uploadId': state.data['upload_id'],
+            'chunks': chunks,
+            'total': state.size,
+            'chunk': index,
+            'size': size,
+            'partNumber': index + 1,
+            'start': start,
+            'end': start + size,
+        }
+        for attempt in range(1, CHUNK_RETRIES + 1):
+            try:
+                response = self.session.put(self._url(preupload), params=params,
+                                            data=FileSlice(filepath, start, size),
+                                            headers={"X-Upos-Auth": preupload['auth']},
+                                            timeout=120)
+                response.raise_for_status()
+                state.mark_done(index + 1)
+                return
+            except requests.RequestException as e:
+                bilibili_logger.warning(f"[-] 分块 {index + 1}/{chunks} 上传失败，第 {attempt} 次重试: {e}")
+                time.sleep(min(2 ** attempt, 30))
+        raise IOError(f"chunk {index + 1} of {filepath} failed after {CHUNK_RETRIES} retries")
+
+    def upload(self, filepath) -> dict:
+        filepath = str(filepath)
+        filename = os.path.basename(filepath)
+        state = UploadState(filepath)
+        if state.load():
+            bilibili_logger.info(f"[+] {filename} 断点续传，已完成 {len(state.data['parts'])} 个分块")
+            threads = self.threads or state.data.get('threads') or 3
+        else:
+            line, threads = select_line(self.session, self.line, self.threads)
+            preupload = self._preupload(line, filepath, state.size)
+            upload_id = self.session.post(f"{self._url(preupload)}?uploads&output=json", timeout=15,
+                                          headers={"X-Upos-Auth": preupload['auth']}).json()["upload_id"]
+            state.start(line, threads, preupload, upload_id)
+
+        preupload = state.data['preupload']
+        chunks = math.ceil(state.size / preupload['chunk_size'])
+        done = set(state.data['parts'])
+        pending = [index for index in range(chunks) if index + 1 not in done]
+        start = time.perf_counter()
+        # 分块交给进程共用的调度器，threads 只是本文件的并发上限，总并发由 BILIBILI_CHUNK_THREADS 决定
+        get_chunk_scheduler().run(
+            [functools.partial(self._put_chunk, filepath, state, index, chunks) for index in pending],
+            max_parallel=max(1, threads))
+        cost = time.perf_counter() - start
+
+        params = {
+            'name': filename,
+            'uploadId': state.data['upload_id'],
+            'biz_id': preupload['biz_id'],
+            'output': 'json',
+            'profile': 'ugcupos/bup',
+        }
+        parts = [{"partNumber": n, "eTag": "etag"} for n in range(1, chunks + 1)]
+        for attempt in range(1, COMPLETE_RETRIES + 1):
+            try:
+                ret = self.session.post(self._url(preupload), params=params, json={"parts": parts},
+                                        headers={"X-Upos-Auth": preupload['auth']}, timeout=15).json()
+                if ret.get('OK') == 1:
+                    break
+                raise IOError(ret)
+            except (IOError, requests.RequestException, ValueError) as e:
+                bilibili_logger.warning(f"[-] 合并分块失败，第 {attempt} 次重试: {e}")
+                time.sleep(15)
+        else:
+            raise IOError(f"complete upload of {filepath} failed")
+
+        state.clear()
+        uploaded = sum(min(preupload['chunk_size'], state.size - (i * preupload['chunk_size'])) for i in pending)
+        bilibili_logger.info(f"[+] {filename} 上传完成 >> {uploaded / 1000 / 1000 / max(cost, 0.001):.2f}MB/s")
+        return {"title": os.path.splitext(filename)[0],
+                "filename": os.path.splitext(os.path.basename(preupload['upos_uri']))[0], "desc": ""}
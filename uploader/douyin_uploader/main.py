@@ -6,8 +6,12 @@ import os
 import asyncio
 
 from conf import LOCAL_CHROME_PATH
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, BaseUploader, PlatformCapabilities, SOCIAL_MEDIA_DOUYIN
+from utils.batch_login import login_interactively
+from utils.browser_profile import open_context, close_context
+from utils.diagnostics import UploadDiagnostics
 from utils.log import douyin_logger
+from utils.storage_state import save_storage_state
 
 
 async def cookie_auth(account_file):
@@ -55,12 +59,11 @@ async def douyin_cookie_gen(account_file):
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
         context = await set_init_script(context)
-        # Pause the page, and start recording manually.
         page = await context.new_page()
         await page.goto("https://creator.douyin.com/")
-        await page.pause()
-        # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+        # 扫码登录后检测到登录 cookie 自动保存；检测不到时退回到在 Inspector 里人工点继续
+        await login_interactively(page, SOCIAL_MEDIA_DOUYIN)
+        await save_storage_state(context, account_file)
 
 
 class DouYinVideo(object):
@@ -73,6 +76,7 @@ class DouYinVideo(object):
         self.date_format = '%Y年%m月%d日 %H:%M'
         self.local_executable_path = LOCAL_CHROME_PATH
         self.thumbnail_path = thumbnail_path
+        self.diagnostics = UploadDiagnostics(SOCIAL_MEDIA_DOUYIN, file_path, douyin_logger)
 
     async def set_schedule_time_douyin(self, page, publish_date):
         # 选择包含特定文本内容的 label 元素
@@ -95,14 +99,11 @@ class DouYinVideo(object):
         await page.locator('div.progress-div [class^="upload-btn-input"]').set_input_files(self.file_path)
 
     async def upload(self, playwright: Playwright) -> None:
-        # 使用 Chromium 浏览器启动一个浏览器实例
-        if self.local_executable_path:
-            browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path)
-        else:
-            browser = await playwright.chromium.launch(headless=False)
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}")
+        # 使用 Chromium 浏览器，创建使用指定 cookie 文件的上下文(开启持久化 profile 时直接打开账号的 profile)
+        browser, context = await open_context(playwright.chromium, self.account_file, headless=False,
+                                              executable_path=self.local_executable_path or None)
         context = await set_init_script(context)
+        await self.diagnostics.attach(context)
 
         # 创建一个新的页面
         page = await context.new_page()
@@ -168,6 +169,7 @@ class DouYinVideo(object):
                     break
                 else:
                     douyin_logger.info("  [-] 正在上传视频中...")
+                    await self.diagnostics.snapshot(page, "uploading")
                     await asyncio.sleep(2)
 
                     if await page.locator('div.progress-div > div:has-text("上传失败")').count():
@@ -204,15 +206,13 @@ class DouYinVideo(object):
                 break
             except:
                 douyin_logger.info("  [-] 视频正在发布中...")
-                await page.screenshot(full_page=True)
+                await self.diagnostics.snapshot(page, "publishing")
                 await asyncio.sleep(0.5)
 
-        await context.storage_state(path=self.account_file)  # 保存cookie
+        await save_storage_state(context, self.account_file)  # 保存cookie
         douyin_logger.success('  [-]cookie更新完毕！')
-        await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
         # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+        await close_context(browser, context)
     
     async def set_thumbnail(self, page: Page, thumbnail_path: str):
         if thumbnail_path:
@@ -231,6 +231,24 @@ class DouYinVideo(object):
 
     async def main(self):
         async with async_playwright() as playwright:
-            await self.upload(playwright)
+            try:
+                await self.upload(playwright)
+            except Exception:
+                # 只有失败时才把诊断快照落盘，此时浏览器还没关闭，trace 也能一起保存
+                await self.diagnostics.persist()
+                raise
+
+
+class DouYinUploader(BaseUploader):
+    platform = SOCIAL_MEDIA_DOUYIN
+    capabilities = PlatformCapabilities(max_concurrent_sessions=2, min_spacing=60, needs_browser=True, memory_cost=600)
+
+    async def setup(self, handle=False):
+        return await douyin_setup(self.account_file, handle=handle)
 
+    async def upload(self, job):
+        # 抖音封面上传暂未修复，这里不传 thumbnail_path
+        app = DouYinVideo(job.title, job.video_file, job.tags, job.publish_date, self.account_file)
+        await app.main()
+        return True
 
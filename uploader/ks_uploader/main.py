@@ -6,9 +6,13 @@ import os
 import asyncio
 
 from conf import LOCAL_CHROME_PATH
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, BaseUploader, PlatformCapabilities, SOCIAL_MEDIA_KUAISHOU
+from utils.batch_login import login_interactively
+from utils.browser_profile import open_context, close_context
+from utils.diagnostics import UploadDiagnostics
 from utils.files_times import get_absolute_path
 from utils.log import kuaishou_logger
+from utils.storage_state import save_storage_state
 
 
 async def cookie_auth(account_file):
@@ -53,12 +57,11 @@ async def get_ks_cookie(account_file):
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
         context = await set_init_script(context)
-        # Pause the page, and start recording manually.
         page = await context.new_page()
         await page.goto("https://cp.kuaishou.com")
-        await page.pause()
-        # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+        # 扫码登录后检测到登录 cookie 自动保存；检测不到时退回到在 Inspector 里人工点继续
+        await login_interactively(page, SOCIAL_MEDIA_KUAISHOU)
+        await save_storage_state(context, account_file)
 
 
 class KSVideo(object):
@@ -70,6 +73,7 @@ class KSVideo(object):
         self.account_file = account_file
         self.date_format = '%Y-%m-%d %H:%M'
         self.local_executable_path = LOCAL_CHROME_PATH
+        self.diagnostics = UploadDiagnostics(SOCIAL_MEDIA_KUAISHOU, file_path, kuaishou_logger)
 
     async def handle_upload_error(self, page):
         kuaishou_logger.error("视频出错了，重新上传中")
@@ -78,18 +82,11 @@ class KSVideo(object):
     async def upload(self, playwright: Playwright) -> None:
         # 使用 Chromium 浏览器启动一个浏览器实例
         print(self.local_executable_path)
-        if self.local_executable_path:
-            browser = await playwright.chromium.launch(
-                headless=False,
-                executable_path=self.local_executable_path,
-            )
-        else:
-            browser = await playwright.chromium.launch(
-                headless=False
-            )  # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}")
+        # 创建一个浏览器上下文，使用指定的 cookie 文件
+        browser, context = await open_context(playwright.chromium, self.account_file, headless=False,
+                                              executable_path=self.local_executable_path or None)
         context = await set_init_script(context)
-        context.on("close", lambda: context.storage_state(path=self.account_file))
+        await self.diagnostics.attach(context)
 
         # 创建一个新的页面
         page = await context.new_page()
@@ -150,6 +147,7 @@ class KSVideo(object):
                 else:
                     if retry_count % 5 == 0:
                         kuaishou_logger.info("正在上传视频中...")
+                    await self.diagnostics.snapshot(page, "uploading")
                     await asyncio.sleep(2)
             except Exception as e:
                 kuaishou_logger.error(f"检查上传状态时发生错误: {e}")
@@ -184,19 +182,22 @@ class KSVideo(object):
                 break
             except Exception as e:
                 kuaishou_logger.info(f"视频正在发布中... 错误: {e}")
-                await page.screenshot(full_page=True)
+                await self.diagnostics.snapshot(page, "publishing")
                 await asyncio.sleep(1)
 
-        await context.storage_state(path=self.account_file)  # 保存cookie
+        await save_storage_state(context, self.account_file)  # 保存cookie
         kuaishou_logger.info('cookie更新完毕！')
-        await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
         # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+        await close_context(browser, context)
 
     async def main(self):
         async with async_playwright() as playwright:
-            await self.upload(playwright)
+            try:
+                await self.upload(playwright)
+            except Exception:
+                # 只有失败时才把诊断快照落盘，此时浏览器还没关闭，trace 也能一起保存
+                await self.diagnostics.persist()
+                raise
 
     async def set_schedule_time(self, page, publish_date):
         kuaishou_logger.info("click schedule")
@@ -212,3 +213,17 @@ class KSVideo(object):
         await page.keyboard.type(str(publish_date_hour))
         await page.keyboard.press("Enter")
         await asyncio.sleep(1)
+
+
+class KSUploader(BaseUploader):
+    platform = SOCIAL_MEDIA_KUAISHOU
+    capabilities = PlatformCapabilities(max_concurrent_sessions=2, min_spacing=60, needs_browser=True, memory_cost=600)
+
+    async def setup(self, handle=False):
+        return await ks_setup(self.account_file, handle=handle)
+
+    async def upload(self, job):
+        app = KSVideo(job.title, job.video_file, job.tags, job.publish_date, self.account_file)
+        await app.main()
+        return True
+
@@ -6,9 +6,13 @@ import os
 import asyncio
 
 from conf import LOCAL_CHROME_PATH
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, BaseUploader, PlatformCapabilities, SOCIAL_MEDIA_TENCENT
+from utils.batch_login import login_interactively
+from utils.browser_profile import open_context, close_context
+from utils.constant import TencentZoneTypes
 from utils.files_times import get_absolute_path
 from utils.log import tencent_logger
+from utils.storage_state import save_storage_state
 
 
 def format_str_for_short_title(origin_title: str) -> str:
@@ -61,13 +65,12 @@ async def get_tencent_cookie(account_file):
         browser = await playwright.chromium.launch(**options)
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
-        # Pause the page, and start recording manually.
         context = await set_init_script(context)
         page = await context.new_page()
         await page.goto("https://channels.weixin.qq.com")
-        await page.pause()
-        # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+        # 扫码登录后检测到登录 cookie 自动保存；检测不到时退回到在 Inspector 里人工点继续
+        await login_interactively(page, SOCIAL_MEDIA_TENCENT)
+        await save_storage_state(context, account_file)
 
 
 async def weixin_setup(account_file, handle=False):
@@ -139,13 +142,10 @@ class TencentVideo(object):
         context = None
         page = None # Initialize page variable
         try:
-            tencent_logger.info("[-] Launching browser for Tencent upload...")
-            browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path)
-            tencent_logger.info("[-] Browser launched.")
-            
-            tencent_logger.info(f"[-] Creating new context with storage state from {self.account_file}...")
-            context = await browser.new_context(storage_state=f"{self.account_file}")
-            tencent_logger.info("[-] Context created.")
+            tencent_logger.info(f"[-] Launching browser for Tencent upload with cookies from {self.account_file}...")
+            browser, context = await open_context(playwright.chromium, self.account_file, headless=False,
+                                                  executable_path=self.local_executable_path)
+            tencent_logger.info("[-] Browser launched, context created.")
             
             context = await set_init_script(context)
             tencent_logger.info("[-] Init script set.")
@@ -211,21 +211,16 @@ class TencentVideo(object):
             tencent_logger.info("[-] Publish clicked, waiting for post list page...")
 
             try:
-                await context.storage_state(path=f"{self.account_file}")  # 保存cookie
+                await save_storage_state(context, self.account_file)  # 保存cookie
                 tencent_logger.success('  [-]cookie更新完毕！')
             except Exception as e:
                 tencent_logger.warning(f'  [-] Failed to save cookie: {e}') # Log a warning if saving fails
 
-            await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
         finally:
             # Close browser and context even if errors occur
             if context:
-                tencent_logger.info("[-] Closing context...")
-                await context.close()
-                tencent_logger.info("[-] Context closed.")
-            if browser:
                 tencent_logger.info("[-] Closing browser...")
-                await browser.close()
+                await close_context(browser, context)
                 tencent_logger.info("[-] Browser closed.")
 
     async def add_short_title(self, page):
@@ -319,3 +314,19 @@ class TencentVideo(object):
     async def main(self):
         async with async_playwright() as playwright:
             await self.upload(playwright)
+
+
+class TencentUploader(BaseUploader):
+    platform = SOCIAL_MEDIA_TENCENT
+    # 视频号需要用本机 Chrome(Chromium 会有 h264 问题)，内存占用偏高
+    capabilities = PlatformCapabilities(max_concurrent_sessions=2, min_spacing=60, needs_browser=True, memory_cost=800)
+
+    async def setup(self, handle=False):
+        return await weixin_setup(self.account_file, handle=handle)
+
+    async def upload(self, job):
+        category = job.options.get('tencent_category', TencentZoneTypes.LIFESTYLE.value)
+        app = TencentVideo(job.title, job.video_file, job.tags, job.publish_date, self.account_file, category)
+        await app.main()
+        return True
+
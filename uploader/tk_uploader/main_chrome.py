@@ -8,9 +8,13 @@ import asyncio
 
 from conf import LOCAL_CHROME_PATH
 from uploader.tk_uploader.tk_config import Tk_Locator
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, BaseUploader, PlatformCapabilities, SOCIAL_MEDIA_TIKTOK
+from utils.batch_login import login_interactively
+from utils.browser_profile import open_context, close_context
+from utils.diagnostics import UploadDiagnostics
 from utils.files_times import get_absolute_path
 from utils.log import tiktok_logger
+from utils.storage_state import save_storage_state
 
 
 async def cookie_auth(account_file):
@@ -62,12 +66,11 @@ async def get_tiktok_cookie(account_file):
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
         context = await set_init_script(context)
-        # Pause the page, and start recording manually.
         page = await context.new_page()
         await page.goto("https://www.tiktok.com/login?lang=en")
-        await page.pause()
-        # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+        # 扫码登录后检测到登录 cookie 自动保存；检测不到时退回到在 Inspector 里人工点继续
+        await login_interactively(page, SOCIAL_MEDIA_TIKTOK)
+        await save_storage_state(context, account_file)
 
 
 class TiktokVideo(object):
@@ -80,6 +83,7 @@ class TiktokVideo(object):
         self.account_file = account_file
         self.local_executable_path = LOCAL_CHROME_PATH
         self.locator_base = None
+        self.diagnostics = UploadDiagnostics(SOCIAL_MEDIA_TIKTOK, file_path, tiktok_logger)
 
     async def set_schedule_time(self, page, publish_date):
         schedule_input_element = self.locator_base.get_by_label('Schedule')
@@ -146,9 +150,10 @@ class TiktokVideo(object):
         await file_chooser.set_files(self.file_path)
 
     async def upload(self, playwright: Playwright) -> None:
-        browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path)
-        context = await browser.new_context(storage_state=f"{self.account_file}")
+        browser, context = await open_context(playwright.chromium, self.account_file, headless=False,
+                                              executable_path=self.local_executable_path)
         context = await set_init_script(context)
+        await self.diagnostics.attach(context)
         page = await context.new_page()
 
         # change language to eng first
@@ -187,12 +192,10 @@ class TiktokVideo(object):
 
         await self.click_publish(page)
 
-        await context.storage_state(path=f"{self.account_file}")  # save cookie
+        await save_storage_state(context, self.account_file)  # save cookie
         tiktok_logger.info('  [-] update cookie！')
-        await asyncio.sleep(2)  # close delay for look the video status
         # close all
-        await context.close()
-        await browser.close()
+        await close_context(browser, context)
 
     async def add_title_tags(self, page):
 
@@ -265,6 +268,7 @@ class TiktokVideo(object):
             except Exception as e:
                 tiktok_logger.exception(f"  [-] Exception: {e}")
                 tiktok_logger.info("  [-] video publishing")
+                await self.diagnostics.snapshot(page, "publishing")
                 await asyncio.sleep(0.5)
 
     async def detect_upload_status(self, page):
@@ -277,6 +281,7 @@ class TiktokVideo(object):
                     break
                 else:
                     tiktok_logger.info("  [-] video uploading...")
+                    await self.diagnostics.snapshot(page, "uploading")
                     await asyncio.sleep(2)
                     if await self.locator_base.locator(
                             'button[aria-label="Select file"]').count():
@@ -295,4 +300,23 @@ class TiktokVideo(object):
 
     async def main(self):
         async with async_playwright() as playwright:
-            await self.upload(playwright)
+            try:
+                await self.upload(playwright)
+            except Exception:
+                # 只有失败时才把诊断快照落盘，此时浏览器还没关闭，trace 也能一起保存
+                await self.diagnostics.persist()
+                raise
+
+
+class TiktokUploader(BaseUploader):
+    platform = SOCIAL_MEDIA_TIKTOK
+    capabilities = PlatformCapabilities(max_concurrent_sessions=1, min_spacing=120, needs_browser=True, memory_cost=800)
+
+    async def setup(self, handle=False):
+        return await tiktok_setup(self.account_file, handle=handle)
+
+    async def upload(self, job):
+        app = TiktokVideo(job.title, job.video_file, job.tags, job.publish_date, self.account_file, job.thumbnail_path)
+        await app.main()
+        return True
+
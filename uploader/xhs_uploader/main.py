@@ -1,12 +1,17 @@
+import asyncio
 import configparser
 import json
+import os
 import pathlib
 from time import sleep
 
 import requests
 from playwright.sync_api import sync_playwright
+from xhs import XhsClient
 
 from conf import BASE_DIR, XHS_SERVER
+from utils.base_social_media import BaseUploader, PlatformCapabilities, SOCIAL_MEDIA_XHS
+from utils.log import xhs_logger
 
 config = configparser.RawConfigParser()
 config.read('accounts.ini')
@@ -56,3 +61,53 @@ def sign(uri, data=None, a1="", web_session=""):
 
 def beauty_print(data: dict):
     print(json.dumps(data, ensure_ascii=False, indent=2))
+
+
+def read_xhs_cookie(account_file) -> str:
+    """
+    从账号文件读取 XhsClient 需要的 cookie 字符串。
+    支持 playwright 的 storage_state json，或 {"cookie": "a1=...; web_session=..."} 形式的 json。
+    """
+    with open(account_file, 'r', encoding='utf-8') as f:
+        content = json.load(f)
+    if isinstance(content.get('cookie'), str):
+        return content['cookie']
+    return '; '.join(f"{c['name']}={c['value']}" for c in content.get('cookies', [])
+                     if 'xiaohongshu.com' in c.get('domain', ''))
+
+
+class XhsUploader(BaseUploader):
+    platform = SOCIAL_MEDIA_XHS
+    # 走 xhs 接口上传，但 sign_local 每次签名都会起一个无头浏览器
+    capabilities = PlatformCapabilities(max_concurrent_sessions=1, min_spacing=30, needs_browser=True, memory_cost=300)
+
+    def _client(self):
+        return XhsClient(read_xhs_cookie(self.account_file), sign=sign_local, timeout=60)
+
+    async def setup(self, handle=False):
+        if os.path.exists(self.account_file):
+            try:
+                # 注意：该校验cookie方式可能并没那么准确
+                await asyncio.to_thread(self._client().get_video_first_frame_image_id, "3214")
+                return True
+            except Exception as e:
+                xhs_logger.error(f"[-] cookie 失效: {e}")
+        if handle:
+            xhs_logger.info("[+] 请运行 uploader/xhs_uploader/xhs_login_qrcode.py 扫码登录，并把输出的 cookie 保存到 "
+                            f"{self.account_file}，格式为 {{\"cookie\": \"...\"}}")
+        return False
+
+    async def upload(self, job):
+        return await asyncio.to_thread(self._upload_blocking, job)
+
+    def _upload_blocking(self, job):
+        xhs_client = self._client()
+        tags_str = ' '.join(['#' + tag for tag in job.tags])
+        post_time = job.publish_date.strftime("%Y-%m-%d %H:%M:%S") if job.publish_date else None
+        note = xhs_client.create_video_note(title=job.title[:20], video_path=job.video_file,
+                                            desc=job.title + tags_str,
+                                            is_private=False,
+                                            post_time=post_time)
+        xhs_logger.success(f"[+] {job.title} 上传成功")
+        return bool(note)
+
@@ -0,0 +1,200 @@
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from conf import BASE_DIR
+
+VIDEOS_DIR = Path(BASE_DIR) / "videos"
+DEFAULT_ARCHIVE_DIR = "archive"
+DEFAULT_LEDGER_FILE = "published.json"
+ARCHIVE_MODES = ("move", "index")
+# 和视频同名、一起归档的附属文件
+SIDECAR_SUFFIXES = (".txt", ".png", ".jpg", ".jpeg")
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+LEDGER_LOCK_TIMEOUT = 60  # 秒，等账本锁的上限；锁文件超过这么久没释放视为持有者已退出
+
+
+def video_key(video_file) -> str:
+    """账本里的键：视频相对 videos 目录的路径，<account>/<type>/.../x.mp4"""
+    video = Path(video_file)
+    try:
+        video = video.relative_to(VIDEOS_DIR)
+    except ValueError:
+        pass
+    return video.as_posix()
+
+
+class PublishArchive(object):
+    """
+    记录每个视频在哪些平台发布成功，账号配置的平台全部成功后把视频归档，workflow 每次只扫描待发布的内容。
+
+    - move(默认): 视频和同名 .txt/.png 移到 archive/<account>/<type>/...，videos/ 里只剩待发布的视频
+    - index: 文件不动，只在账本里标记 archived，扫描时跳过
+
+    账本(published.json)里只有还没归档的视频，以及 index 模式下已归档的视频；
+    move 模式归档过的视频追加到 archive/index.jsonl。
+    配置来自 workflow_config.json 的 "archive"，例如 {"mode": "move", "dir": "archive"}。
+    """
+
+    def __init__(self, config: dict = None):
+        config = config or {}
+        self.mode = config.get('mode', 'move')
+        if self.mode not in ARCHIVE_MODES:
+            raise ValueError(f"Unsupported archive mode: {self.mode}")
+        self.archive_dir = Path(BASE_DIR) / config.get('dir', DEFAULT_ARCHIVE_DIR)
+        self.ledger_file = Path(BASE_DIR) / config.get('ledger_file', DEFAULT_LEDGER_FILE)
+        self._videos = None
+
+    @property
+    def videos(self) -> dict:
+        """{video_key: {"platforms": {平台: 发布时间}, "archived": 归档时间或 None}}"""
+        if self._videos is None:
+            self._videos = {}
+            if self.ledger_file.exists():
+                with open(self.ledger_file, 'r', encoding='utf-8') as f:
+                    self._videos = json.load(f).get('videos', {})
+        return self._videos
+
+    @contextmanager
+    def locked(self):
+        """
+        独占账本(锁文件 published.lock，O_EXCL 创建，放在共享存储上多台机器也适用)，进入时重新读取账本。
+        workflow 和各个队列 worker 都可能在写，记录、归档、保存都要在锁内完成。
+        """
+        lock_file = self.ledger_file.with_suffix('.lock')
+        deadline = time.monotonic() + LEDGER_LOCK_TIMEOUT
+        while True:
+            try:
+                os.close(os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - lock_file.stat().st_mtime > LEDGER_LOCK_TIMEOUT:
+                        lock_file.unlink(missing_ok=True)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"ledger {self.ledger_file} is locked by {lock_file}")
+                time.sleep(0.1)
+        try:
+            self._videos = None
+            yield self
+        finally:
+            lock_file.unlink(missing_ok=True)
+
+    def save(self):
+        tmp_file = self.ledger_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"updated": datetime.now().strftime(TIME_FORMAT), "videos": self.videos},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.ledger_file)
+
+    def published_platforms(self, video_file) -> set:
+        entry = self.videos.get(video_key(video_file))
+        return set(entry['platforms']) if entry else set()
+
+    def is_archived(self, video_file) -> bool:
+        entry = self.videos.get(video_key(video_file))
+        return bool(entry and entry.get('archived'))
+
+    def pending_videos(self, directory: Path) -> list:
+        """目录下(递归)待发布的视频，按路径排序。"""
+        videos = sorted(directory.glob("**/*.mp4"))
+        if self.mode == 'index':
+            videos = [video for video in videos if not self.is_archived(video)]
+        return videos
+
+    def record(self, video_file, platform):
+        entry = self.videos.setdefault(video_key(video_file), {"platforms": {}, "archived": None})
+        entry['platforms'][platform] = datetime.now().strftime(TIME_FORMAT)
+
+    def record_results(self, jobs, results: dict):
+        """把本次成功的任务记入账本(多P投稿的各分P一起记)。"""
+        for job in jobs:
+            if not results.get(job.key):
+                continue
+            for video_file in [job.video_file] + [part['video_file'] for part in job.parts or []]:
+                self.record(video_file, job.platform)
+
+    def archive_completed(self, account_platforms: dict) -> list:
+        """
+        account_platforms: {账号: 配置的平台}。
+        归档所有配置平台都已发布成功的视频，返回归档的 video_key；移动失败的留到下次运行再试。
+        """
+        from utils.log import workflow_logger
+
+        archived = []
+        for key, entry in list(self.videos.items()):
+            if entry.get('archived'):
+                continue
+            account = key.split('/', 1)[0]
+            required = account_platforms.get(account)
+            if not required or not set(required) <= set(entry['platforms']):
+                continue
+            entry['archived'] = datetime.now().strftime(TIME_FORMAT)
+            if self.mode == 'move':
+                try:
+                    self._move(key)
+                except OSError as e:
+                    entry['archived'] = None
+                    workflow_logger.warning(f"[archive] {key}: move failed: {e}, will retry next run")
+                    continue
+                self._append_history(key, self.videos.pop(key))
+            archived.append(key)
+        return archived
+
+    def _move(self, key):
+        source = VIDEOS_DIR / key
+        target = self.archive_dir / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # 先移附属文件，视频最后移：中途失败时视频还在原处，下次运行会重试
+        for suffix in SIDECAR_SUFFIXES:
+            sidecar = source.with_suffix(suffix)
+            if sidecar.exists():
+                shutil.move(str(sidecar), str(target.with_suffix(suffix)))
+        if source.exists():
+            shutil.move(str(source), str(target))
+
+    def _append_history(self, key, entry):
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.archive_dir / "index.jsonl", 'a', encoding='utf-8') as f:
+            f.write(json.dumps(dict(entry, video=key), ensure_ascii=False) + "\n")
+
+
+def get_archive(workflow_config: dict):
+    """workflow 配置了 "archive" 时返回 PublishArchive，否则为 None(不记录、不归档)。"""
+    config = workflow_config.get('archive')
+    if not config:
+        return None
+    return PublishArchive(config if isinstance(config, dict) else {})
+
+
+def configured_platforms(workflow_config: dict) -> dict:
+    from utils.base_social_media import PLATFORM_REGISTRY
+    return {account['name']: [p for p in account.get('platforms', []) if p in PLATFORM_REGISTRY]
+            for account in workflow_config.get('accounts', []) if account.get('name')}
+
+
+def archive_published(workflow_config: dict, jobs, results: dict):
+    """
+    workflow 结束(或队列 worker 完成一个任务)后记录成功的任务，并归档所有平台都已发布的视频。
+    workflow_config 里没有 accounts 时只记账本，不归档。
+    """
+    from utils.log import workflow_logger
+
+    archive = get_archive(workflow_config)
+    if archive is None:
+        return []
+    with archive.locked():
+        archive.record_results(jobs, results)
+        archived = archive.archive_completed(configured_platforms(workflow_config))
+        archive.save()
+    if archived:
+        target = archive.archive_dir if archive.mode == 'move' else archive.ledger_file
+        workflow_logger.info(f"[archive] {len(archived)} fully published videos archived to {target}")
+    return archived
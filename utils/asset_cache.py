@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from conf import BASE_DIR, ASSET_CACHE_ENABLED
+
+ASSET_CACHE_DIR = Path(BASE_DIR) / "asset_cache"
+ASSET_CACHE_QUOTA = 500 * 1024 * 1024  # 超出时按最近使用时间淘汰
+ASSET_CACHE_MIN_MAX_AGE = 7 * 86400  # 没有内容哈希的 URL，cache-control max-age 至少这么长才缓存
+SAVE_EVERY = 20  # 每新增这么多条保存一次索引
+
+# 只拦截这些静态资源；注意开启路由后 Playwright 会关闭该上下文的浏览器 HTTP 缓存
+STATIC_URL_PATTERN = re.compile(r"^https?://[^?#]+\.(js|mjs|css|woff2?|ttf|otf)(\?.*)?$", re.IGNORECASE)
+CACHEABLE_TYPES = ("script", "stylesheet", "font")
+# 文件名里带 8 位以上十六进制内容哈希，例如 main.3f2a9c1b.js、chunk-5e8a0c4d7f.css
+HASHED_NAME_PATTERN = re.compile(r"[._-][0-9a-f]{8,}[._-]", re.IGNORECASE)
+KEPT_HEADERS = ("content-type", "cache-control", "access-control-allow-origin", "timing-allow-origin")
+
+
+def asset_cache_enabled() -> bool:
+    return ASSET_CACHE_ENABLED or os.environ.get("SAU_ASSET_CACHE") == "1"
+
+
+def is_hashed_url(url: str) -> bool:
+    name = urlsplit(url).path.rsplit('/', 1)[-1]
+    return bool(HASHED_NAME_PATTERN.search(name))
+
+
+def max_age(cache_control: str):
+    """immutable 视为永久；否则返回 max-age 秒数，no-store/no-cache/private 返回 None。"""
+    directives = [d.strip().lower() for d in (cache_control or '').split(',')]
+    if any(d in ('no-store', 'no-cache', 'private') for d in directives):
+        return None
+    if 'immutable' in directives:
+        return float('inf')
+    for d in directives:
+        if d.startswith('max-age='):
+            try:
+                return int(d.split('=', 1)[1])
+            except ValueError:
+                return None
+    return None
+
+
+class AssetCache(object):
+    """
+    跨账号共享的静态资源缓存：URL -> 内容哈希，内容按 sha256 存在 asset_cache/ 下，
+    同一份 bundle 不论来自哪个账号、哪个浏览器都只下载一次。
+    只缓存带内容哈希的 URL，或 cache-control 为 immutable / 长 max-age 的响应；总量超过配额时按 LRU 淘汰。
+    多个 worker 进程共用目录时，内容文件只增不改，索引保存时与磁盘上的合并。
+    """
+
+    def __init__(self, directory=ASSET_CACHE_DIR, quota_bytes=ASSET_CACHE_QUOTA):
+        self.directory = Path(directory)
+        self.index_file = self.directory / "index.json"
+        self.quota_bytes = quota_bytes
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0, "bytes_from_cache": 0}
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.entries = self._read_index()  # url -> {"digest", "size", "headers", "expires", "used"}
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _blob(self, digest) -> Path:
+        return self.directory / digest[:2] / digest
+
+    def get(self, url):
+        """返回 (headers, body)，未命中返回 None。"""
+        with self._lock:
+            entry = self.entries.get(url)
+            if entry and entry.get('expires') and entry['expires'] < time.time():
+                entry = None
+            if entry:
+                entry['used'] = time.time()
+        if entry:
+            try:
+                body = self._blob(entry['digest']).read_bytes()
+            except OSError:
+                body = None
+            if body is not None:
+                with self._lock:
+                    self.stats['hits'] += 1
+                    self.stats['bytes_from_cache'] += len(body)
+                return entry['headers'], body
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, url, headers: dict, body: bytes):
+        """按缓存规则决定是否保存响应。"""
+        age = max_age(headers.get('cache-control'))
+        if not is_hashed_url(url) and (age is None or age < ASSET_CACHE_MIN_MAX_AGE):
+            return False
+        digest = hashlib.sha256(body).hexdigest()
+        blob = self._blob(digest)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = blob.with_suffix(f'.{os.getpid()}.tmp')
+            tmp_file.write_bytes(body)
+            os.replace(tmp_file, blob)
+        expires = None if is_hashed_url(url) or age == float('inf') else time.time() + age
+        with self._lock:
+            self.entries[url] = {
+                "digest": digest,
+                "size": len(body),
+                "headers": {k: v for k, v in headers.items() if k in KEPT_HEADERS},
+                "expires": expires,
+                "used": time.time(),
+            }
+            self.stats['stored'] += 1
+            self._unsaved += 1
+            save = self._unsaved >= SAVE_EVERY
+        if save:
+            self.save()
+        return True
+
+    def save(self):
+        """合并其他进程写入的索引后按 LRU 淘汰超出配额的部分，再原子写回。"""
+        with self._lock:
+            merged = self._read_index()
+            for url, entry in self.entries.items():
+                if url not in merged or merged[url].get('used', 0) < entry['used']:
+                    merged[url] = entry
+            self._evict(merged)
+            self.entries = merged
+            self._unsaved = 0
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.index_file.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(merged, f)
+            os.replace(tmp_file, self.index_file)
+
+    def _evict(self, entries: dict):
+        # 不同 URL 可能指向同一份内容，按内容去重后计算总量；一次遍历建好 内容 -> URL 的索引
+        blobs = {}
+        urls = {}
+        for url, entry in entries.items():
+            used = max(blobs.get(entry['digest'], (0, 0))[0], entry['used'])
+            blobs[entry['digest']] = (used, entry['size'])
+            urls.setdefault(entry['digest'], []).append(url)
+        total = sum(size for _, size in blobs.values())
+        for digest, (_, size) in sorted(blobs.items(), key=lambda x: x[1][0]):
+            if total <= self.quota_bytes:
+                break
+            for url in urls[digest]:
+                del entries[url]
+            self._blob(digest).unlink(missing_ok=True)
+            total -= size
+            self.stats['evicted'] += 1
+
+    def hit_rate(self) -> float:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / lookups if lookups else 0.0
+
+    async def handle_route(self, route, request):
+        """
+        context.route 的处理函数：命中时直接用本地内容响应，否则放行并尝试缓存响应。
+        读写内容文件和保存索引都放到线程里，不阻塞同一事件循环上的其他上传。
+        """
+        if request.method != 'GET' or request.resource_type not in CACHEABLE_TYPES:
+            await route.fallback()
+            return
+        cached = await asyncio.to_thread(self.get, request.url)
+        if cached is not None:
+            headers, body = cached
+            await route.fulfill(status=200, headers=headers, body=body)
+            return
+        try:
+            response = await route.fetch()
+            body = await response.body()
+        except Exception:
+            # 网络错误、超时或页面已经跳走：交给浏览器按正常流程处理，不能让请求一直挂着
+            try:
+                await route.fallback()
+            except Exception:
+                pass  # 请求已经被取消
+            return
+        try:
+            await route.fulfill(response=response, body=body)
+        except Exception:
+            pass  # 页面已经关闭；响应本身没问题，照样缓存
+        if response.status == 200:
+            try:
+                await asyncio.to_thread(self.put, request.url, response.headers, body)
+            except OSError:
+                pass
+
+
+_asset_cache = None
+
+
+def get_asset_cache() -> AssetCache:
+    global _asset_cache
+    if _asset_cache is None:
+        _asset_cache = AssetCache()
+    return _asset_cache
+
+
+async def attach_asset_cache(context):
+    """为浏览器上下文开启共享静态资源缓存(未开启 ASSET_CACHE_ENABLED 时什么也不做)。"""
+    if asset_cache_enabled():
+        await context.route(STATIC_URL_PATTERN, get_asset_cache().handle_route)
+
+
+def flush_asset_cache(logger=None):
+    """保存索引并输出命中率，在一批上传结束时调用。"""
+    if _asset_cache is None:
+        return
+    _asset_cache.save()
+    stats = _asset_cache.stats
+    if logger is not None:
+        logger.info(f"[asset cache] hits {stats['hits']}, misses {stats['misses']}, "
+                    f"hit rate {_asset_cache.hit_rate():.0%}, {stats['bytes_from_cache'] / 1024 / 1024:.1f} MB from cache, "
+                    f"stored {stats['stored']}, evicted {stats['evicted']}")
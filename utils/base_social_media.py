@@ -1,6 +1,8 @@
 from pathlib import Path
 from typing import List
+import importlib
 import json
+import time
 from datetime import datetime, timedelta
 import csv
 
@@ -11,24 +13,25 @@ SOCIAL_MEDIA_TENCENT = "tencent"
 SOCIAL_MEDIA_TIKTOK = "tiktok"
 SOCIAL_MEDIA_BILIBILI = "bilibili"
 SOCIAL_MEDIA_KUAISHOU = "kuaishou"
-
-# Import uploader modules and utilities
-# Moved imports inside functions to break circular dependency
-# import os
-# import asyncio
-# import time
-# from uploader.douyin_uploader.main import douyin_setup, DouYinVideo
-# from uploader.ks_uploader.main import ks_setup, KSVideo
-# from uploader.tencent_uploader.main import weixin_setup, TencentVideo
-# from uploader.bilibili_uploader.main import BilibiliUploader, read_cookie_json_file, extract_keys_from_json
-# from uploader.tk_uploader.main_chrome import tiktok_setup, TiktokVideo
-
-from utils.files_times import get_title_and_hashtags, generate_schedule_time_next_day
-from utils.constant import TencentZoneTypes # Needed for Tencent video category
-from utils.log import tencent_logger # Ensure tencent_logger is imported at the top
-
-# Import playwright types at the top level
-# import playwright._impl._api_types # Import playwright types here
+SOCIAL_MEDIA_BAIJIAHAO = "baijiahao"
+SOCIAL_MEDIA_XHS = "xhs"
+
+# 平台注册表：平台名 -> (上传模块路径, 上传器类名)
+# 上传模块(以及 playwright / loguru)只在第一次用到该平台时才导入，
+# 这样 `cli_main.py --help`、单平台 login 以及短生命周期的 worker 进程不用为所有平台买单。
+# 注意：本模块顶层不要再导入 uploader.* / utils.log / utils.files_times，否则会把启动开销带回来。
+PLATFORM_REGISTRY = {
+    SOCIAL_MEDIA_DOUYIN: ("uploader.douyin_uploader.main", "DouYinUploader"),
+    SOCIAL_MEDIA_TENCENT: ("uploader.tencent_uploader.main", "TencentUploader"),
+    SOCIAL_MEDIA_TIKTOK: ("uploader.tk_uploader.main_chrome", "TiktokUploader"),
+    SOCIAL_MEDIA_KUAISHOU: ("uploader.ks_uploader.main", "KSUploader"),
+    SOCIAL_MEDIA_BAIJIAHAO: ("uploader.baijiahao_uploader.main", "BaiJiaHaoUploader"),
+    SOCIAL_MEDIA_BILIBILI: ("uploader.bilibili_uploader.main", "BilibiliUploaderAdapter"),
+    SOCIAL_MEDIA_XHS: ("uploader.xhs_uploader.main", "XhsUploader"),
+}
+
+# 模块路径 -> 导入耗时(秒)，供 `cli_main.py --profile-imports` 输出
+PLATFORM_IMPORT_TIMES = {}
 
 
 def get_supported_social_media() -> List[str]:
@@ -39,9 +42,128 @@ def get_cli_action() -> List[str]:
     return ["upload", "login", "watch"]
 
 
+def get_account_file(platform: str, account_name: str) -> Path:
+    """账号 cookie 文件路径：cookies/<platform>_uploader/<account>.json"""
+    return Path(BASE_DIR) / "cookies" / f"{platform}_uploader" / f"{account_name}.json"
+
+
+class PlatformCapabilities(object):
+    """
+    平台的调度能力声明，workflow 调度器据此把任务打包到有限的资源上。
+
+    - max_concurrent_sessions: 该平台同时进行的上传会话上限(所有账号合计)
+    - min_spacing: 同一账号在该平台两次上传开始之间的最小间隔(秒)
+    - needs_browser: 是否需要启动浏览器
+    - memory_cost: 单个上传会话的典型内存占用(MB)
+    """
+
+    def __init__(self, max_concurrent_sessions=1, min_spacing=0, needs_browser=True, memory_cost=500):
+        self.max_concurrent_sessions = max_concurrent_sessions
+        self.min_spacing = min_spacing
+        self.needs_browser = needs_browser
+        self.memory_cost = memory_cost
+
+
+class UploadJob(object):
+    """workflow 中的一个上传任务：某账号把某个视频发布到某个平台。"""
+
+    def __init__(self, account_name, platform, video_file, title, tags, publish_date=0, video_type=None,
+                 thumbnail_path=None, options=None, parts=None):
+        self.account_name = account_name
+        self.platform = platform
+        self.video_file = str(video_file)
+        self.title = title
+        self.tags = tags
+        self.publish_date = publish_date  # 0 表示立即发布
+        self.video_type = video_type
+        self.thumbnail_path = thumbnail_path
+        self.options = options or {}  # 账号配置里的平台参数，例如 tencent_category / bilibili_tid
+        # 多P投稿的所有分P [{"video_file": ..., "title": ...}, ...]，第一个就是 video_file；目前只有 B 站支持
+        self.parts = parts
+
+    @property
+    def name(self):
+        """日志里显示的名字；不同子目录下可能有同名视频，不唯一，记录结果用 key。"""
+        return f"{self.platform}_{self.account_name}_{Path(self.video_file).name}"
+
+    @property
+    def key(self):
+        """任务的唯一标识：平台|账号|视频路径(相对 videos 目录)"""
+        video = Path(self.video_file)
+        try:
+            video = video.relative_to(Path(BASE_DIR) / "videos")
+        except ValueError:
+            pass
+        return f"{self.platform}|{self.account_name}|{video.as_posix()}"
+
+
+class BaseUploader(object):
+    """
+    所有平台上传器的统一协议：setup -> validate -> upload -> verify
+
+    子类声明 platform 和 capabilities，并实现 setup / upload。
+    """
+    platform = None
+    capabilities = PlatformCapabilities()
+
+    def __init__(self, account_file):
+        self.account_file = str(account_file)
+
+    async def setup(self, handle=False) -> bool:
+        """确保 cookie 可用；handle=True 时在失效时引导登录。"""
+        raise NotImplementedError
+
+    async def validate(self) -> bool:
+        """
+        只检查 cookie 是否有效，不触发登录。
+        先按 cookie 文件里关键 cookie 的过期时间离线判断，再用一个需要登录的 HTTP 接口探测，
+        都判断不了时才调用 setup 打开浏览器检查。
+        """
+        from utils.cookie_expiry import estimate_validity
+        from utils.session_probe import probe_session
+        verdict = estimate_validity(self.platform, self.account_file)
+        if verdict is None:
+            verdict = await probe_session(self.platform, self.account_file)
+        if verdict is not None:
+            return verdict
+        return await self.setup(handle=False)
+
+    async def upload(self, job: UploadJob):
+        """上传并发布一个视频，成功返回 True。"""
+        raise NotImplementedError
+
+    async def verify(self, result) -> bool:
+        """根据 upload 的返回值判断是否发布成功。"""
+        return result is not False
+
+
+def load_platform_module(platform: str):
+    """按需导入平台的上传模块，并记录导入耗时。"""
+    if platform not in PLATFORM_REGISTRY:
+        raise ValueError(f"Unsupported platform: {platform}")
+    module_path = PLATFORM_REGISTRY[platform][0]
+    start = time.perf_counter()
+    module = importlib.import_module(module_path)
+    # 已导入过的模块 import_module 直接返回缓存，只记录首次导入的耗时
+    PLATFORM_IMPORT_TIMES.setdefault(module_path, time.perf_counter() - start)
+    return module
+
+
+def get_uploader_class(platform: str):
+    """返回平台的上传器类(BaseUploader 子类)。"""
+    module = load_platform_module(platform)
+    return getattr(module, PLATFORM_REGISTRY[platform][1])
+
+
+def get_uploader(platform: str, account_file) -> BaseUploader:
+    return get_uploader_class(platform)(account_file)
+
+
 async def set_init_script(context):
+    from utils.asset_cache import attach_asset_cache
     stealth_js_path = Path(BASE_DIR / "utils/stealth.min.js")
     await context.add_init_script(path=stealth_js_path)
+    await attach_asset_cache(context)
     return context
 
 
@@ -55,256 +177,8 @@ def load_workflow_config(config_path: str):
     return config
 
 
-async def run_workflow(config: dict | str):
-    """Runs the multi-account and multi-video-type workflow."""
-    
-    generated_schedule_times = None
-    
-    workflow_config = None
-
-    if isinstance(config, str):
-        print(f"Loading workflow config from {config}")
-        workflow_config = load_workflow_config(config)
-        if 'generated_schedule' in workflow_config:
-            generated_schedule_times = workflow_config.pop('generated_schedule')
-            print(f"Found generated schedule with {len(generated_schedule_times)} entries from file.")
-    else:
-        print("Using provided workflow config dictionary.")
-        workflow_config = config
-        if 'generated_schedule' in workflow_config:
-            generated_schedule_times = workflow_config.pop('generated_schedule')
-            print(f"Found generated schedule with {len(generated_schedule_times)} entries from dictionary.")
-
-    print("Workflow config loaded successfully." if isinstance(config, str) else "Using provided workflow config.") # Adjust message
-    print("Starting workflow execution...")
-
-    base_videos_path = Path(BASE_DIR) / "videos"
-    base_cookies_path = Path(BASE_DIR) / "cookies"
-
-    # Import uploader modules here to avoid circular dependency
-    import os
-    import asyncio
-    import time
-    from uploader.douyin_uploader.main import douyin_setup, DouYinVideo
-    from uploader.ks_uploader.main import ks_setup, KSVideo
-    from uploader.tencent_uploader.main import weixin_setup, TencentVideo
-    from uploader.bilibili_uploader.main import BilibiliUploader, read_cookie_json_file, extract_keys_from_json
-    # from uploader.tk_uploader.main_chrome import tiktok_setup, TiktokVideo # Add this import if TikTok is needed
-
-    from utils.files_times import get_title_and_hashtags, generate_schedule_time_next_day
-    from utils.constant import TencentZoneTypes # Needed for Tencent video category
-
-    video_index_counter = 0 # Add a counter to track the overall video index across types
-
-    for account in workflow_config.get('accounts', []):
-        account_name = account.get('name')
-        video_types = account.get('video_types', [])
-        platforms = account.get('platforms', [])
-        
-        if not account_name:
-            print("Warning: Skipping account with no name defined in config.")
-            continue
-
-        print(f"\nProcessing account: {account_name}")
-        print(f"Video types: {video_types}")
-        print(f"Platforms: {platforms}")
-
-        for video_type in video_types:
-            # Modify video path to include account name
-            video_type_path = base_videos_path / account_name / video_type
-            if not video_type_path.exists() or not video_type_path.is_dir():
-                print(f"Warning: Video type directory not found: {video_type_path}. Skipping.")
-                continue
-            
-            # Find video files in the video type directory
-            video_files = sorted(list(video_type_path.glob("**/*.mp4"))) # Sort to process in a consistent order, recursively
-            
-            if not video_files:
-                print(f"No MP4 videos found for video type '{video_type}' in {video_type_path}. Skipping.")
-                continue
-
-            print(f"Found {len(video_files)} videos for type '{video_type}': {[f.name for f in video_files]}")
-            
-            for index, video_file in enumerate(video_files):
-                video_path_str = str(video_file)
-                title, tags = get_title_and_hashtags(video_path_str)
-                
-                publish_date = 0 # Default to immediate publish if no schedule is generated
-
-                # Use generated schedule time if available, otherwise use the default logic
-                if generated_schedule_times and video_index_counter < len(generated_schedule_times):
-                    # Convert timestamp back to datetime object (assuming timestamps are in seconds)
-                    # Note: cli_main.py generates string times in YYYY-MM-DD HH:MM format, not timestamps.
-                    # We need to parse the string into a datetime object here.
-                    try:
-                        publish_date_str = generated_schedule_times[video_index_counter]
-                        publish_date = datetime.strptime(publish_date_str, '%Y-%m-%d %H:%M')
-                        print(f"Using generated schedule time for video {video_file.name}: {publish_date}")
-                    except Exception as e:
-                        print(f"Warning: Failed to parse generated schedule time '{publish_date_str}' for video {video_file.name}: {e}. Using default immediate publish.")
-                        publish_date = 0
-                else:
-                    # Fallback to original default logic if no generated schedule or index is out of bounds
-                    # This part might need adjustment based on desired fallback behavior.
-                    # Currently, if generated_schedule_times is not available or exhausted,
-                    # it will default to immediate publish (publish_date = 0) which might not be desired.
-                    # If a default *scheduled* behavior is needed when custom schedule is not provided/exhausted,
-                    # the original generate_schedule_time_next_day logic or similar would be needed here.
-                    # For now, adhering to the logic of using generated schedule if present, else immediate.
-                    print(f"Warning: No generated schedule time available for video {video_file.name}. Using default immediate publish.")
-                    publish_date = 0
-
-                # Increment the global video index counter
-                video_index_counter += 1
-
-                if not title:
-                    print(f"Warning: Skipping video {video_file.name} due to missing title (.txt file).")
-                    continue
-                
-                print(f"\n  Processing video: {video_file.name}")
-                print(f"    Title: {title}")
-                print(f"    Tags: {tags}")
-                print(f"    Scheduled for: {publish_date if publish_date != 0 else 'Immediate'}") # Display 'Immediate' if publish_date is 0
-                
-                # List to hold upload tasks for different platforms for this video
-                upload_tasks = []
-                
-                for platform in platforms:
-                    print(f"    Attempting to upload to platform: {platform}")
-                    
-                    # Construct cookie file path for the specific account and platform
-                    cookie_file = base_cookies_path / f"{platform}_uploader" / f"{account_name}.json"
-                    
-                    if not cookie_file.exists():
-                        print(f"      Error: Cookie file not found for account '{account_name}' on platform '{platform}' at {cookie_file}. Skipping upload to this platform for this video.")
-                        continue
-                        
-                    # Call the appropriate uploader based on platform and create a task
-                    try:
-                        if platform == SOCIAL_MEDIA_DOUYIN:
-                            # Assuming douyin_setup with handle=False uses existing cookie
-                            # We need to run setup before creating the upload task if it initializes state
-                            await douyin_setup(cookie_file, handle=False)
-                            app = DouYinVideo(title, video_path_str, tags, publish_date, cookie_file)
-                            task = asyncio.create_task(app.main(), name=f"{platform}_{account_name}_{video_file.name}")
-                            upload_tasks.append(task)
-                            
-                        elif platform == SOCIAL_MEDIA_KUAISHOU:
-                            # Assuming ks_setup with handle=False uses existing cookie
-                            await ks_setup(cookie_file, handle=False)
-                            app = KSVideo(title, video_path_str, tags, publish_date, cookie_file)
-                            task = asyncio.create_task(app.main(), name=f"{platform}_{account_name}_{video_file.name}")
-                            upload_tasks.append(task)
-                            
-                        elif platform == SOCIAL_MEDIA_TENCENT:
-                             # Assuming weixin_setup with handle=True is for initial setup, use handle=False for upload
-                            await weixin_setup(cookie_file, handle=False) # Use handle=False if setup already done
-                            category = TencentZoneTypes.LIFESTYLE.value # Default category, modify if needed based on video type
-                            app = TencentVideo(title, video_path_str, tags, publish_date, cookie_file, category)
-                            task = asyncio.create_task(app.main(), name=f"{platform}_{account_name}_{video_file.name}")
-                            upload_tasks.append(task)
-                            
-                        elif platform == SOCIAL_MEDIA_BILIBILI:
-                            # Bilibili example used a different approach (reading cookie json directly)
-                            bili_cookie_data = read_cookie_json_file(cookie_file)
-                            bili_cookie_data = extract_keys_from_json(bili_cookie_data)
-                            # tid (partition id) is hardcoded to SPORTS_FOOTBALL in example. Needs to be dynamic?
-                            # For now, hardcode or use a default. You might need to add this to your config.
-                            tid = 255 # Example tid for lifestyle/daily, adjust as needed
-                            # Bilibili uploader does not seem to be an async class based on previous read
-                            # If it's synchronous, we cannot easily run it with asyncio.create_task
-                            # For now, we'll keep it synchronous if it is, or adapt if possible.
-                            # Assuming it's async based on context needing await - will create task
-                            app = BilibiliUploader(bili_cookie_data, video_path_str, title, title, tid, tags, publish_date)
-                            # If Bilibili upload is truly synchronous, this would block. Need confirmation.
-                            # For now, assuming it's async or can be run in executor if needed.
-                            task = asyncio.create_task(app.upload(), name=f"{platform}_{account_name}_{video_file.name}") # Assuming upload is async now
-                            upload_tasks.append(task)
-                            # Note: The original code had a time.sleep(10) after Bilibili upload. 
-                            # If it's now an async task, this sleep is not needed here.
-                            
-                        # Add other platforms like tiktok here if needed
-                        # elif platform == SOCIAL_MEDIA_TIKTOK:
-                        #     await tiktok_setup(cookie_file, handle=True) # Use handle=False if setup already done
-                        #     app = TiktokVideo(title, video_path_str, tags, publish_date, cookie_file)
-                        #     task = asyncio.create_task(app.main(), name=f"{platform}_{account_name}_{video_file.name}")
-                        #     upload_tasks.append(task)
-                            
-                        else:
-                            print(f"      Warning: Unsupported platform '{platform}'. Skipping.")
-                            
-                    except FileNotFoundError as e:
-                        print(f"      Error processing {video_file.name} for {platform} (Account: {account_name}): {e}")
-                    except Exception as e:
-                         print(f"      An unexpected error occurred during task creation for {video_file.name} to {platform} (Account: {account_name}): {e}")
-                         # Optionally, add more specific error handling based on uploader exceptions
-
-                # Wait for all upload tasks for this video to complete
-                if upload_tasks:
-                    print(f"\n    Waiting for uploads to {len(upload_tasks)} platforms to complete for {video_file.name}...")
-                    # Use return_exceptions=True to prevent cancellation of other tasks if one fails
-                    results = await asyncio.gather(*upload_tasks, return_exceptions=True)
-                    
-                    # Process results/exceptions
-                    for i, result in enumerate(results):
-                        task = upload_tasks[i]
-                        task_name = task.get_name()
-                        platform_name = task_name.split('_')[0] # Extract platform name from task name
-                        video_name = '_'.join(task_name.split('_')[2:]) # Extract video name from task name
-                        
-                        if isinstance(result, Exception):
-                            # Import necessary Playwright exception type here
-                            try:
-                                from playwright.async_api import TargetClosedError
-                            except ImportError:
-                                TargetClosedError = None # Define as None if Playwright types not available
-
-                            # Check if the exception is a Playwright TargetClosedError
-                            if TargetClosedError is not None and isinstance(result, TargetClosedError):
-                                # Log as a warning or info if it's a known non-critical error after successful upload
-                                # This assumes the upload itself completed successfully before this error
-                                tencent_logger.warning(f"      Upload task for {platform_name} for {video_name} encountered TargetClosedError: {result}")
-                            else:
-                                # Log other exceptions as errors, including full traceback
-                                import traceback
-                                tencent_logger.error(f"      Upload to {platform_name} for {video_name} failed with unexpected error: {result}\n{traceback.format_exc()}")
-                        else:
-                            tencent_logger.success(f"      Upload to {platform_name} for {video_name} completed successfully.")
-
-                # Add a small delay between processing different videos
-                # await asyncio.sleep(5) # Original delay - removed as it's between videos within a video type
-                
-                # After all platforms attempted for this video, save cookies if necessary
-                # This assumes cookie saving is part of the uploader's cleanup or state management
-                # If cookie saving happens within app.main() or app.upload(), and that task failed,
-                # the state might not be saved. Need to ensure state is saved reliably.
-                # If a platform task failed with TargetClosedError, saving state afterwards might also fail.
-                # A more robust solution might involve saving state immediately after a successful login,
-                # and relying on uploaders to handle their own session state during upload.
-                # For now, the original code seemed to rely on the uploader saving state.
-                # If the error is indeed due to browser context closing on error, we might need to
-                # revisit how resources are managed in the uploader classes themselves.
-
-            # Add a delay between processing video types for the same account
-            await asyncio.sleep(10)
-
-        # Add a delay between processing different accounts
-        await asyncio.sleep(30)
-
-    print("Workflow execution finished.")
-
-
 async def manage_cookies_menu():
     """Handles the cookie management interactive menu."""
-    # Import uploader modules here to avoid circular dependency
-    import os
-    import asyncio
-    import time
-    from uploader.douyin_uploader.main import douyin_setup
-    from uploader.ks_uploader.main import ks_setup
-    from uploader.tencent_uploader.main import weixin_setup
-    # from uploader.tk_uploader.main_chrome import tiktok_setup # Add this import if TikTok is needed
-
     print("\n===== Manage Cookies =====")
 
     # Load config to get accounts and platforms
@@ -361,21 +235,13 @@ async def manage_cookies_menu():
     
     # Construct cookie file path
     account_name = selected_account.get('name')
-    base_cookies_path = Path(BASE_DIR) / "cookies"
-    cookie_file = base_cookies_path / f"{selected_platform}_uploader" / f"{account_name}.json"
+    cookie_file = get_account_file(selected_platform, account_name)
     cookie_file.parent.mkdir(exist_ok=True)
     
     # Call the appropriate setup function based on platform
     try:
-        if selected_platform == SOCIAL_MEDIA_DOUYIN:
-            await douyin_setup(str(cookie_file), handle=True)
-        elif selected_platform == SOCIAL_MEDIA_KUAISHOU:
-            await ks_setup(str(cookie_file), handle=True)
-        elif selected_platform == SOCIAL_MEDIA_TENCENT:
-            await weixin_setup(str(cookie_file), handle=True)
-        # elif selected_platform == SOCIAL_MEDIA_TIKTOK:
-        #     await tiktok_setup(str(cookie_file), handle=True)
-        # Add other platforms as needed
+        if selected_platform in PLATFORM_REGISTRY:
+            await get_uploader(selected_platform, cookie_file).setup(handle=True)
         else:
             print(f"Cookie management for platform '{selected_platform}' is not yet supported in this menu.")
             
@@ -395,7 +261,7 @@ async def run_workflow_interactively():
     config_path = 'workflow_config.json' # Assuming config file is in the root directory
     try:
         # Call the main run_workflow function
-        from utils.base_social_media import run_workflow # Import here to avoid circular dependency if both are in cli_main
+        from utils.workflow import run_workflow # Import here to avoid circular dependency
         await run_workflow(config_path)
     except FileNotFoundError:
         print(f"Error: Workflow config file not found at {config_path}. Cannot run workflow.")
@@ -0,0 +1,289 @@
+import asyncio
+import html
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from utils.cookie_expiry import EXPIRY_MARGIN, SESSION_COOKIE_RULES, session_expiry
+from utils.cookie_store import COOKIES_DIR, account_key
+from utils.log import workflow_logger
+
+DASHBOARD_HOST = "127.0.0.1"
+DASHBOARD_PORT = 8765
+LOGIN_TIMEOUT = 600  # 每个账号等待扫码的总时长(秒)
+MANUAL_CONFIRM_AFTER = 180  # 单账号登录时，这么久没检测到登录 cookie 就改为人工确认
+QR_REFRESH = 110  # 二维码一般两分钟失效，超过这么久没扫就重新打开登录页
+POLL_INTERVAL = 2  # 检查登录状态、刷新二维码截图的间隔(秒)
+DEFAULT_LOGIN_CONCURRENCY = 10
+
+# 平台 -> (登录页, 打开后需要先点击的元素，没有则为 None)
+LOGIN_PAGES = {
+    "douyin": ("https://creator.douyin.com/", None),
+    "tencent": ("https://channels.weixin.qq.com/login.html", None),
+    "kuaishou": ("https://cp.kuaishou.com", "text=立即登录"),
+    "tiktok": ("https://www.tiktok.com/login/qrcode?lang=en", None),
+    "baijiahao": ("https://baijiahao.baidu.com/builder/theme/bjh/login", None),
+}
+# 二维码元素，依次尝试；都找不到时截取整个页面
+QR_SELECTORS = ("img[class*='qrcode']", "[class*='qrcode'] img", "[class*='qrcode'] canvas",
+                "[class*='qr-code'] img", "img[src*='qrcode']", "canvas")
+
+
+async def is_logged_in(context, platform) -> bool:
+    """上下文里已经有该平台登录后才会下发的关键 cookie(并且未过期)就算登录完成。"""
+    rule = SESSION_COOKIE_RULES[platform]
+    expires = session_expiry(rule, {"cookies": await context.cookies()})
+    return expires is not None and expires > time.time() + EXPIRY_MARGIN
+
+
+async def wait_for_login(context, platform, timeout=LOGIN_TIMEOUT, on_poll=None) -> bool:
+    """
+    等待用户在页面上完成登录，代替 page.pause() 后手动点调试器的继续。
+    on_poll: 每次检查前调用的协程函数(批量登录时用来刷新二维码截图)。
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if on_poll is not None:
+            await on_poll()
+        if await is_logged_in(context, platform):
+            # 登录后页面还会跳转并补发一些 cookie，稍等再保存
+            await asyncio.sleep(POLL_INTERVAL)
+            return True
+        await asyncio.sleep(POLL_INTERVAL)
+    return False
+
+
+async def login_interactively(page, platform, timeout=MANUAL_CONFIRM_AFTER):
+    """
+    单账号登录(有界面的浏览器)，返回后即可保存 cookie：检测到登录 cookie 时自动返回。
+    超时还没检测到(平台改了 cookie 名等)时：页面已经离开登录页就当作登录完成，
+    否则像以前一样打开 Playwright Inspector，用户登录后点继续(resume)再保存。
+    """
+    login_url = page.url
+    names = SESSION_COOKIE_RULES[platform].names
+    workflow_logger.info(f"[login] {platform}: waiting for login, cookies {names} will be saved automatically")
+    if await wait_for_login(page.context, platform, timeout):
+        return
+    workflow_logger.warning(f"[login] {platform}: expected cookies {names} not found after {timeout}s")
+    if page.url != login_url and 'login' not in page.url.lower():
+        workflow_logger.warning(f"[login] {platform}: page left the login page ({page.url}), saving cookies anyway")
+        return
+    workflow_logger.warning(f"[login] {platform}: finish logging in, then click resume in the Playwright Inspector")
+    await page.pause()
+
+
+class LoginSlot(object):
+    def __init__(self, platform, account_file):
+        self.platform = platform
+        self.account_file = Path(account_file)
+        self.status = "waiting"  # waiting / scanning / saved / timeout / failed
+        self.qr_png = None
+        self.updated = time.time()
+
+    @property
+    def name(self):
+        return f"{self.platform}/{self.account_file.stem}"
+
+    def update(self, status=None, qr_png=None):
+        if status is not None:
+            self.status = status
+        if qr_png is not None:
+            self.qr_png = qr_png
+        self.updated = time.time()
+
+
+class LoginDashboard(object):
+    """本地网页，集中展示各账号的二维码和登录状态，页面每几秒自动刷新。"""
+
+    def __init__(self, slots, host=DASHBOARD_HOST, port=DASHBOARD_PORT):
+        self.slots = slots
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def render(self) -> bytes:
+        cells = []
+        for index, slot in enumerate(self.slots):
+            image = f'<img src="/qr/{index}.png?t={slot.updated:.0f}">' \
+                if slot.qr_png and slot.status == "scanning" else ""
+            cells.append(f'<div class="slot {slot.status}"><h3>{html.escape(slot.name)}</h3>'
+                         f'<p>{slot.status}</p>{image}</div>')
+        done = sum(slot.status == "saved" for slot in self.slots)
+        page = f"""<!DOCTYPE html><html><head><meta charset="utf-8"><meta http-equiv="refresh" content="{POLL_INTERVAL + 1}">
+<title>批量登录 {done}/{len(self.slots)}</title><style>
+body{{font-family:sans-serif}} .slot{{display:inline-block;vertical-align:top;width:320px;margin:6px;padding:6px;border:1px solid #ccc}}
+.slot img{{max-width:300px}} .saved{{background:#e6f7e6}} .timeout,.failed{{background:#fbe9e9}}
+</style></head><body><h2>已登录 {done}/{len(self.slots)}</h2>{''.join(cells)}</body></html>"""
+        return page.encode('utf-8')
+
+    def _handler(self):
+        dashboard = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == "/":
+                    self._send(200, "text/html; charset=utf-8", dashboard.render())
+                    return
+                if path.startswith("/qr/") and path.endswith(".png"):
+                    try:
+                        slot = dashboard.slots[int(path[len("/qr/"):-len(".png")])]
+                    except (ValueError, IndexError):
+                        slot = None
+                    if slot is not None and slot.qr_png:
+                        self._send(200, "image/png", slot.qr_png)
+                        return
+                self._send(404, "text/plain", b"not found")
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+async def _capture_qr(page) -> bytes:
+    for selector in QR_SELECTORS:
+        element = page.locator(selector).first
+        try:
+            if await element.is_visible():
+                return await element.screenshot(timeout=3000)
+        except Exception:
+            continue
+    return await page.screenshot()
+
+
+async def _open_login_page(page, platform):
+    url, click = LOGIN_PAGES[platform]
+    await page.goto(url, wait_until="domcontentloaded", timeout=30000)
+    if click:
+        try:
+            await page.locator(click).first.click(timeout=5000)
+        except Exception:
+            pass  # 已经直接显示二维码
+
+
+async def _login_one(browser, slot: LoginSlot, timeout):
+    from utils.base_social_media import set_init_script
+    from utils.storage_state import save_storage_state
+
+    context = await browser.new_context()
+    try:
+        context = await set_init_script(context)
+        page = await context.new_page()
+        await _open_login_page(page, slot.platform)
+        slot.update(status="scanning")
+        opened = time.monotonic()
+
+        async def refresh_qr():
+            nonlocal opened
+            if time.monotonic() - opened > QR_REFRESH:
+                await _open_login_page(page, slot.platform)
+                opened = time.monotonic()
+            try:
+                slot.update(qr_png=await _capture_qr(page))
+            except Exception:
+                pass  # 页面跳转中，下一轮再截
+
+        if not await wait_for_login(context, slot.platform, timeout, on_poll=refresh_qr):
+            slot.update(status="timeout")
+            workflow_logger.warning(f"[login] {slot.name}: not scanned within {timeout}s "
+                                    f"(expected cookies {SESSION_COOKIE_RULES[slot.platform].names})")
+            return
+        await save_storage_state(context, slot.account_file)
+        slot.update(status="saved")
+        workflow_logger.success(f"[login] {slot.name}: cookie saved")
+    except Exception as e:
+        slot.update(status="failed")
+        workflow_logger.error(f"[login] {slot.name}: {e}")
+    finally:
+        await context.close()
+
+
+async def batch_login(accounts, concurrency=DEFAULT_LOGIN_CONCURRENCY, port=DASHBOARD_PORT,
+                      timeout=LOGIN_TIMEOUT) -> dict:
+    """
+    同时为多个账号打开无头登录页，二维码集中显示在本地网页上，扫码后自动保存 cookie。
+    accounts: [(平台, 账号 cookie 文件)]；返回 {账号: 状态}。
+    所有账号共用一个浏览器，每个账号一个上下文，同时最多 concurrency 个登录页。
+    """
+    from playwright.async_api import async_playwright
+
+    slots = [LoginSlot(platform, account_file) for platform, account_file in accounts if platform in LOGIN_PAGES]
+    for platform, account_file in accounts:
+        if platform not in LOGIN_PAGES:
+            print(f"Skipping {platform}/{Path(account_file).stem}: batch login is not supported for {platform}")
+    if not slots:
+        return {}
+    dashboard = LoginDashboard(slots, port=port)
+    dashboard.start()
+    print(f"Open {dashboard.url} and scan the QR codes ({len(slots)} accounts)")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(browser, slot):
+        async with semaphore:
+            await _login_one(browser, slot, timeout)
+
+    try:
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch(headless=True)
+            try:
+                await asyncio.gather(*[run(browser, slot) for slot in slots])
+            finally:
+                await browser.close()
+    finally:
+        dashboard.stop()
+    return {slot.name: slot.status for slot in slots}
+
+
+def login_candidates(workflow_config: dict = None, platform=None):
+    """
+    需要登录的 (平台, cookie 文件)：有 workflow 配置时取配置里的账号 x 平台，
+    否则取 cookies/ 下已有的账号文件。
+    """
+    from utils.base_social_media import get_account_file
+
+    if workflow_config:
+        accounts = [(p, get_account_file(p, account['name']))
+                    for account in workflow_config.get('accounts', []) if account.get('name')
+                    for p in account.get('platforms', [])]
+    else:
+        accounts = []
+        for account_file in sorted(Path(COOKIES_DIR).glob("*_uploader/*.json")):
+            accounts.append((account_key(account_file)[0], account_file))
+    return [(p, f) for p, f in accounts if platform is None or p == platform]
+
+
+async def expired_accounts(accounts) -> list:
+    """过滤出登录态不是肯定有效的账号：先离线看 cookie，再用 HTTP 接口探测，不打开浏览器。"""
+    from utils.cookie_expiry import estimate_validity
+    from utils.session_probe import shared_prober
+
+    async with shared_prober() as prober:
+        async def check(platform, account_file):
+            verdict = estimate_validity(platform, account_file)
+            if verdict is None:
+                verdict = await prober.probe(platform, account_file)
+            return verdict
+
+        verdicts = await asyncio.gather(*[check(p, f) for p, f in accounts])
+    return [account for account, verdict in zip(accounts, verdicts) if verdict is not True]
@@ -0,0 +1,189 @@
+import asyncio
+import os
+import shutil
+import socket
+import time
+from pathlib import Path
+
+from conf import BASE_DIR, BROWSER_PERSISTENT_PROFILES
+from utils.cookie_store import load_storage_state
+
+PROFILES_DIR = Path(BASE_DIR) / "browser_profiles"
+PROFILE_SIZE_CAP = 300 * 1024 * 1024  # 单个账号 profile 的上限，超出时从最久没用的缓存文件开始删
+PROFILE_MAX_IDLE_DAYS = 30  # cleanup 时删除超过这么多天没用过的 profile
+# 只裁剪缓存，不碰 Cookies / Local Storage / IndexedDB
+CACHE_DIRS = ("Cache", "Code Cache", "GPUCache", "Service Worker/CacheStorage", "cache2")
+# profile 目录里的锁文件，内容为 "主机名 pid"；同一台机器上的多个进程(worker、-w 分片)不会同时打开同一个 profile
+PROFILE_LOCK = ".sau_profile.lock"
+
+_profiles_in_use = {}  # 本进程打开的 profile 目录 -> 锁文件的 fd(持有期间一直打开，Windows 上别人删不掉)
+_releasing = {}  # context -> 关闭后释放 profile 的任务(裁剪缓存、删除锁文件)
+
+
+def persistent_profiles_enabled() -> bool:
+    return BROWSER_PERSISTENT_PROFILES or os.environ.get("SAU_PERSISTENT_PROFILE") == "1"
+
+
+def profile_dir(account_file) -> Path:
+    """cookies/<platform>_uploader/<account>.json -> browser_profiles/<platform>_uploader/<account>"""
+    account_file = Path(account_file)
+    return PROFILES_DIR / account_file.parent.name / account_file.stem
+
+
+async def open_context(browser_type, account_file, **options):
+    """
+    打开上传用的浏览器上下文，返回 (browser, context)。
+
+    开启持久化 profile 时每个账号用自己的 user data 目录，JS/CSS 走磁盘缓存，localStorage / IndexedDB 也会保留；
+    cookie 仍以 cookie 库(utils.cookie_store)为准，打开时用它覆盖 profile 里的 cookie，上传结束照常 storage_state 写回 json，两边保持一致。
+    此时 browser 为 None。同一 profile 已被占用(本进程或本机其他进程里同账号并发上传)时退回普通的 storage_state 上下文。
+    """
+    directory = profile_dir(account_file)
+    state = load_storage_state(account_file)
+    if persistent_profiles_enabled() and directory not in _profiles_in_use and _lock_profile(directory):
+        os.utime(directory)  # cleanup 按目录 mtime 判断是否长期未用
+        context_options = {k: v for k, v in options.items() if k != 'storage_state'}
+        try:
+            context = await browser_type.launch_persistent_context(str(directory), **context_options)
+        except BaseException:
+            _unlock_profile(directory)
+            raise
+        # 浏览器被关闭或崩溃时也会触发 close，失败路径不用额外释放；裁剪缓存放到线程里，不阻塞其他上传
+        context.on("close", lambda _: _releasing.setdefault(
+            context, asyncio.ensure_future(asyncio.to_thread(_release, directory))))
+        await context.clear_cookies()
+        if state and state.get('cookies'):
+            await context.add_cookies(state['cookies'])
+        return None, context
+
+    launch_options = {k: options[k] for k in ('headless', 'executable_path', 'proxy', 'args') if k in options}
+    browser = await browser_type.launch(**launch_options)
+    context_options = {k: v for k, v in options.items() if k not in launch_options}
+    context = await browser.new_context(storage_state=state or str(account_file), **context_options)
+    return browser, context
+
+
+def _lock_profile(directory: Path) -> bool:
+    """创建 profile 锁文件(O_EXCL)，已被其他进程持有时返回 False；持有者是本机已退出的进程时接管。"""
+    directory.mkdir(parents=True, exist_ok=True)
+    lock_file = directory / PROFILE_LOCK
+    for _ in range(2):
+        try:
+            fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not _clear_stale_lock(lock_file):
+                return False
+            continue
+        os.write(fd, f"{socket.gethostname()} {os.getpid()}".encode('utf-8'))
+        _profiles_in_use[directory] = fd
+        return True
+    return False
+
+
+def _clear_stale_lock(lock_file: Path) -> bool:
+    """
+    锁文件的持有者已经退出时删除它并返回 True。
+    POSIX 上按 "主机名 pid" 检查本机进程是否还在；Windows 上持有者打开着锁文件，删得掉就说明它已经退出。
+    """
+    if os.name != 'nt':
+        try:
+            host, pid = lock_file.read_text(encoding='utf-8').split()
+            pid = int(pid)
+        except (OSError, ValueError):
+            return False  # 刚创建、还没写入内容
+        if host != socket.gethostname():
+            return False
+        try:
+            os.kill(pid, 0)
+            return False
+        except ProcessLookupError:
+            pass
+        except OSError:
+            return False
+    try:
+        lock_file.unlink(missing_ok=True)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock_profile(directory: Path):
+    fd = _profiles_in_use.pop(directory, None)
+    if fd is None:
+        return
+    os.close(fd)
+    (directory / PROFILE_LOCK).unlink(missing_ok=True)
+
+
+def _release(directory):
+    try:
+        trim_profile(directory)
+    except OSError:
+        pass
+    finally:
+        _unlock_profile(directory)
+
+
+async def close_context(browser, context):
+    await context.close()
+    release = _releasing.pop(context, None)
+    if release is not None:
+        await release
+    if browser is not None:
+        await browser.close()
+
+
+def profile_locked(directory: Path) -> bool:
+    """profile 正在被本进程或其他进程使用。"""
+    lock_file = directory / PROFILE_LOCK
+    return directory in _profiles_in_use or (lock_file.exists() and not _clear_stale_lock(lock_file))
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def trim_profile(directory: Path, cap_bytes=PROFILE_SIZE_CAP) -> int:
+    """profile 超过上限时按访问时间从旧到新删除缓存文件，返回删除的字节数。"""
+    total = _dir_size(directory)
+    if total <= cap_bytes:
+        return 0
+    cache_files = []
+    for name in CACHE_DIRS:
+        for cache_dir in directory.rglob(name):
+            if cache_dir.is_dir():
+                cache_files.extend(f for f in cache_dir.rglob("*") if f.is_file())
+    removed = 0
+    for cache_file in sorted(cache_files, key=lambda f: f.stat().st_atime):
+        if total - removed <= cap_bytes:
+            break
+        size = cache_file.stat().st_size
+        cache_file.unlink(missing_ok=True)
+        removed += size
+    return removed
+
+
+def cleanup_profiles(max_idle_days=PROFILE_MAX_IDLE_DAYS, cap_bytes=PROFILE_SIZE_CAP, dry_run=False):
+    """
+    删除 cookie json 已不存在或超过 max_idle_days 天未使用的 profile，其余的裁剪到 cap_bytes。
+    返回 [(profile 目录, 动作, 字节数)]。
+    """
+    results = []
+    if not PROFILES_DIR.exists():
+        return results
+    for directory in sorted(PROFILES_DIR.glob("*/*")):
+        if not directory.is_dir() or profile_locked(directory):
+            continue
+        account_file = Path(BASE_DIR) / "cookies" / directory.parent.name / f"{directory.name}.json"
+        size = _dir_size(directory)
+        idle_days = (time.time() - directory.stat().st_mtime) / 86400
+        if not account_file.exists() or idle_days > max_idle_days:
+            if not dry_run:
+                shutil.rmtree(directory, ignore_errors=True)
+            results.append((directory, "removed", size))
+        elif size > cap_bytes:
+            removed = size - cap_bytes if dry_run else trim_profile(directory, cap_bytes)
+            results.append((directory, "trimmed", removed))
+        else:
+            results.append((directory, "kept", size))
+    return results
@@ -0,0 +1,97 @@
+import json
+import os
+import time
+
+EXPIRY_MARGIN = 3600  # 关键 cookie 至少还要有效这么久(秒)，否则上传途中可能掉登录
+
+
+class SessionCookieRule(object):
+    """
+    某平台登录态依赖的 cookie：names 全部存在且未过期才可能有效。
+    trust_hours: cookie 文件在这段时间内刷新过(上传或登录成功后会写回)就直接认为有效，
+    超过后即使 expires 还很远也交给浏览器检查，因为服务端可能已经让会话失效。
+    """
+
+    def __init__(self, names, domain=None, trust_hours=24):
+        self.names = tuple(names)
+        self.domain = domain
+        self.trust_seconds = trust_hours * 3600
+
+    def matches_domain(self, cookie_domain) -> bool:
+        if self.domain is None or cookie_domain is None:
+            return True
+        host = cookie_domain.lstrip('.')
+        return host == self.domain or host.endswith('.' + self.domain)
+
+
+SESSION_COOKIE_RULES = {
+    "douyin": SessionCookieRule(["sessionid", "sid_guard"], "douyin.com"),
+    "tencent": SessionCookieRule(["sessionid", "wxuin"], "channels.weixin.qq.com", trust_hours=12),
+    "kuaishou": SessionCookieRule(["kuaishou.web.cp.api_st", "userId"], "kuaishou.com"),
+    "tiktok": SessionCookieRule(["sessionid", "sid_tt"], "tiktok.com"),
+    "bilibili": SessionCookieRule(["SESSDATA", "bili_jct"], trust_hours=72),
+    "baijiahao": SessionCookieRule(["BDUSS"], "baidu.com"),
+    "xhs": SessionCookieRule(["web_session"], "xiaohongshu.com"),
+}
+
+
+def _cookies(state: dict):
+    """
+    账号文件里的 cookie 列表：playwright storage_state 的 cookies、biliup 登录文件的 cookie_info.cookies，
+    或 xhs 的 {"cookie": "a1=...; web_session=..."}(没有过期时间，按会话 cookie 处理)。格式不认识时返回 None。
+    """
+    if not isinstance(state, dict):
+        return None
+    if 'cookies' in state:
+        return state['cookies']
+    if 'cookie_info' in state:
+        return state['cookie_info'].get('cookies', [])
+    if isinstance(state.get('cookie'), str):
+        pairs = (item.partition('=') for item in state['cookie'].split(';'))
+        return [{"name": name.strip(), "value": value.strip()} for name, _, value in pairs if name.strip()]
+    return None
+
+
+def estimate_validity(platform, account_file, now=None):
+    """
+    只看 cookie 文件判断登录态：True 有效，False 肯定无效，None 无法确定(需要浏览器检查)。
+
+    - 关键 cookie 缺失，或在 EXPIRY_MARGIN 内过期 -> False
+    - 关键 cookie 都还有效，且文件在 trust_hours 内刷新过 -> True
+    - 其余情况(刷新太久、没有该平台的规则、文件格式不认识) -> None
+    """
+    rule = SESSION_COOKIE_RULES.get(platform)
+    if rule is None:
+        return None
+    now = now or time.time()
+    try:
+        refreshed = os.stat(account_file).st_mtime
+        with open(account_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError):
+        return None
+    if _cookies(state) is None:
+        return None
+
+    expires = session_expiry(rule, state)
+    if expires is None or expires < now + EXPIRY_MARGIN:
+        return False
+    if now - refreshed <= rule.trust_seconds:
+        return True
+    return None
+
+
+def session_expiry(rule: SessionCookieRule, state: dict):
+    """关键 cookie 中最早的过期时间；会话 cookie 记为 inf，缺少任一关键 cookie 时返回 None。"""
+    found = {}
+    for cookie in _cookies(state) or []:
+        if cookie.get('name') in rule.names and rule.matches_domain(cookie.get('domain')):
+            expires = cookie.get('expires', -1)
+            expires = float('inf') if expires in (-1, None) else expires  # 会话 cookie 没有过期时间
+            # 同名 cookie 出现在多个子域时取最晚过期的那个
+            found[cookie['name']] = max(found.get(cookie['name'], 0), expires)
+    if set(found) != set(rule.names):
+        return None
+    return min(found.values())
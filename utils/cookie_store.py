@@ -0,0 +1,247 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from conf import BASE_DIR
+
+COOKIES_DIR = Path(BASE_DIR) / "cookies"
+DEFAULT_COOKIE_DB = COOKIES_DIR / "cookies.db"
+MTIME_TOLERANCE = 0.01  # 文件系统 mtime 精度误差，导出后的文件不会被当成新文件再次导入
+STORE_RETRIES = 5  # 并发写入冲突时合并重试的次数
+# 旧版 cookie 目录名里的平台简称(cookies/ks_uploader、cookies/tk_uploader)-> 平台名
+PLATFORM_ALIASES = {"ks": "kuaishou", "tk": "tiktok"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    platform TEXT NOT NULL,
+    account TEXT NOT NULL,
+    state TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated REAL NOT NULL,
+    valid INTEGER,
+    checked REAL,
+    PRIMARY KEY (platform, account)
+);
+CREATE INDEX IF NOT EXISTS accounts_valid ON accounts (platform, valid);
+"""
+
+
+def account_key(account_file):
+    """cookies/<platform>_uploader/<account>.json -> (platform, account)，旧目录名的简称换成平台名(ks -> kuaishou)"""
+    account_file = Path(account_file)
+    platform = account_file.parent.name
+    if platform.endswith("_uploader"):
+        platform = platform[:-len("_uploader")]
+    return PLATFORM_ALIASES.get(platform, platform), account_file.stem
+
+
+def account_file_for(platform, account) -> Path:
+    return COOKIES_DIR / f"{platform}_uploader" / f"{account}.json"
+
+
+class CookieStore(object):
+    """
+    所有账号 cookie(storage_state)的索引存储，SQLite WAL 模式，多个 worker 进程可同时读写。
+
+    每行带 version，每次写入加一；put(..., base_version=n) 时只有当前版本仍为 n 才写入，用于检测并发覆盖。
+    valid/checked 记录最近一次校验结果，"所有有效的抖音账号" 之类的查询不用再逐个打开 json。
+    cookies/<platform>_uploader/<account>.json 仍然保留：写入时同步导出，文件比库里新时(例如手动替换、
+    旧版本登录流程)读取时自动导入，两边保持兼容。
+
+    WAL 依赖共享内存，数据库文件只能放在本机磁盘上(与放在共享存储上的 job_queue.db 不同)。
+    """
+
+    def __init__(self, path=DEFAULT_COOKIE_DB):
+        self.path = str(path)
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        # 以前按目录名的简称记录的账号改成平台名；两种都有时保留平台名那条，文件更新时会再导入
+        for alias, platform in PLATFORM_ALIASES.items():
+            conn.execute("UPDATE OR IGNORE accounts SET platform = ? WHERE platform = ?", (platform, alias))
+            conn.execute("DELETE FROM accounts WHERE platform = ?", (alias,))
+
+    def _conn(self) -> sqlite3.Connection:
+        # 上传流程会在线程池里写 cookie，每个线程用自己的连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def get(self, platform, account):
+        """返回 (storage_state, version)，不存在返回 (None, 0)。"""
+        row = self._conn().execute("SELECT state, version FROM accounts WHERE platform = ? AND account = ?",
+                                   (platform, account)).fetchone()
+        if row is None:
+            return None, 0
+        return json.loads(row[0]), row[1]
+
+    def put(self, platform, account, state: dict, base_version=None, updated=None, valid=None):
+        """
+        写入并返回新版本号；指定 base_version 且已被其他进程更新时不写入，返回 None。
+        valid: 写入的 cookie 是否已知有效(上传/登录成功后保存的)；None 表示来源未知(例如导入的文件)，清空校验结果。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT version FROM accounts WHERE platform = ? AND account = ?",
+                               (platform, account)).fetchone()
+            version = row[0] if row else 0
+            if base_version is not None and base_version != version:
+                conn.execute("ROLLBACK")
+                return None
+            conn.execute(
+                "INSERT INTO accounts (platform, account, state, version, updated, valid, checked) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (platform, account) DO UPDATE SET state = excluded.state, version = excluded.version, "
+                "updated = excluded.updated, valid = excluded.valid, checked = excluded.checked",
+                (platform, account, json.dumps(state, ensure_ascii=False, separators=(',', ':')), version + 1,
+                 updated or time.time(), None if valid is None else int(bool(valid)),
+                 None if valid is None else time.time()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return version + 1
+
+    def mark_checked(self, platform, account, valid: bool):
+        self._conn().execute("UPDATE accounts SET valid = ?, checked = ? WHERE platform = ? AND account = ?",
+                             (int(bool(valid)), time.time(), platform, account))
+
+    def delete(self, platform, account):
+        self._conn().execute("DELETE FROM accounts WHERE platform = ? AND account = ?", (platform, account))
+
+    def accounts(self, platform=None, valid=None) -> list:
+        """[(platform, account, version, updated, valid, checked)]，valid=True/False 按最近一次校验结果过滤。"""
+        sql = "SELECT platform, account, version, updated, valid, checked FROM accounts WHERE 1 = 1"
+        params = []
+        if platform is not None:
+            sql += " AND platform = ?"
+            params.append(platform)
+        if valid is not None:
+            sql += " AND valid = ?"
+            params.append(int(bool(valid)))
+        return self._conn().execute(sql + " ORDER BY platform, account", params).fetchall()
+
+    def updated(self, platform, account) -> float:
+        row = self._conn().execute("SELECT updated FROM accounts WHERE platform = ? AND account = ?",
+                                   (platform, account)).fetchone()
+        return row[0] if row else 0
+
+    def import_file(self, account_file, force=False) -> bool:
+        """导入一个 cookie json；库里已有同样新或更新的版本时跳过。"""
+        account_file = Path(account_file)
+        platform, account = account_key(account_file)
+        mtime = account_file.stat().st_mtime
+        if not force and self.updated(platform, account) + MTIME_TOLERANCE >= mtime:
+            return False
+        try:
+            with open(account_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except ValueError:
+            return False
+        if state == self.get(platform, account)[0]:
+            return False
+        self.put(platform, account, state, updated=mtime)
+        return True
+
+    def import_files(self, root=COOKIES_DIR, force=False) -> int:
+        return sum(self.import_file(f, force) for f in sorted(Path(root).glob("*_uploader/*.json")))
+
+    def export_file(self, platform, account, path=None) -> Path:
+        from utils.storage_state import write_storage_state
+        state, _ = self.get(platform, account)
+        if state is None:
+            raise KeyError(f"{platform}/{account} not in cookie store")
+        path = Path(path) if path else account_file_for(platform, account)
+        write_storage_state(path, state)
+        # 让文件的 mtime 与库里一致，避免下次被当成更新的文件再导入
+        updated = self.updated(platform, account)
+        os.utime(path, (updated, updated))
+        return path
+
+    def export_files(self, root=COOKIES_DIR) -> int:
+        rows = self.accounts()
+        for platform, account, *_ in rows:
+            self.export_file(platform, account, Path(root) / f"{platform}_uploader" / f"{account}.json")
+        return len(rows)
+
+
+_store = None
+_store_lock = threading.Lock()
+# 账号文件 -> 本进程上下文加载 cookie 时库里的版本(上次保存之后最早的一次)，保存时据此发现别的进程的更新
+_loaded_versions = {}
+
+
+def get_cookie_store() -> CookieStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CookieStore()
+        return _store
+
+
+def load_storage_state(account_file):
+    """给浏览器上下文用的 storage_state：优先取库里的；cookie 文件更新时先导入。库里和文件都没有时返回 None。"""
+    store = get_cookie_store()
+    account_file = Path(account_file)
+    if account_file.exists():
+        store.import_file(account_file)
+    state, version = store.get(*account_key(account_file))
+    if state is not None:
+        _loaded_versions.setdefault(str(account_file.resolve()), version)
+    return state
+
+
+def merge_concurrent_states(current: dict, new: dict) -> dict:
+    """
+    两个进程先后保存同一账号时合并：同一个 cookie 取过期时间更晚的(一样时取 new)，其余取并集，
+    localStorage 冲突时以 new 为准。不是 storage_state 格式(例如 biliup 登录文件)时直接用 new。
+    """
+    if not isinstance(current, dict) or 'cookies' not in current or 'cookies' not in new:
+        return new
+
+    def key(cookie):
+        return cookie['name'], cookie.get('domain'), cookie.get('path', '/')
+
+    def expires(cookie):
+        value = cookie.get('expires', -1)
+        return float('inf') if value in (-1, None) else value
+
+    cookies = {key(c): c for c in current['cookies']}
+    for cookie in new['cookies']:
+        old = cookies.get(key(cookie))
+        if old is None or expires(cookie) >= expires(old):
+            cookies[key(cookie)] = cookie
+    origins = {o['origin']: o for o in current.get('origins', [])}
+    origins.update({o['origin']: o for o in new.get('origins', [])})
+    return dict(new, cookies=list(cookies.values()), origins=list(origins.values()))
+
+
+def store_storage_state(account_file, state: dict, base_version=None):
+    """
+    写入库并同步导出到 cookie 文件，保存的都是登录着的会话，校验结果记为有效。
+    base_version: 这份 cookie 所基于的版本，默认取本进程加载该账号时的版本。库里的版本更新时
+    (例如保活进程刚刷新过)先和库里的合并再写；写入时又被抢先则重新合并，最多重试 STORE_RETRIES 次。
+    """
+    store = get_cookie_store()
+    platform, account = account_key(account_file)
+    if base_version is None:
+        base_version = _loaded_versions.pop(str(Path(account_file).resolve()), None)
+    for _ in range(STORE_RETRIES):
+        current, version = store.get(platform, account)
+        if base_version is not None and version != base_version:
+            state = merge_concurrent_states(current, state)
+        if store.put(platform, account, state, base_version=version, valid=True) is not None:
+            break
+        base_version = version
+    else:
+        raise RuntimeError(f"{platform}/{account}: cookie store kept changing, gave up after {STORE_RETRIES} tries")
+    store.export_file(platform, account, account_file)
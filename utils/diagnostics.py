@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+from collections import deque
+from pathlib import Path
+
+from conf import BASE_DIR, DIAGNOSTICS_TRACE
+
+DIAGNOSTICS_DIR = Path(BASE_DIR) / "logs" / "diagnostics"
+DIAGNOSTICS_QUOTA_BYTES = 200 * 1024 * 1024  # 200 MB，超出时删除最早的诊断目录
+RING_SIZE = 8  # 内存里最多保留的快照数
+SNAPSHOT_MIN_INTERVAL = 3  # 两次快照之间的最小间隔(秒)，发布循环里频繁调用也不会真的频繁截图
+SNAPSHOT_QUALITY = 40
+
+# 页面摘要：比截图便宜得多，失败时通常比图片更有用(弹窗、报错提示、按钮状态)
+DOM_SUMMARY_JS = """() => {
+    const visible = el => !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+    const texts = (selector, limit) => Array.from(document.querySelectorAll(selector))
+        .filter(visible).map(el => (el.innerText || '').trim().slice(0, 120)).filter(Boolean).slice(0, limit);
+    return {
+        url: location.href,
+        title: document.title,
+        buttons: texts('button, [role="button"]', 30),
+        alerts: texts('[role="alert"], [role="dialog"], [class*="toast"], [class*="error"], [class*="modal"]', 10),
+    };
+}"""
+
+
+class UploadDiagnostics(object):
+    """
+    单次上传的诊断信息：等待循环里调用 snapshot()，只在内存环形缓冲里保留最近 RING_SIZE 张
+    低质量视口截图和页面摘要；上传失败时 persist() 才写到 logs/diagnostics/ 下(总量受配额限制)。
+
+    conf.DIAGNOSTICS_TRACE 或环境变量 SAU_DIAG_TRACE=1 时额外录制 Playwright trace，同样只在失败时保存。
+    """
+
+    def __init__(self, platform: str, video_file: str, logger=None):
+        self.name = f"{platform}_{Path(video_file).stem}"
+        self.logger = logger
+        self.frames = deque(maxlen=RING_SIZE)
+        self.trace = DIAGNOSTICS_TRACE or os.environ.get("SAU_DIAG_TRACE") == "1"
+        self._context = None
+        self._tracing = False
+        self._last_snapshot = 0
+
+    async def attach(self, context):
+        """绑定浏览器上下文，需要时开始录制 trace。"""
+        self._context = context
+        if self.trace:
+            try:
+                await context.tracing.start(screenshots=True, snapshots=True)
+                self._tracing = True
+            except Exception as e:
+                self._log("warning", f"[diagnostics] 无法开始录制 trace: {e}")
+
+    async def snapshot(self, page, label=""):
+        """记录一张视口截图和页面摘要；距上次快照不足 SNAPSHOT_MIN_INTERVAL 秒时直接返回。"""
+        now = time.monotonic()
+        if now - self._last_snapshot < SNAPSHOT_MIN_INTERVAL:
+            return
+        self._last_snapshot = now
+        frame = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "label": label}
+        try:
+            frame["summary"] = await page.evaluate(DOM_SUMMARY_JS)
+            frame["image"] = await page.screenshot(type="jpeg", quality=SNAPSHOT_QUALITY, animations="disabled",
+                                                   caret="hide", timeout=2000)
+        except Exception as e:
+            # 诊断信息只是辅助，拿不到也不能影响上传
+            frame["error"] = str(e)
+        self.frames.append(frame)
+
+    async def persist(self):
+        """上传失败时调用：把缓冲里的快照(以及 trace)写到磁盘，返回目录路径。"""
+        target = DIAGNOSTICS_DIR / f"{self.name}_{time.strftime('%Y%m%d_%H%M%S')}"
+        try:
+            target.mkdir(parents=True, exist_ok=True)
+            if self._tracing:
+                self._tracing = False
+                await self._context.tracing.stop(path=target / "trace.zip")
+            await asyncio.to_thread(self._write_frames, target, list(self.frames))
+            await asyncio.to_thread(enforce_quota)
+        except Exception as e:
+            self._log("warning", f"[diagnostics] 保存诊断信息失败: {e}")
+            return None
+        self._log("info", f"[diagnostics] 失败现场已保存到 {target}")
+        return target
+
+    @staticmethod
+    def _write_frames(target: Path, frames):
+        summaries = []
+        for index, frame in enumerate(frames):
+            image = frame.pop("image", None)
+            if image:
+                frame["image"] = f"frame_{index:02d}.jpg"
+                (target / frame["image"]).write_bytes(image)
+            summaries.append(frame)
+        with open(target / "frames.json", "w", encoding="utf-8") as f:
+            json.dump(summaries, f, ensure_ascii=False, indent=2)
+
+    def _log(self, level, message):
+        if self.logger is not None:
+            getattr(self.logger, level)(message)
+
+
+def enforce_quota(quota_bytes=DIAGNOSTICS_QUOTA_BYTES):
+    """诊断目录总大小超过配额时，从最早的开始删除。"""
+    if not DIAGNOSTICS_DIR.exists():
+        return
+    runs = []
+    total = 0
+    for run in DIAGNOSTICS_DIR.iterdir():
+        if not run.is_dir():
+            continue
+        size = sum(f.stat().st_size for f in run.rglob("*") if f.is_file())
+        runs.append((run.stat().st_mtime, size, run))
+        total += size
+    for _, size, run in sorted(runs):
+        if total <= quota_bytes:
+            break
+        shutil.rmtree(run, ignore_errors=True)
+        total -= size
@@ -2,6 +2,7 @@ from datetime import timedelta
 
 from datetime import datetime
 from pathlib import Path
+import hashlib
 
 from conf import BASE_DIR
 from utils.log import douyin_logger
@@ -53,6 +54,24 @@ def get_title_and_hashtags(filename):
     return title, hashtags
 
 
+def get_file_digest(filename, chunk_size=1024 * 1024) -> str:
+    """
+  计算文件内容的 sha256(十六进制)，大文件分块读取
+
+  Args:
+    filename: 文件路径
+    chunk_size: 每次读取的字节数
+
+  Returns:
+    sha256 十六进制字符串
+  """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def generate_schedule_time_next_day(total_videos, videos_per_day, daily_times=None, timestamps=False, start_days=0):
     """
     Generate a schedule for video uploads, starting from the next day.
@@ -0,0 +1,310 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from conf import BASE_DIR
+from utils.base_social_media import UploadJob
+
+DEFAULT_QUEUE_PATH = Path(BASE_DIR) / "job_queue.db"
+DEFAULT_VISIBILITY_TIMEOUT = 300  # 秒，租约(和账号归属)在这么久没有心跳后失效
+DEFAULT_MAX_ATTEMPTS = 3
+POLL_INTERVAL = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_key TEXT NOT NULL UNIQUE,
+    account TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, account);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    host TEXT,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS account_owners (
+    platform TEXT NOT NULL,
+    account TEXT NOT NULL,
+    worker_id TEXT NOT NULL,
+    PRIMARY KEY (platform, account)
+);
+"""
+
+
+def job_to_payload(job: UploadJob) -> str:
+    data = dict(vars(job))
+    if isinstance(job.publish_date, datetime):
+        data['publish_date'] = job.publish_date.strftime('%Y-%m-%d %H:%M')
+    # 项目目录下的文件存相对路径，各节点按自己的 BASE_DIR 还原(videos 目录放在共享存储上即可)
+    for field in ('video_file', 'thumbnail_path'):
+        data[field] = _to_relative(data[field])
+    if data.get('parts'):
+        data['parts'] = [dict(part, video_file=_to_relative(part['video_file'])) for part in data['parts']]
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _to_relative(path):
+    if path and Path(path).is_relative_to(BASE_DIR):
+        return Path(path).relative_to(BASE_DIR).as_posix()
+    return path
+
+
+def job_from_payload(payload: str) -> UploadJob:
+    data = json.loads(payload)
+    if data.get('publish_date'):
+        data['publish_date'] = datetime.strptime(data['publish_date'], '%Y-%m-%d %H:%M')
+    for field in ('video_file', 'thumbnail_path'):
+        if data[field]:
+            data[field] = str(Path(BASE_DIR) / data[field])
+    if data.get('parts'):
+        data['parts'] = [dict(part, video_file=str(Path(BASE_DIR) / part['video_file'])) for part in data['parts']]
+    return UploadJob(**data)
+
+
+class JobQueue(object):
+    """
+    基于 SQLite 的租约式任务队列，多台上传机共享同一个数据库文件即可分布式执行。
+
+    - claim: 领取一个任务并获得 visibility_timeout 秒的租约；只领取本机有 cookie 的账号
+    - heartbeat: 延长本 worker 所有租约，同时刷新 worker 存活时间
+    - 账号归属：某账号的任务第一次被某 worker 领取后，该账号归这个 worker，其它 worker 不再领取，
+      直到它超过 visibility_timeout 没有心跳(节点挂了)，此时账号和未完成的租约一起被重新分配
+    - 租约过期的任务自动回到队列，超过 max_attempts 次则标记为 failed
+
+    放在共享存储上时保持 SQLite 默认的 rollback journal(WAL 需要共享内存，不能跨机器)。
+    连接可以在多个线程里使用(worker 用 asyncio.to_thread 调用，避免等锁时卡住事件循环)，各操作之间串行。
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = str(path)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE：领取任务时先拿写锁，多个节点同时 claim 也不会领到同一个任务
+        return _Transaction(self.conn, self._lock)
+
+    def enqueue(self, jobs, key_func) -> int:
+        """写入任务，job_key 已存在的跳过(重复执行 enqueue 不会重复上传)，返回新增数量。"""
+        now = time.time()
+        with self._transaction() as cur:
+            before = self.conn.total_changes
+            cur.executemany(
+                "INSERT OR IGNORE INTO jobs (job_key, account, platform, payload, updated) VALUES (?, ?, ?, ?, ?)",
+                [(key_func(job), job.account_name, job.platform, job_to_payload(job), now) for job in jobs])
+            return self.conn.total_changes - before
+
+    def register_worker(self, worker_id):
+        with self._transaction() as cur:
+            cur.execute("INSERT OR REPLACE INTO workers (worker_id, host, last_seen) VALUES (?, ?, ?)",
+                        (worker_id, socket.gethostname(), time.time()))
+
+    def heartbeat(self, worker_id):
+        now = time.time()
+        with self._transaction() as cur:
+            cur.execute("UPDATE workers SET last_seen = ? WHERE worker_id = ?", (now, worker_id))
+            cur.execute("UPDATE jobs SET lease_expires = ? WHERE status = 'leased' AND lease_owner = ?",
+                        (now + self.visibility_timeout, worker_id))
+
+    def _requeue_expired(self, cur, now):
+        cur.execute("UPDATE jobs SET status = 'failed', error = 'lease expired too many times', lease_owner = NULL, "
+                    "updated = ? WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts))
+        cur.execute("UPDATE jobs SET status = 'queued', lease_owner = NULL, updated = ? "
+                    "WHERE status = 'leased' AND lease_expires < ?", (now, now))
+        # 心跳超时的 worker 释放它名下的账号
+        cur.execute("DELETE FROM account_owners WHERE worker_id IN "
+                    "(SELECT worker_id FROM workers WHERE last_seen < ?)", (now - self.visibility_timeout,))
+
+    def claim(self, worker_id, accounts=None):
+        """
+        领取一个任务，返回 (id, UploadJob)，没有可领取的任务返回 None。
+        accounts 为本机可用的 {(platform, account)} 集合，None 表示不限制。
+        """
+        now = time.time()
+        with self._transaction() as cur:
+            self._requeue_expired(cur, now)
+            rows = cur.execute(
+                "SELECT j.id, j.platform, j.account, j.payload, o.worker_id FROM jobs j "
+                "LEFT JOIN account_owners o ON o.platform = j.platform AND o.account = j.account "
+                "WHERE j.status = 'queued' AND (o.worker_id IS NULL OR o.worker_id = ?) "
+                "ORDER BY (o.worker_id IS NULL), j.id", (worker_id,)).fetchall()
+            for job_id, platform, account, payload, owner in rows:
+                if accounts is not None and (platform, account) not in accounts:
+                    continue
+                cur.execute("UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                            "attempts = attempts + 1, updated = ? WHERE id = ?",
+                            (worker_id, now + self.visibility_timeout, now, job_id))
+                if owner is None:
+                    cur.execute("INSERT OR REPLACE INTO account_owners (platform, account, worker_id) VALUES (?, ?, ?)",
+                                (platform, account, worker_id))
+                return job_id, job_from_payload(payload)
+        return None
+
+    def complete(self, job_id, worker_id, ok: bool, error: str = None) -> bool:
+        """
+        上报结果，返回是否仍持有租约；租约已经被别的 worker 接手时忽略，返回 False。
+        失败且还有重试次数的任务回到队列。
+        """
+        now = time.time()
+        with self._transaction() as cur:
+            if ok:
+                cur.execute("UPDATE jobs SET status = 'done', lease_owner = NULL, error = NULL, updated = ? "
+                            "WHERE id = ? AND lease_owner = ?", (now, job_id, worker_id))
+            else:
+                cur.execute("UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                            "lease_owner = NULL, error = ?, updated = ? WHERE id = ? AND lease_owner = ?",
+                            (self.max_attempts, error, now, job_id, worker_id))
+            return cur.rowcount > 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def pending(self, accounts=None) -> int:
+        """还没有结束(queued 或 leased)的任务数，accounts 不为 None 时只统计这些 (platform, account)。"""
+        with self._lock:
+            rows = self.conn.execute("SELECT platform, account, COUNT(*) FROM jobs "
+                                     "WHERE status IN ('queued', 'leased') GROUP BY platform, account").fetchall()
+        return sum(count for platform, account, count in rows if accounts is None or (platform, account) in accounts)
+
+
+class _Transaction(object):
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn.cursor()
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+        return False
+
+
+def local_accounts():
+    """本机有 cookie 的 {(platform, account)}：cookie 库里的账号加上 cookies 目录下的 json 文件。"""
+    from utils.cookie_store import COOKIES_DIR, account_key, get_cookie_store
+    accounts = {(platform, account) for platform, account, *_ in get_cookie_store().accounts()}
+    for cookie_file in COOKIES_DIR.glob("*_uploader/*.json"):
+        accounts.add(account_key(cookie_file))
+    return accounts
+
+
+async def run_queue_worker(queue_path=DEFAULT_QUEUE_PATH, worker_id=None, concurrency=2,
+                           visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, memory_budget=None, rate_limits=None,
+                           workflow_config=None):
+    """
+    从共享队列领取并执行任务，直到本机账号没有未完成的任务(包括别的节点持有、可能因节点挂掉而被重新分配的任务)。
+    同一时间最多执行 concurrency 个任务，执行中每 visibility_timeout/3 秒发一次心跳。
+    workflow_config 配置了 "archive" 时，成功且租约仍归本 worker 的任务记入发布账本(enqueue 据此跳过已发布的视频)，
+    所有平台都发布过的视频随之归档；账本需要和 enqueue 所在的节点共用(放在共享存储上)。
+    """
+    from utils.archive import archive_published
+    from utils.log import workflow_logger
+    from utils.workflow import DEFAULT_MEMORY_BUDGET, WorkflowScheduler, prepare_uploaders
+    from utils.rate_limit import RateLimiter
+
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    queue = JobQueue(queue_path, visibility_timeout)
+    queue.register_worker(worker_id)
+    accounts = local_accounts()
+    scheduler = WorkflowScheduler(memory_budget or DEFAULT_MEMORY_BUDGET, RateLimiter(rate_limits))
+    uploaders = {}
+    running = set()
+    workflow_logger.info(f"Queue worker {worker_id} started, {len(accounts)} local accounts, queue {queue.path}")
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(visibility_timeout / 3)
+            # 一次失败(例如共享存储上的库被锁住超时)不能让心跳停掉，否则租约过期、任务被别的节点重复上传
+            try:
+                await asyncio.to_thread(queue.heartbeat, worker_id)
+            except Exception as e:
+                workflow_logger.warning(f"Queue worker {worker_id} heartbeat failed: {e}")
+
+    async def run(job_id, job):
+        key = (job.platform, job.account_name)
+        error = None
+        try:
+            if key not in uploaders:
+                uploaders.update(await prepare_uploaders([job]))
+            if key not in uploaders:
+                ok, error = False, "invalid cookie"
+            else:
+                with workflow_logger.contextualize(job=job.name, account=job.account_name, platform=job.platform):
+                    ok = await scheduler.run_job(job, uploaders[key])
+        except Exception as e:
+            ok, error = False, str(e)
+            workflow_logger.opt(exception=e).error(f"Upload {job.name} failed with unexpected error: {e}")
+        try:
+            owned = await asyncio.to_thread(queue.complete, job_id, worker_id, ok, error)
+        except Exception as e:
+            # 结果没写进去：租约过期后任务会回到队列
+            workflow_logger.error(f"Queue job {job.name} {'done' if ok else 'failed'}, but reporting failed: {e}")
+            return
+        if not owned:
+            # 租约已经过期并交给了别的 worker，结果以它为准
+            workflow_logger.warning(f"Queue job {job.name} finished after its lease was taken over, result ignored")
+            return
+        workflow_logger.info(f"Queue job {job.name} {'done' if ok else 'failed'}")
+        if ok and workflow_config:
+            try:
+                await asyncio.to_thread(archive_published, workflow_config, [job], {job.key: True})
+            except Exception as e:
+                workflow_logger.error(f"Queue job {job.name} done, but recording it in the archive failed: {e}")
+
+    heartbeat_task = asyncio.ensure_future(heartbeat())
+    try:
+        while True:
+            claimed = None
+            if len(running) < concurrency:
+                claimed = await asyncio.to_thread(queue.claim, worker_id, accounts)
+            if claimed is not None:
+                task = asyncio.ensure_future(run(*claimed))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                continue
+            if not running and await asyncio.to_thread(queue.pending, accounts) == 0:
+                break
+            # 没有可领的任务(或并发已满)：等一个任务结束，或者过一会儿再看看别的节点释放的任务
+            await asyncio.wait(running or {asyncio.ensure_future(asyncio.sleep(POLL_INTERVAL))},
+                               timeout=POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        heartbeat_task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        workflow_logger.info(f"Queue worker {worker_id} finished: {queue.stats()}")
+        queue.close()
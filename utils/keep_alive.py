@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+from utils.cookie_expiry import SESSION_COOKIE_RULES, session_expiry
+from utils.cookie_store import COOKIES_DIR, account_key, get_cookie_store, store_storage_state
+from utils.log import workflow_logger
+from utils.session_probe import SessionProber
+from utils.storage_state import merge_storage_state
+
+KEEPALIVE_INTERVAL = 3600  # 两轮保活之间的间隔(秒)
+REFRESH_AFTER = 12 * 3600  # cookie 文件在这段时间内刷新过的账号本轮跳过
+DEFAULT_HTTP_CONCURRENCY = 10
+DEFAULT_BROWSER_SLOTS = 1  # 同时打开的浏览器数
+DEFAULT_BROWSER_VISITS = 5  # 每轮最多打开浏览器访问的账号数，接口刷新不了 cookie 时才用
+
+# 接口没有下发新 cookie 时，用浏览器短暂访问创作者中心来续期
+BROWSER_VISIT_URLS = {
+    "douyin": "https://creator.douyin.com/creator-micro/home",
+    "tencent": "https://channels.weixin.qq.com/platform",
+    "kuaishou": "https://cp.kuaishou.com/profile",
+    "tiktok": "https://www.tiktok.com/tiktokstudio",
+    "baijiahao": "https://baijiahao.baidu.com/builder/rc/home",
+}
+
+
+class KeepAliveAccount(object):
+    def __init__(self, platform, account_file, expires, refreshed):
+        self.platform = platform
+        self.account_file = Path(account_file)
+        self.expires = expires  # 关键 cookie 中最早的过期时间
+        self.refreshed = refreshed  # cookie 文件最近一次写入时间
+
+    @property
+    def name(self):
+        return f"{self.platform}/{self.account_file.stem}"
+
+
+def keep_alive_candidates(now=None, refresh_after=REFRESH_AFTER, cookies_dir=COOKIES_DIR) -> list:
+    """需要保活的账号，最快过期的排在最前；已经过期(只能重新扫码)和最近刷新过的不在其中。"""
+    now = now or time.time()
+    candidates = []
+    for account_file in Path(cookies_dir).glob("*_uploader/*.json"):
+        platform, _ = account_key(account_file)
+        rule = SESSION_COOKIE_RULES.get(platform)
+        if rule is None:
+            continue
+        try:
+            refreshed = os.stat(account_file).st_mtime
+            with open(account_file, 'r', encoding='utf-8') as f:
+                expires = session_expiry(rule, json.load(f))
+        except (OSError, ValueError):
+            continue
+        if expires is None or expires < now or now - refreshed < refresh_after:
+            continue
+        candidates.append(KeepAliveAccount(platform, account_file, expires, refreshed))
+    candidates.sort(key=lambda a: (a.expires, a.refreshed))
+    return candidates
+
+
+def apply_new_cookies(state: dict, cookies: list) -> dict:
+    """把接口下发的 cookie 合并进账号文件的内容(playwright storage_state 或 biliup 登录文件)。"""
+    if 'cookies' in state:
+        return dict(state, **merge_storage_state(
+            {"cookies": state['cookies'], "origins": state.get('origins', [])}, {"cookies": cookies, "origins": []}))
+    cookie_info = state.get('cookie_info', {})
+    by_name = {c['name']: c for c in cookie_info.get('cookies', [])}
+    for cookie in cookies:
+        if cookie['name'] in by_name:
+            by_name[cookie['name']].update(value=cookie['value'], expires=int(cookie['expires']))
+    return state
+
+
+class KeepAliveScheduler(object):
+    """
+    定期给各账号续期登录态，避免 cookie 过期后只能人工扫码重新登录。
+
+    每轮按关键 cookie 的过期时间从近到远处理：先用 session_probe 的登录接口请求一次，
+    接口下发了新 cookie 就合并写回；没有下发时，在预算内用无头浏览器短暂访问创作者中心并保存 storage_state。
+    资源预算：HTTP 并发 http_concurrency，浏览器同时最多 browser_slots 个、每轮最多 browser_visits 次。
+    """
+
+    def __init__(self, http_concurrency=DEFAULT_HTTP_CONCURRENCY, browser_slots=DEFAULT_BROWSER_SLOTS,
+                 browser_visits=DEFAULT_BROWSER_VISITS, refresh_after=REFRESH_AFTER):
+        self.http_concurrency = http_concurrency
+        self.browser_slots = browser_slots
+        self.browser_visits = browser_visits
+        self.refresh_after = refresh_after
+        self._browser_semaphore = None
+        self._visits_left = 0
+
+    async def run_round(self) -> dict:
+        """执行一轮保活，返回 {账号: 结果}，结果为 http / browser / alive / expired / skipped。"""
+        candidates = keep_alive_candidates(refresh_after=self.refresh_after)
+        self._browser_semaphore = asyncio.Semaphore(self.browser_slots)
+        self._visits_left = self.browser_visits
+        workflow_logger.info(f"[keepalive] {len(candidates)} accounts due for refresh")
+        async with SessionProber(self.http_concurrency) as prober:
+            results = await asyncio.gather(*[self._refresh(prober, account) for account in candidates])
+        return {account.name: result for account, result in zip(candidates, results)}
+
+    async def run_forever(self, interval=KEEPALIVE_INTERVAL):
+        while True:
+            results = await self.run_round()
+            summary = {}
+            for result in results.values():
+                summary[result] = summary.get(result, 0) + 1
+            workflow_logger.info(f"[keepalive] round finished: {summary}, next in {interval}s")
+            await asyncio.sleep(interval)
+
+    async def _refresh(self, prober, account: KeepAliveAccount):
+        store = get_cookie_store()
+        key = account_key(account.account_file)
+        try:
+            verdict, cookies = await prober.check(account.platform, account.account_file)
+        except Exception as e:
+            workflow_logger.warning(f"[keepalive] {account.name}: probe failed: {e}")
+            verdict, cookies = None, []
+        if verdict is False:
+            workflow_logger.warning(f"[keepalive] {account.name}: session expired, needs login")
+            await asyncio.to_thread(_mark_checked, store, account.account_file, key, False)
+            return "expired"
+        if verdict and cookies:
+            await asyncio.to_thread(_store_refreshed, account.account_file, cookies)
+            workflow_logger.info(f"[keepalive] {account.name}: refreshed via http")
+            return "http"
+        if account.platform in BROWSER_VISIT_URLS and self._visits_left > 0:
+            self._visits_left -= 1
+            async with self._browser_semaphore:
+                try:
+                    alive = await self._visit(account)
+                except Exception as e:
+                    workflow_logger.warning(f"[keepalive] {account.name}: browser visit failed: {e}")
+                    return "skipped"
+            await asyncio.to_thread(_mark_checked, store, account.account_file, key, alive)
+            if alive:
+                workflow_logger.info(f"[keepalive] {account.name}: refreshed via browser")
+                return "browser"
+            workflow_logger.warning(f"[keepalive] {account.name}: session expired, needs login")
+            return "expired"
+        return "alive" if verdict else "skipped"
+
+    async def _visit(self, account: KeepAliveAccount) -> bool:
+        """无头浏览器打开创作者中心，没有被跳到登录页就保存续期后的 storage_state。"""
+        from playwright.async_api import async_playwright
+        from utils.base_social_media import set_init_script
+        from utils.browser_profile import close_context, open_context
+        from utils.storage_state import save_storage_state
+
+        async with async_playwright() as playwright:
+            browser, context = await open_context(playwright.chromium, account.account_file, headless=True)
+            try:
+                context = await set_init_script(context)
+                page = await context.new_page()
+                await page.goto(BROWSER_VISIT_URLS[account.platform], wait_until="domcontentloaded", timeout=30000)
+                await page.wait_for_timeout(3000)
+                if "login" in page.url.lower():
+                    return False
+                await save_storage_state(context, account.account_file)
+                return True
+            finally:
+                await close_context(browser, context)
+
+
+def _mark_checked(store, account_file, key, valid):
+    store.import_file(account_file)
+    store.mark_checked(*key, valid)
+
+
+def _store_refreshed(account_file, cookies):
+    with open(account_file, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    store_storage_state(account_file, apply_new_cookies(state, cookies))  # 同时记为有效
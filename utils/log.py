@@ -1,8 +1,18 @@
+import json
+import os
+import time
+import traceback
 from pathlib import Path
 from sys import stdout
 from loguru import logger
 
-from conf import BASE_DIR
+from conf import BASE_DIR, LOG_JSON_LINES
+
+LOG_ROTATION_BYTES = 10 * 1024 * 1024  # 10 MB
+LOG_RETENTION_SECONDS = 10 * 24 * 3600  # 10 days
+LOG_FILE_FORMAT = "{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message}\n{exception}"
+# 结构化日志里额外输出的上下文字段，由 logger.bind / logger.contextualize 提供
+LOG_CONTEXT_FIELDS = ("job", "account", "platform")
 
 
 def log_formatter(record: dict) -> str:
@@ -23,6 +33,82 @@ def log_formatter(record: dict) -> str:
     return f"<fg #70acde>{{time:YYYY-MM-DD HH:mm:ss}}</fg #70acde> | <fg {color}>{{level}}</fg {color}>: <light-white>{{message}}</light-white>\n"
 
 
+class RoutingFileSink(object):
+    """
+    所有业务日志共用的一个文件 sink：按 record["extra"]["business_name"] 查表(O(1))写入对应文件。
+
+    以 enqueue=True 注册，写文件发生在 loguru 的后台线程里，不占用事件循环。
+    文件在第一条日志到来时才打开；超过 LOG_ROTATION_BYTES 时轮转，并清理超过保留期的旧文件。
+    json_lines=True 时每行输出一个 JSON 对象，包含 LOG_CONTEXT_FIELDS 中的上下文字段。
+    """
+
+    def __init__(self, json_lines=False):
+        self.json_lines = json_lines
+        self._routes = {}
+        self._files = {}
+
+    def add_route(self, business_name: str, file_path: Path):
+        self._routes[business_name] = Path(file_path)
+
+    def write(self, message):
+        record = message.record
+        business_name = record["extra"].get("business_name")
+        path = self._routes.get(business_name)
+        if path is None:
+            return
+        text = self._format_json(record) if self.json_lines else str(message)
+        file = self._files.get(business_name)
+        if file is None:
+            file = self._open(business_name, path)
+        file.write(text)
+        if file.tell() >= LOG_ROTATION_BYTES:
+            self._rotate(business_name, path)
+
+    def _format_json(self, record) -> str:
+        data = {
+            "time": record["time"].isoformat(),
+            "level": record["level"].name,
+            "business": record["extra"].get("business_name"),
+            "message": record["message"],
+        }
+        for field in LOG_CONTEXT_FIELDS:
+            if field in record["extra"]:
+                data[field] = record["extra"][field]
+        if record["exception"] is not None:
+            data["exception"] = repr(record["exception"].value)
+        return json.dumps(data, ensure_ascii=False, default=str) + "\n"
+
+    def _open(self, business_name, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file = open(path, "a", encoding="utf-8")
+        self._files[business_name] = file
+        return file
+
+    def _rotate(self, business_name, path: Path):
+        self._files.pop(business_name).close()
+        # 同一秒内轮转多次时加序号，不覆盖(Windows 上 rename 到已存在的文件会直接报错)
+        stamp = time.strftime('%Y-%m-%d_%H-%M-%S')
+        target = path.with_name(f"{path.stem}.{stamp}{path.suffix}")
+        counter = 1
+        while target.exists():
+            target = path.with_name(f"{path.stem}.{stamp}.{counter}{path.suffix}")
+            counter += 1
+        path.rename(target)
+        expire_before = time.time() - LOG_RETENTION_SECONDS
+        for old in path.parent.glob(f"{path.stem}.*{path.suffix}"):
+            if old.stat().st_mtime < expire_before:
+                old.unlink(missing_ok=True)
+
+    def flush(self):
+        for file in self._files.values():
+            file.flush()
+
+    def stop(self):
+        for file in self._files.values():
+            file.close()
+        self._files.clear()
+
+
 def create_logger(log_name: str, file_path: str):
     """
     Create custom logger for different business modules.
@@ -30,18 +116,55 @@ def create_logger(log_name: str, file_path: str):
     :param str file_path: Optional path to log file
     :returns: Configured logger
     """
-    def filter_record(record):
-        return record["extra"].get("business_name") == log_name
-
-    Path(BASE_DIR / file_path).parent.mkdir(exist_ok=True)
-    logger.add(Path(BASE_DIR / file_path), filter=filter_record, level="INFO", rotation="10 MB", retention="10 days", backtrace=True, diagnose=True)
+    routing_sink.add_route(log_name, Path(BASE_DIR / file_path))
     return logger.bind(business_name=log_name)
 
 
+def forward_logs(queue):
+    """
+    在多进程 workflow 的 worker 里调用：去掉本进程的控制台和文件 sink，把日志记录发给 coordinator，
+    由 coordinator 用 replay_log_record 统一输出，避免多个进程同时写(和轮转)同一个日志文件。
+    """
+    def sink(message):
+        record = message.record
+        exception = None
+        if record["exception"] is not None:
+            exception = "".join(traceback.format_exception(*record["exception"]))
+        queue.put(("log", {
+            "time": record["time"],
+            "level": record["level"].name,
+            "message": record["message"],
+            "name": record["name"],
+            "function": record["function"],
+            "line": record["line"],
+            "extra": {k: str(v) for k, v in record["extra"].items()},
+            "exception": exception,
+        }))
+
+    logger.remove()
+    logger.add(sink, level="DEBUG", format="{message}")
+
+
+def replay_log_record(payload: dict):
+    """coordinator 侧：按 worker 里的原始时间和位置重新输出一条日志。"""
+    message = payload["message"]
+    if payload["exception"]:
+        message = f"{message}\n{payload['exception']}"
+
+    def patch(record):
+        record.update(time=payload["time"], name=payload["name"], function=payload["function"], line=payload["line"])
+
+    logger.patch(patch).bind(**payload["extra"]).log(payload["level"], message)
+
+
 # Remove all existing handlers
 logger.remove()
 # Add a standard console handler
 logger.add(stdout, colorize=True, format=log_formatter)
+# 所有业务日志文件共用一个异步路由 sink
+routing_sink = RoutingFileSink(json_lines=LOG_JSON_LINES or os.environ.get("SAU_LOG_JSON") == "1")
+logger.add(routing_sink, level="INFO", format=LOG_FILE_FORMAT, enqueue=True, backtrace=False, diagnose=False,
+           filter=lambda record: "business_name" in record["extra"])
 
 douyin_logger = create_logger('douyin', 'logs/douyin.log')
 tencent_logger = create_logger('tencent', 'logs/tencent.log')
@@ -50,3 +173,4 @@ tiktok_logger = create_logger('tiktok', 'logs/tiktok.log')
 bilibili_logger = create_logger('bilibili', 'logs/bilibili.log')
 kuaishou_logger = create_logger('kuaishou', 'logs/kuaishou.log')
 baijiahao_logger = create_logger('baijiahao', 'logs/baijiahao.log')
+workflow_logger = create_logger('workflow', 'logs/workflow.log')
@@ -0,0 +1,176 @@
+import json
+import os
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from conf import BASE_DIR
+
+DEFAULT_DAILY_TIMES = [6, 11, 14, 16, 22]  # 与 generate_schedule_time_next_day 的默认发布时间一致
+DEFAULT_PLAN_FILE = "publish_plan.json"
+DEFAULT_MIN_LEAD_MINUTES = 120  # 抖音等平台要求定时发布至少提前 2 小时
+DEFAULT_HORIZON_DAYS = 14  # 抖音等平台最多只能定时到 14 天后
+PLAN_TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+
+def parse_daily_time(value):
+    """10 -> (10, 0)，"18:30" -> (18, 30)"""
+    if isinstance(value, int):
+        return value, 0
+    hour, minute = str(value).split(':')
+    return int(hour), int(minute)
+
+
+def plan_key(job) -> str:
+    """计划表里的键：平台|账号|视频路径(相对 videos 目录)"""
+    return job.key
+
+
+def fill_daily_times(times, count):
+    """时刻不够 count 个时，反复在相隔最久的两个时刻(最后一个到午夜也算)中间插入一个。"""
+    times = list(times)
+    while len(times) < count:
+        minutes = [h * 60 + m for h, m in times] + [24 * 60]
+        gap, index = max((minutes[i + 1] - minutes[i], i) for i in range(len(times)))
+        if gap < 2:
+            break
+        times.insert(index + 1, divmod(minutes[index] + gap // 2, 60))
+    return times
+
+
+class PlatformSlotRule(object):
+    """
+    某平台每天可用的发布时刻：preferred hours 里最早的 daily_cap 个。
+    daily_cap 比 hours 多时在 hours 之间补足时刻，保证每天确实能发 daily_cap 个。
+    """
+
+    def __init__(self, daily_cap=1, hours=None):
+        daily_cap = max(1, int(daily_cap))
+        times = sorted(set(parse_daily_time(h) for h in (hours or DEFAULT_DAILY_TIMES)))
+        if daily_cap > len(times):
+            print(f"Warning: daily_cap {daily_cap} exceeds the {len(times)} preferred hours, "
+                  f"adding evenly spaced publish times.")
+            times = fill_daily_times(times, daily_cap)
+        self.times = times[:daily_cap]
+        self.daily_cap = len(self.times)
+
+
+class PublishPlanner(object):
+    """
+    把上传任务分配到各 (账号, 平台) 的发布时刻上，保证同一账号同一平台不会撞时刻、每天不超过 daily_cap。
+
+    每个 (账号, 平台) 维护一个游标 = 从第一天 0 点起的第几个时刻，第 n 个任务的时间直接由
+    day = n // daily_cap、slot = n % daily_cap 算出，整个计划一次线性遍历完成。
+    已经在计划文件里且尚未过期的任务保持原时刻，新任务接在该 (账号, 平台) 最后一个时刻之后，
+    超出 horizon_days 的任务留给以后的运行。
+
+    配置来自 workflow_config.json 的 "publish_plan"，例如：
+        "publish_plan": {
+            "min_lead_minutes": 120, "horizon_days": 14,
+            "default": {"daily_cap": 2, "hours": [11, 18]},
+            "platforms": {"douyin": {"daily_cap": 3, "hours": [11, 16, "20:30"]}}
+        }
+    可选 "start"(YYYY-MM-DD) 指定最早日期，"daily_cap" 覆盖所有平台的每日上限，"plan_file" 指定计划文件。
+    """
+
+    def __init__(self, config: dict = None):
+        config = config or {}
+        self.min_lead = timedelta(minutes=config.get('min_lead_minutes', DEFAULT_MIN_LEAD_MINUTES))
+        self.horizon = timedelta(days=config.get('horizon_days', DEFAULT_HORIZON_DAYS))
+        self.plan_file = Path(BASE_DIR) / config.get('plan_file', DEFAULT_PLAN_FILE)
+        self.start = datetime.strptime(config['start'], '%Y-%m-%d') if config.get('start') else None
+        self.daily_cap = config.get('daily_cap')
+        self.default = config.get('default', {})
+        self.platforms = config.get('platforms', {})
+        self._rules = {}
+
+    def rule(self, platform) -> PlatformSlotRule:
+        if platform not in self._rules:
+            rule = dict(self.default, **self.platforms.get(platform, {}))
+            if self.daily_cap:
+                rule['daily_cap'] = self.daily_cap
+            self._rules[platform] = PlatformSlotRule(rule.get('daily_cap', 1), rule.get('hours'))
+        return self._rules[platform]
+
+    def load(self) -> dict:
+        """读取计划文件，返回 {plan_key: datetime}"""
+        if not self.plan_file.exists():
+            return {}
+        with open(self.plan_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return {key: datetime.strptime(value, PLAN_TIME_FORMAT) for key, value in data.get('slots', {}).items()}
+
+    def save(self, slots: dict):
+        data = {
+            "updated": datetime.now().strftime(PLAN_TIME_FORMAT),
+            "slots": {key: when.strftime(PLAN_TIME_FORMAT) for key, when in sorted(slots.items(), key=lambda x: x[1])},
+        }
+        tmp_file = self.plan_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.plan_file)
+
+    def _slot_index(self, rule, day0, when, after=False):
+        """when 所在(或之后第一个)时刻的序号；after=True 时返回严格晚于 when 的第一个时刻。"""
+        day = (when.date() - day0.date()).days
+        clock = (when.hour, when.minute)
+        index = bisect_left(rule.times, clock)
+        if after and index < rule.daily_cap and rule.times[index] == clock:
+            index += 1
+        return day * rule.daily_cap + index
+
+    def plan(self, jobs, existing: dict = None, now: datetime = None) -> dict:
+        """返回 {plan_key: datetime}，包含 existing 中仍有效的时刻和本次新分配的时刻。"""
+        now = now or datetime.now()
+        earliest = now + self.min_lead
+        if self.start and self.start > earliest:
+            earliest = self.start
+        latest = now + self.horizon
+        if self.start and self.start > latest:
+            print(f"Warning: start date {self.start.strftime('%Y-%m-%d')} is more than {self.horizon.days} days ahead, "
+                  f"platforms cannot schedule that far. Nothing will be scheduled until then.")
+        day0 = datetime.combine(earliest.date(), datetime.min.time())
+
+        # 过期的时刻(已经发布过，或者没赶上)丢弃，对应任务重新排
+        slots = {key: when for key, when in (existing or {}).items() if when >= earliest}
+        cursors = {}
+        for key, when in slots.items():
+            platform, account_name, _ = key.split('|', 2)
+            index = self._slot_index(self.rule(platform), day0, when, after=True)
+            cursors[(platform, account_name)] = max(cursors.get((platform, account_name), 0), index)
+
+        for job in jobs:
+            key = plan_key(job)
+            if key in slots:
+                continue
+            rule = self.rule(job.platform)
+            pair = (job.platform, job.account_name)
+            index = cursors.get(pair)
+            if index is None:
+                index = self._slot_index(rule, day0, earliest)
+            day, slot = divmod(index, rule.daily_cap)
+            hour, minute = rule.times[slot]
+            when = day0 + timedelta(days=day, hours=hour, minutes=minute)
+            if when > latest:
+                continue
+            slots[key] = when
+            cursors[pair] = index + 1
+        return slots
+
+
+def apply_publish_plan(jobs, plan_config: dict):
+    """给任务设置 publish_date 并保存计划；超出排期范围的任务不在返回值里，留到以后再上传。"""
+    planner = PublishPlanner(plan_config)
+    slots = planner.plan(jobs, planner.load())
+    planner.save(slots)
+
+    scheduled = []
+    for job in jobs:
+        when = slots.get(plan_key(job))
+        if when is None:
+            print(f"Warning: No publish slot within {planner.horizon.days} days for {job.name}. Deferred to a later run.")
+            continue
+        job.publish_date = when
+        scheduled.append(job)
+    print(f"Publish plan saved to {planner.plan_file}: {len(scheduled)}/{len(jobs)} jobs scheduled.")
+    return scheduled
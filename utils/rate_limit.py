@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    令牌桶：平均每 interval 秒产生一个令牌，最多攒 burst 个。
+
+    取令牌采用"预约"方式：令牌数可以为负，调用方只需睡到自己那个令牌产生为止，
+    因此多个协程/线程同时取令牌时不会互相唤醒重试，也不会超发。
+    """
+
+    def __init__(self, interval: float, burst: int = 1):
+        self.interval = max(float(interval), 0.0)
+        self.burst = max(int(burst), 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """取一个令牌，返回需要等待的秒数(0 表示立即可用)。"""
+        if self.interval == 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens * self.interval
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def acquire_sync(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RateLimiter(object):
+    """
+    按 (平台, 账号) 和 平台全局 两级令牌桶限流。
+
+    配置来自 workflow_config.json 的 "rate_limits"，例如：
+        "rate_limits": {
+            "douyin": {"account": {"interval": 60, "burst": 2}, "global": {"interval": 10, "burst": 3}}
+        }
+    interval 为平均每次上传的间隔(秒)，burst 为允许连续上传的次数。
+    没有配置账号级限流的平台，使用上传器声明的 min_spacing 作为默认间隔；没有配置全局限流则不限。
+    """
+
+    def __init__(self, config: dict = None):
+        self.config = config or {}
+        self._buckets = {}
+
+    def _bucket(self, key, rule):
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(rule.get('interval', 0), rule.get('burst', 1))
+        return self._buckets[key]
+
+    def buckets(self, platform: str, account_name: str, default_interval: float = 0) -> list:
+        """要依次取令牌的桶：先账号，再平台全局(如果配置了)。"""
+        platform_rules = self.config.get(platform, {})
+        account_rule = platform_rules.get('account', {'interval': default_interval, 'burst': 1})
+        buckets = [self._bucket((platform, account_name), account_rule)]
+        if 'global' in platform_rules:
+            buckets.append(self._bucket((platform,), platform_rules['global']))
+        return buckets
+
+    # 等账号令牌到手后才去预约全局令牌：否则账号还要排很久时，它提前占住的全局名额会挡住其他账号
+    async def acquire(self, platform: str, account_name: str, default_interval: float = 0):
+        wait = 0.0
+        for bucket in self.buckets(platform, account_name, default_interval):
+            wait += await bucket.acquire()
+        return wait
+
+    def acquire_sync(self, platform: str, account_name: str, default_interval: float = 0):
+        wait = 0.0
+        for bucket in self.buckets(platform, account_name, default_interval):
+            wait += bucket.acquire_sync()
+        return wait
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import aiohttp
+
+PROBE_TIMEOUT = 10
+PROBE_CONCURRENCY = 50
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) " \
+             "Chrome/127.0.0.0 Safari/537.36"
+
+
+def _douyin(status, data):
+    if data.get('status_code') == 0 and data.get('user'):
+        return True
+    return False if data.get('status_code') in (8, 2190008) else None
+
+
+def _tencent(status, data):
+    if data.get('errCode') == 0 and data.get('data', {}).get('finderUser'):
+        return True
+    return False if data.get('errCode') in (300333, 300334) else None
+
+
+def _kuaishou(status, data):
+    if data.get('result') == 1 and data.get('data'):
+        return True
+    return False if data.get('result') in (109, 110) else None
+
+
+def _bilibili(status, data):
+    if data.get('code') == 0:
+        return bool(data.get('data', {}).get('isLogin'))
+    return False if data.get('code') == -101 else None
+
+
+def _tiktok(status, data):
+    if data.get('message') == 'success' and data.get('data', {}).get('user_id'):
+        return True
+    return False if data.get('message') == 'error' and data.get('data', {}).get('error_code') == 1 else None
+
+
+def _baijiahao(status, data):
+    if data.get('errno') == 0 and data.get('data', {}).get('user'):
+        return True
+    return False if data.get('errno') in (110, 20001) else None
+
+
+# 平台 -> (method, 接口, 判断函数)。判断函数返回 True/False，响应不认识时返回 None(交给浏览器检查)
+PROBES = {
+    "douyin": ("GET", "https://creator.douyin.com/web/api/media/user/info/", _douyin),
+    "tencent": ("POST", "https://channels.weixin.qq.com/cgi-bin/mmfinderassistant-bin/auth/auth_data", _tencent),
+    "kuaishou": ("POST", "https://cp.kuaishou.com/rest/v2/creator/pc/authority/account/current", _kuaishou),
+    "bilibili": ("GET", "https://api.bilibili.com/x/web-interface/nav", _bilibili),
+    "tiktok": ("GET", "https://www.tiktok.com/passport/web/account/info/", _tiktok),
+    "baijiahao": ("GET", "https://baijiahao.baidu.com/builder/app/appinfo", _baijiahao),
+}
+
+
+def cookie_header(state: dict, url) -> str:
+    """按域名、路径和过期时间挑出请求该 url 时浏览器会带上的 cookie。"""
+    parts = urlsplit(url)
+    host, path = parts.hostname, parts.path or '/'
+    now = time.time()
+    cookies = state.get('cookies')
+    if cookies is None:
+        cookies = state.get('cookie_info', {}).get('cookies', [])  # biliup 的登录文件
+    pairs = []
+    for cookie in cookies:
+        domain = (cookie.get('domain') or host).lstrip('.')
+        if host != domain and not host.endswith('.' + domain):
+            continue
+        if not path.startswith(cookie.get('path') or '/'):
+            continue
+        if cookie.get('expires', -1) not in (-1, None) and cookie['expires'] < now:
+            continue
+        pairs.append(f"{cookie['name']}={cookie['value']}")
+    return "; ".join(pairs)
+
+
+def response_cookies(response, host) -> list:
+    """把 Set-Cookie 转成 playwright storage_state 里的 cookie 格式。"""
+    now = time.time()
+    cookies = []
+    for name, morsel in response.cookies.items():
+        if morsel['domain']:
+            domain = '.' + morsel['domain'].lstrip('.')
+        else:
+            domain = host
+        expires = -1
+        if morsel['max-age']:
+            expires = now + int(morsel['max-age'])
+        elif morsel['expires']:
+            try:
+                expires = parsedate_to_datetime(morsel['expires']).timestamp()
+            except (TypeError, ValueError):
+                pass
+        cookies.append({"name": name, "value": morsel.value, "domain": domain, "path": morsel['path'] or '/',
+                        "expires": expires, "httpOnly": bool(morsel['httponly']), "secure": bool(morsel['secure']),
+                        "sameSite": "Lax"})
+    return cookies
+
+
+class SessionProber(object):
+    """
+    用 HTTP 请求代替打开创作者中心来检查登录态：每个平台调用一个需要登录的轻量接口。
+    所有账号共用一个连接池，cookie 按请求单独带上(不用共享的 cookie jar，账号之间互不影响)。
+    """
+
+    def __init__(self, concurrency=PROBE_CONCURRENCY):
+        self.concurrency = concurrency
+        self.session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300),
+            cookie_jar=aiohttp.DummyCookieJar(),
+            timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT),
+            headers={"User-Agent": USER_AGENT})
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+    async def probe(self, platform, account_file):
+        """True/False 为接口给出的结论，None 表示没有该平台的探测接口或结果无法判断。"""
+        return (await self.check(platform, account_file))[0]
+
+    async def check(self, platform, account_file):
+        """返回 (结论, 响应里 Set-Cookie 下发的 cookie 列表)，保活时用后者刷新 cookie 文件。"""
+        if platform not in PROBES:
+            return None, []
+        method, url, judge = PROBES[platform]
+        try:
+            with open(account_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None, []
+        cookie = cookie_header(state, url)
+        if not cookie:
+            return False, []
+        parts = urlsplit(url)
+        headers = {"Cookie": cookie, "Referer": f"{parts.scheme}://{parts.hostname}/"}
+        async with self._semaphore:
+            try:
+                async with self.session.request(method, url, headers=headers, allow_redirects=False) as response:
+                    # 跳转、401/403 也可能是风控拦截或签名校验失败，不能据此判定未登录，交给浏览器检查；
+                    # 只有平台接口明确返回"未登录"(各判断函数)才算失效
+                    if response.status != 200:
+                        return None, []
+                    data = await response.json(content_type=None)
+                    new_cookies = response_cookies(response, parts.hostname)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                return None, []
+        verdict = judge(response.status, data) if isinstance(data, dict) else None
+        return verdict, new_cookies if verdict else []
+
+
+_shared = None
+
+
+@asynccontextmanager
+async def shared_prober(concurrency=PROBE_CONCURRENCY):
+    """批量校验时共用一个连接池，期间 probe_session 都走它。"""
+    global _shared
+    async with SessionProber(concurrency) as prober:
+        _shared = prober
+        try:
+            yield prober
+        finally:
+            _shared = None
+
+
+async def probe_session(platform, account_file):
+    if _shared is not None:
+        return await _shared.probe(platform, account_file)
+    async with SessionProber(concurrency=1) as prober:
+        return await prober.probe(platform, account_file)
@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from conf import BASE_DIR
+
+DEFAULT_STAGING_DIR = Path(BASE_DIR) / "staging"
+DEFAULT_STAGING_BUDGET_MB = 8192
+DEFAULT_LOOKAHEAD = 4  # 最多提前准备好这么多个还没上传完的视频
+STALE_SECONDS = 24 * 3600  # 启动时清理上次运行残留的暂存文件
+
+
+class StagedVideo(object):
+    def __init__(self, source, size, local):
+        self.source = source
+        self.size = size
+        self.local = local  # 源文件和暂存目录在同一个文件系统，不复制，只预读
+        self.refs = 0  # 还没结束的上传任务数
+        self.path = None  # 暂存副本
+        self.task = None  # 复制/预读，每个视频只做一次
+        self.reserved = False  # 是否占用了暂存预算
+        self.prefetched = False  # 是否占用了预取名额
+        self.failed = False  # 有任务上传失败：暂存副本留着，下次重试不用再复制，也方便排查
+
+
+class VideoStager(object):
+    """
+    上传前把接下来要用的视频准备到本地：videos/ 在网络存储上时复制到暂存目录(本地盘)，
+    已经在本地时用 posix_fadvise(WILLNEED) 让内核提前读进页缓存。
+
+    - 按任务顺序最多提前准备 lookahead 个视频，暂存副本总大小不超过 budget_mb
+    - 轮到某个任务上传时副本还没准备好就当场复制；预算不够则直接读源文件，不等待
+    - 引用该视频的任务(多个平台/分P)全部发布成功后删除暂存副本；有任务失败时副本留在暂存目录，
+      下次运行重试时直接复用，STALE_SECONDS 后由 _remove_stale 清理
+    """
+
+    def __init__(self, staging_dir=DEFAULT_STAGING_DIR, budget_mb=DEFAULT_STAGING_BUDGET_MB,
+                 lookahead=DEFAULT_LOOKAHEAD):
+        self.staging_dir = Path(staging_dir)
+        self.budget = budget_mb * 1024 * 1024
+        self.lookahead = max(1, lookahead)
+        self._videos = {}  # 源文件 -> StagedVideo，按任务顺序
+        self._jobs = set()  # 登记过的任务(id)，只有它们的引用计入 refs
+        self._published = set()  # 发布成功的任务(id)
+        self._used = 0
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+        self._prefetcher = None
+        self.copied_bytes = 0
+
+    @classmethod
+    def from_config(cls, config: dict, shards=1):
+        """workflow 配置里的 "staging": {"dir": ..., "budget_mb": ..., "lookahead": ...}，相对路径相对项目目录，多进程时预算平分。"""
+        return cls(Path(BASE_DIR) / config['dir'] if config.get('dir') else DEFAULT_STAGING_DIR,
+                   max(1, config.get('budget_mb', DEFAULT_STAGING_BUDGET_MB) // shards),
+                   config.get('lookahead', DEFAULT_LOOKAHEAD))
+
+    async def start(self, jobs):
+        """登记这批任务用到的视频并开始后台预取。"""
+        await asyncio.to_thread(self._plan, jobs)
+        self._prefetcher = asyncio.ensure_future(self._prefetch())
+
+    async def close(self):
+        from utils.log import workflow_logger
+        if self._prefetcher is not None:
+            self._prefetcher.cancel()
+            await asyncio.gather(self._prefetcher, return_exceptions=True)
+        for video in self._videos.values():
+            if video.task is not None:
+                await asyncio.gather(video.task, return_exceptions=True)
+            if not video.failed:
+                _discard(video)
+        if self.copied_bytes:
+            workflow_logger.info(f"[staging] copied {self.copied_bytes / 1024 / 1024:.1f} MB to {self.staging_dir}")
+
+    def _plan(self, jobs):
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        _remove_stale(self.staging_dir)
+        staging_dev = os.stat(self.staging_dir).st_dev
+        for job in jobs:
+            self._jobs.add(id(job))
+            for source in job_video_files(job):
+                video = self._videos.get(source)
+                if video is None:
+                    try:
+                        stat = os.stat(source)
+                    except OSError:
+                        continue
+                    video = self._videos[source] = StagedVideo(source, stat.st_size, stat.st_dev == staging_dev)
+                video.refs += 1
+
+    def _fits(self, video: StagedVideo) -> bool:
+        return video.local or self._used + video.size <= self.budget
+
+    def _start(self, video: StagedVideo):
+        if not video.local:
+            self._used += video.size
+            video.reserved = True
+            video.task = asyncio.ensure_future(self._copy(video))
+        else:
+            video.task = asyncio.ensure_future(asyncio.to_thread(_will_need, video.source))
+
+    async def _wait(self, video: StagedVideo):
+        try:
+            await asyncio.shield(video.task)
+        except Exception as e:
+            from utils.log import workflow_logger
+            workflow_logger.warning(f"[staging] {Path(video.source).name}: {e}, reading from source")
+
+    async def _prefetch(self):
+        for video in list(self._videos.values()):
+            if not video.local and video.size > self.budget:
+                continue  # 单个文件就超出预算，上传时直接读源文件
+            async with self._cond:
+                await self._cond.wait_for(lambda: video.refs == 0 or video.task is not None or
+                                          (self._in_flight < self.lookahead and self._fits(video)))
+                if video.refs == 0 or video.task is not None:
+                    continue
+                video.prefetched = True
+                self._in_flight += 1
+                self._start(video)
+            # 一次只预取一个，不和正在上传的任务抢网络存储的带宽
+            await self._wait(video)
+
+    async def _copy(self, video: StagedVideo):
+        from utils.log import workflow_logger
+        target = staged_path(self.staging_dir, video.source)
+        start = time.monotonic()
+        try:
+            copied = await asyncio.to_thread(_copy_file, video.source, target)
+        except BaseException:
+            await self._unreserve(video)
+            raise
+        video.path = str(target)
+        if copied:
+            self.copied_bytes += video.size
+            workflow_logger.info(f"[staging] {Path(video.source).name}: {video.size / 1024 / 1024:.1f} MB staged "
+                                 f"in {time.monotonic() - start:.1f}s")
+
+    async def _unreserve(self, video: StagedVideo):
+        async with self._cond:
+            if video.reserved:
+                video.reserved = False
+                self._used -= video.size
+            if video.prefetched and video.refs == 0:
+                video.prefetched = False
+                self._in_flight -= 1
+            self._cond.notify_all()
+
+    async def acquire(self, source) -> str:
+        """返回上传时应该读取的路径：暂存副本，或者(本地文件、预算不够、复制失败时)源文件。"""
+        video = self._videos.get(source)
+        if video is None:
+            return source
+        async with self._cond:
+            if video.task is None and self._fits(video):
+                self._start(video)
+        if video.task is not None:
+            await self._wait(video)
+        return video.path or source
+
+    async def release(self, source, ok=True):
+        """
+        一个任务用完该视频；引用都结束后腾出预算和预取名额，
+        所有任务都成功时删除暂存副本，否则留给下次重试。
+        """
+        from utils.log import workflow_logger
+        video = self._videos.get(source)
+        if video is None:
+            return
+        video.refs -= 1
+        video.failed = video.failed or not ok
+        if video.refs > 0:
+            return
+        if video.task is not None:
+            await asyncio.gather(video.task, return_exceptions=True)
+        if not video.failed:
+            await asyncio.to_thread(_discard, video)
+        elif video.path is not None:
+            workflow_logger.info(f"[staging] {Path(source).name}: upload failed, keeping {video.path} for the retry")
+        await self._unreserve(video)
+
+    def published(self, job):
+        """任务发布成功(在 staged 里调用)，结束时它用到的暂存副本可以删除。"""
+        self._published.add(id(job))
+
+    @asynccontextmanager
+    async def staged(self, job):
+        """
+        上传期间把任务(包括多P的各分P)的视频路径换成暂存副本，结束后换回并释放。
+        成功时调用方要在退出前调用 published(job)，否则视为失败，暂存副本保留。
+        """
+        if id(job) not in self._jobs:
+            yield job  # 没有登记的任务(例如上传转码结果的)直接用原路径
+            return
+        sources = job_video_files(job)
+        original_file, original_parts = job.video_file, job.parts
+        try:
+            paths = {source: await self.acquire(source) for source in sources}
+            job.video_file = paths.get(job.video_file, job.video_file)
+            if job.parts:
+                job.parts = [dict(part, video_file=paths.get(part['video_file'], part['video_file']))
+                             for part in job.parts]
+            yield job
+        finally:
+            job.video_file, job.parts = original_file, original_parts
+            ok = id(job) in self._published
+            for source in sources:
+                await self.release(source, ok)
+
+
+def job_video_files(job) -> list:
+    """任务用到的所有视频文件(多P投稿包括各分P)，去重保持顺序。"""
+    files = [job.video_file] + [part['video_file'] for part in job.parts or []]
+    return list(dict.fromkeys(files))
+
+
+def staged_path(staging_dir, source) -> Path:
+    """同一源文件总是暂存到同一路径(保留文件名)，断点续传状态在多次运行间仍然对得上。"""
+    digest = hashlib.sha1(str(Path(source).resolve()).encode('utf-8')).hexdigest()[:16]
+    return Path(staging_dir) / digest / Path(source).name
+
+
+def _copy_file(source, target: Path) -> bool:
+    """复制到 target(保留 mtime)，已有大小和 mtime 都一致的副本时跳过，返回是否真正复制。"""
+    stat = os.stat(source)
+    try:
+        existing = os.stat(target)
+        if existing.st_size == stat.st_size and int(existing.st_mtime) == int(stat.st_mtime):
+            os.utime(target.parent)
+            return False
+    except FileNotFoundError:
+        pass
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    try:
+        shutil.copy2(source, tmp_file)
+        os.replace(tmp_file, target)
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+    return True
+
+
+def _discard(video: StagedVideo):
+    if video.path is not None:
+        Path(video.path).unlink(missing_ok=True)
+        video.path = None
+
+
+def _will_need(path):
+    """提示内核异步预读整个文件；没有 posix_fadvise 的系统(Windows)上什么也不做。"""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def _remove_stale(staging_dir: Path):
+    now = time.time()
+    for directory in staging_dir.iterdir():
+        try:
+            if directory.is_dir() and now - directory.stat().st_mtime > STALE_SECONDS:
+                shutil.rmtree(directory, ignore_errors=True)
+        except OSError:
+            continue
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+from utils.cookie_store import account_key, store_storage_state
+
+WRITE_DEBOUNCE = 0.3  # 同一账号在这段时间内的多次保存合并成一次写盘
+
+# 各平台需要保留 localStorage 的站点(按域名后缀匹配)，其余 origin 直接丢弃；
+# 不在表里的平台保留全部 origin
+PLATFORM_ORIGIN_DOMAINS = {
+    "douyin": ("douyin.com",),
+    "tencent": ("channels.weixin.qq.com",),
+    "kuaishou": ("kuaishou.com",),
+    "tiktok": ("tiktok.com",),
+    "baijiahao": ("baijiahao.baidu.com",),
+    "xhs": ("xiaohongshu.com",),
+}
+
+
+def _origin_domains(account_file):
+    return PLATFORM_ORIGIN_DOMAINS.get(account_key(account_file)[0])
+
+
+def _host_matches(host: str, domains) -> bool:
+    host = host.lstrip('.')
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+
+def compact_storage_state(state: dict, account_file=None) -> dict:
+    """去掉已过期的 cookie，只保留平台站点的 origin(localStorage)。"""
+    now = time.time()
+    cookies = [c for c in state.get('cookies', []) if c.get('expires', -1) in (-1, None) or c['expires'] > now]
+    origins = state.get('origins', [])
+    domains = _origin_domains(account_file) if account_file else None
+    if domains:
+        origins = [o for o in origins
+                   if _host_matches(o['origin'].split('://', 1)[-1].split(':', 1)[0], domains)]
+    return {"cookies": cookies, "origins": origins}
+
+
+def merge_storage_state(old: dict, new: dict) -> dict:
+    """合并同一账号两个上下文的 storage_state，冲突时以 new 为准。"""
+    if not old:
+        return new
+    cookies = {(c['name'], c['domain'], c.get('path', '/')): c for c in old['cookies']}
+    cookies.update({(c['name'], c['domain'], c.get('path', '/')): c for c in new['cookies']})
+    origins = {o['origin']: o for o in old['origins']}
+    origins.update({o['origin']: o for o in new['origins']})
+    return {"cookies": list(cookies.values()), "origins": list(origins.values())}
+
+
+def write_storage_state(account_file, state: dict):
+    """临时文件 + rename，读者不会看到写了一半的 cookie 文件。"""
+    path = Path(account_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_file, path)
+
+
+class StorageStateWriter(object):
+    """
+    storage_state 的统一写入口：同一账号并发的多个上传各自调用 save()，
+    WRITE_DEBOUNCE 内收到的快照合并后只写一次；写盘进行中又有新快照时，写完再补写一次。
+    save() 在自己的快照落盘后才返回。
+    """
+
+    def __init__(self, debounce=WRITE_DEBOUNCE):
+        self.debounce = debounce
+        self._pending = {}  # 账号文件 -> 待写入的合并快照
+        self._writers = {}  # 账号文件 -> 正在进行的写入任务
+
+    async def save(self, context, account_file):
+        key = str(Path(account_file).resolve())
+        state = compact_storage_state(await context.storage_state(), key)
+        self._pending[key] = merge_storage_state(self._pending.get(key), state)
+        writer = self._writers.get(key)
+        if writer is None:
+            writer = asyncio.ensure_future(self._drain(key))
+            self._writers[key] = writer
+        await asyncio.shield(writer)
+
+    async def _drain(self, key):
+        try:
+            await asyncio.sleep(self.debounce)
+            while key in self._pending:
+                state = self._pending.pop(key)
+                # 写入 cookie 库(带版本号)并同步导出到账号文件
+                await asyncio.to_thread(store_storage_state, key, state)
+        finally:
+            self._writers.pop(key, None)
+
+
+_writer = StorageStateWriter()
+
+
+async def save_storage_state(context, account_file):
+    """保存上下文的 cookie/localStorage 到账号文件，替代 context.storage_state(path=...)。"""
+    await _writer.save(context, account_file)
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from conf import BASE_DIR
+from utils.files_times import get_file_digest
+
+DEFAULT_TRANSCODE_DIR = "transcoded"
+DEFAULT_TRANSCODE_WORKERS = 2  # 同时运行的 ffmpeg 进程数
+CACHE_MAX_IDLE_DAYS = 30  # 转码结果超过这么多天没被用到就删除
+BITRATE_TOLERANCE = 1.15  # 源文件码率不超过目标的这么多倍就不转码
+NOT_SMALLER_MARKER = "not_smaller"  # 转码后反而更大，以后直接上传源文件
+
+
+class TranscodeProfile(object):
+    """某平台的目标编码：高度不超过 max_height，H.264 限码率 video_kbps + AAC audio_kbps。"""
+
+    def __init__(self, max_height=1080, video_kbps=6000, audio_kbps=128, crf=23, preset="medium"):
+        self.max_height = max_height
+        self.video_kbps = video_kbps
+        self.audio_kbps = audio_kbps
+        self.crf = crf
+        self.preset = preset
+
+    @property
+    def name(self):
+        return f"{self.max_height}p-{self.video_kbps}k-{self.audio_kbps}k-crf{self.crf}-{self.preset}"
+
+    def within(self, info: dict) -> bool:
+        """源文件已经在目标以内(分辨率和总码率)时不用转码。"""
+        height, bit_rate = info.get('height'), info.get('bit_rate')
+        if not height or not bit_rate:
+            return False
+        target = (self.video_kbps + self.audio_kbps) * 1000 * BITRATE_TOLERANCE
+        return height <= self.max_height and bit_rate <= target
+
+    def ffmpeg_args(self, source, target, threads) -> list:
+        return ["ffmpeg", "-y", "-v", "error", "-i", str(source),
+                "-map", "0:v:0", "-map", "0:a:0?",
+                "-c:v", "libx264", "-preset", self.preset, "-crf", str(self.crf),
+                "-maxrate", f"{self.video_kbps}k", "-bufsize", f"{self.video_kbps * 2}k",
+                "-vf", f"scale=-2:'min({self.max_height},ih)'", "-pix_fmt", "yuv420p",
+                "-c:a", "aac", "-b:a", f"{self.audio_kbps}k",
+                "-movflags", "+faststart", "-threads", str(threads), "-f", "mp4", str(target)]
+
+
+# 各平台默认的目标编码，参考平台转码后实际保留的规格；B 站保留较高码率，默认不转码
+DEFAULT_PROFILES = {
+    "douyin": TranscodeProfile(1080, 6000),
+    "kuaishou": TranscodeProfile(1080, 5000),
+    "tencent": TranscodeProfile(1080, 5000),
+    "tiktok": TranscodeProfile(1080, 6000),
+    "xhs": TranscodeProfile(1080, 5000),
+    "baijiahao": TranscodeProfile(1080, 4000),
+}
+
+
+def probe_video(source) -> dict:
+    """ffprobe 读出第一路视频的高度和文件总码率(bit/s)。"""
+    output = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=height:format=bit_rate",
+         "-of", "json", str(source)], capture_output=True, check=True, timeout=60).stdout
+    data = json.loads(output or b"{}")
+    streams = data.get('streams') or [{}]
+    bit_rate = data.get('format', {}).get('bit_rate')
+    return {"height": streams[0].get('height'), "bit_rate": int(bit_rate) if bit_rate else None}
+
+
+class Transcoder(object):
+    """
+    上传前把视频转成平台的目标编码，减少上传的字节数(平台反正会重新压缩)。
+
+    - 本地 ffmpeg，最多 workers 个进程同时转码，按任务顺序提前开始，和上传并行
+    - 源文件已在目标以内、或转码后反而更大时直接上传源文件
+    - 转码结果按 (内容 sha256, 目标编码) 缓存在 transcoded/，同一视频发到多个账号/平台只转一次
+    - 转码失败或没有 ffmpeg 时上传源文件，不影响发布
+
+    配置来自 workflow_config.json 的 "transcode"，例如：
+        "transcode": {"workers": 2, "dir": "transcoded",
+                      "profiles": {"douyin": {"max_height": 1080, "video_kbps": 6000}, "tencent": null}}
+    profiles 覆盖 DEFAULT_PROFILES，值为 null 的平台不转码。
+    """
+
+    def __init__(self, cache_dir=None, workers=DEFAULT_TRANSCODE_WORKERS, profiles: dict = None):
+        self.cache_dir = Path(cache_dir or Path(BASE_DIR) / DEFAULT_TRANSCODE_DIR)
+        self.workers = max(1, workers)
+        self.profiles = dict(DEFAULT_PROFILES) if profiles is None else profiles
+        self.threads = max(1, (os.cpu_count() or 2) // self.workers)  # 每个 ffmpeg 进程的编码线程数
+        self.enabled = shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+        self._semaphore = asyncio.Semaphore(self.workers)
+        self._tasks = {}  # (源文件, profile 名) -> 转码任务，结果为上传用的文件路径
+        self._digests = {}  # "路径|大小|mtime" -> sha256，持久化在缓存目录里，避免每次运行都重新计算
+        self._digest_lock = threading.Lock()
+        self.source_bytes = 0  # 用了转码结果的上传：原本要上传的字节数
+        self.upload_bytes = 0  # 实际上传的字节数
+
+    @classmethod
+    def from_config(cls, config: dict, shards=1):
+        profiles = dict(DEFAULT_PROFILES)
+        for platform, profile in (config.get('profiles') or {}).items():
+            profiles[platform] = TranscodeProfile(**profile) if profile else None
+        return cls(Path(BASE_DIR) / config.get('dir', DEFAULT_TRANSCODE_DIR),
+                   max(1, config.get('workers', DEFAULT_TRANSCODE_WORKERS) // shards),
+                   {platform: profile for platform, profile in profiles.items() if profile})
+
+    def applies(self, job) -> bool:
+        """多P投稿(B 站)不转码。"""
+        return self.enabled and job.platform in self.profiles and not job.parts
+
+    async def start(self, jobs):
+        """按任务顺序排队转码，ffmpeg 进程数由 workers 限制。"""
+        from utils.log import workflow_logger
+        if not self.enabled:
+            workflow_logger.warning("[transcode] ffmpeg/ffprobe not found, uploading source files")
+            return
+        await asyncio.to_thread(self._load_digests)
+        for job in jobs:
+            if self.applies(job):
+                self._task(job.video_file, self.profiles[job.platform])
+
+    def _task(self, source, profile: TranscodeProfile):
+        key = (source, profile.name)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.ensure_future(self._transcode(source, profile))
+        return self._tasks[key]
+
+    async def _transcode(self, source, profile: TranscodeProfile) -> str:
+        async with self._semaphore:
+            return await asyncio.to_thread(self._run, source, profile)
+
+    def _run(self, source, profile: TranscodeProfile) -> str:
+        from utils.log import workflow_logger
+        name = Path(source).name
+        # 每个 (内容, 目标编码) 一个目录，里面的文件保留源文件名(上传页面和诊断信息里显示的是文件名)
+        entry = self.cache_dir / f"{self._digest(source)[:32]}-{profile.name}"
+        target = entry / name
+        cached = _cached_file(entry, target)
+        if cached is not None:
+            return cached
+        if (entry / NOT_SMALLER_MARKER).exists() or profile.within(probe_video(source)):
+            return source
+        entry.mkdir(parents=True, exist_ok=True)
+        tmp_file = entry / f".{name}.{os.getpid()}.tmp"
+        start = time.monotonic()
+        try:
+            subprocess.run(profile.ffmpeg_args(source, tmp_file, self.threads), check=True, capture_output=True)
+            if os.path.getsize(tmp_file) >= os.path.getsize(source):
+                workflow_logger.info(f"[transcode] {name}: {profile.name} is not smaller, uploading source")
+                (entry / NOT_SMALLER_MARKER).touch()
+                return source
+            os.replace(tmp_file, target)
+        finally:
+            if tmp_file.exists():
+                tmp_file.unlink()
+        workflow_logger.info(f"[transcode] {name} -> {profile.name}: {os.path.getsize(source) / 1024 / 1024:.1f} MB "
+                             f"-> {os.path.getsize(target) / 1024 / 1024:.1f} MB in {time.monotonic() - start:.0f}s")
+        return str(target)
+
+    def _digest(self, source) -> str:
+        stat = os.stat(source)
+        key = f"{Path(source).resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+        with self._digest_lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            digest = get_file_digest(source)
+            with self._digest_lock:
+                self._digests[key] = digest
+        return digest
+
+    def _load_digests(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(self.cache_dir / "digests.json", 'r', encoding='utf-8') as f:
+                self._digests = json.load(f)
+        except (OSError, ValueError):
+            self._digests = {}
+
+    def _save_digests(self):
+        # 只保留源文件还在的记录
+        live = {key: digest for key, digest in self._digests.items() if os.path.exists(key.rsplit('|', 2)[0])}
+        tmp_file = self.cache_dir / f"digests.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(live, f, ensure_ascii=False)
+        os.replace(tmp_file, self.cache_dir / "digests.json")
+
+    @asynccontextmanager
+    async def staged(self, job):
+        """上传期间把任务的视频换成转码结果，结束后换回。"""
+        if not self.applies(job):
+            yield job
+            return
+        from utils.log import workflow_logger
+        source = job.video_file
+        try:
+            path = await asyncio.shield(self._task(source, self.profiles[job.platform]))
+        except Exception as e:
+            workflow_logger.warning(f"[transcode] {Path(source).name}: {e}, uploading source")
+            path = source
+        if path != source:
+            self.source_bytes += os.path.getsize(source)
+            self.upload_bytes += os.path.getsize(path)
+        job.video_file = path
+        try:
+            yield job
+        finally:
+            job.video_file = source
+
+    async def close(self):
+        from utils.log import workflow_logger
+        if not self.enabled:
+            return
+        pending = [task for task in self._tasks.values() if not task.done()]
+        for task in pending:
+            task.cancel()  # 还没轮到的直接取消；正在运行的 ffmpeg 会跑完
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        await asyncio.to_thread(self._cleanup)
+        if self.source_bytes:
+            saved = self.source_bytes - self.upload_bytes
+            workflow_logger.info(f"[transcode] uploaded {self.upload_bytes / 1024 / 1024:.1f} MB instead of "
+                                 f"{self.source_bytes / 1024 / 1024:.1f} MB, saved {saved / 1024 / 1024:.1f} MB "
+                                 f"({saved / self.source_bytes:.0%})")
+
+    def _cleanup(self):
+        self._save_digests()
+        deadline = time.time() - CACHE_MAX_IDLE_DAYS * 86400
+        for entry in self.cache_dir.iterdir():
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < deadline:
+                    shutil.rmtree(entry, ignore_errors=True)
+            except OSError:
+                continue
+
+
+def _cached_file(entry: Path, target: Path):
+    """
+    缓存命中时返回上传用的文件：同内容、不同文件名的视频在目录里加一个硬链接(不支持时复制)。
+    命中会更新目录 mtime，清理时按它判断多久没用。
+    """
+    if not entry.is_dir():
+        return None
+    if not target.exists():
+        existing = next((f for f in entry.glob("*.mp4") if not f.name.startswith('.')), None)
+        if existing is None:
+            return None
+        try:
+            os.link(existing, target)
+        except OSError:
+            shutil.copyfile(existing, target)
+    os.utime(entry)
+    return str(target)
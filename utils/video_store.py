@@ -0,0 +1,117 @@
+import os
+import shutil
+from pathlib import Path
+
+from conf import BASE_DIR
+from utils.files_times import get_file_digest
+
+VIDEOS_DIR = Path(BASE_DIR) / "videos"
+DEFAULT_STORE_DIR = Path(BASE_DIR) / "video_store"
+# 按账号各自维护、不做去重的附属文件(标题/话题、封面)
+SIDECAR_SUFFIXES = (".txt", ".png", ".jpg", ".jpeg")
+
+
+class VideoStore(object):
+    """
+    按内容寻址的视频库：视频字节在 video_store/<sha256 前两位>/<sha256>.mp4 只存一份，
+    videos/<account>/<type>/ 下的文件是指向它的硬链接，workflow 看到的目录结构不变。
+
+    引用计数就是硬链接数：blob 的 st_nlink == 1 说明已经没有账号(或 archive/)引用它，gc 时删除。
+    store 必须和 videos/ 在同一个文件系统上。硬链接共享内容，不要原地修改 videos/ 下的视频，替换时先删除再放新文件。
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR, videos_dir=VIDEOS_DIR):
+        self.store_dir = Path(store_dir)
+        self.videos_dir = Path(videos_dir)
+
+    def blob_path(self, digest) -> Path:
+        return self.store_dir / digest[:2] / f"{digest}.mp4"
+
+    def blobs(self):
+        return sorted(self.store_dir.glob("*/*.mp4")) if self.store_dir.exists() else []
+
+    def _link(self, blob: Path, target: Path):
+        """把 target 原子地替换成 blob 的硬链接。"""
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        os.link(blob, tmp_file)
+        try:
+            os.replace(tmp_file, target)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+
+    def _ensure_blob(self, source: Path, digest) -> Path:
+        """blob 不存在时把 source 收进 store：同一文件系统上直接硬链接，否则复制一份。"""
+        blob = self.blob_path(digest)
+        if blob.exists():
+            return blob
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(source, blob)
+        except OSError:
+            tmp_file = blob.with_name(f".{blob.name}.{os.getpid()}.tmp")
+            shutil.copy2(source, tmp_file)
+            os.replace(tmp_file, blob)
+        return blob
+
+    def ingest(self, root=None) -> dict:
+        """
+        把 videos/ 下已有的视频收进 store，重复内容替换成同一个 blob 的硬链接。
+        已经是硬链接(st_nlink > 1)的文件视为收录过，不再计算哈希。
+        返回 {"files": 处理的文件数, "deduplicated": 换成硬链接的文件数, "saved_bytes": 省下的字节数}
+        """
+        stats = {"files": 0, "deduplicated": 0, "saved_bytes": 0}
+        for video in sorted(Path(root or self.videos_dir).glob("**/*.mp4")):
+            stat = video.stat()
+            if stat.st_nlink > 1:
+                continue
+            stats["files"] += 1
+            blob = self._ensure_blob(video, get_file_digest(video))
+            if os.path.samefile(blob, video):
+                continue
+            self._link(blob, video)
+            stats["deduplicated"] += 1
+            stats["saved_bytes"] += stat.st_size
+        return stats
+
+    def add(self, source, targets) -> list:
+        """
+        把一个新视频放进 store，并链接到各账号目录 targets(相对 videos/ 的 <account>/<type>)。
+        同名的 .txt/.png 等附属文件各复制一份，之后可以按账号分别修改。返回生成的视频路径。
+        """
+        source = Path(source)
+        blob = self._ensure_blob(source, get_file_digest(source))
+        created = []
+        for target_dir in targets:
+            target = self.videos_dir / target_dir / f"{source.stem}.mp4"
+            self._link(blob, target)
+            for suffix in SIDECAR_SUFFIXES:
+                sidecar = source.with_suffix(suffix)
+                if sidecar.exists():
+                    shutil.copy2(sidecar, target.with_suffix(suffix))
+            created.append(target)
+        return created
+
+    def gc(self, dry_run=False) -> list:
+        """删除没有任何硬链接引用的 blob，返回 [(blob, 字节数)]。"""
+        removed = []
+        for blob in self.blobs():
+            stat = blob.stat()
+            if stat.st_nlink > 1:
+                continue
+            if not dry_run:
+                blob.unlink()
+            removed.append((blob, stat.st_size))
+        if not dry_run:
+            for directory in self.store_dir.glob("*"):
+                if directory.is_dir() and not any(directory.iterdir()):
+                    directory.rmdir()
+        return removed
+
+    def stats(self) -> dict:
+        """blob 数、实际占用字节数，以及不去重时 videos/ 等目录里所有链接加起来的字节数。"""
+        blobs = self.blobs()
+        stored = sum(blob.stat().st_size for blob in blobs)
+        linked = sum(blob.stat().st_size * (blob.stat().st_nlink - 1) for blob in blobs)
+        return {"blobs": len(blobs), "stored_bytes": stored, "linked_bytes": linked}
@@ -0,0 +1,488 @@
+import asyncio
+import multiprocessing
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+from queue import Empty
+
+from conf import BASE_DIR
+from utils.base_social_media import PLATFORM_REGISTRY, SOCIAL_MEDIA_BILIBILI, UploadJob, get_account_file, \
+    get_uploader, load_workflow_config
+from utils.archive import archive_published
+from utils.asset_cache import flush_asset_cache
+from utils.publish_plan import apply_publish_plan
+from utils.rate_limit import RateLimiter
+
+# 账号配置里这些 key 是 workflow 自己用的，其余的(例如 tencent_category / bilibili_tid)原样传给上传器
+ACCOUNT_RESERVED_KEYS = ('name', 'video_types', 'platforms')
+DEFAULT_MEMORY_BUDGET = 4096  # MB
+VALIDATE_CONCURRENCY = 3
+
+
+class WorkflowScheduler(object):
+    """
+    按各平台声明的 PlatformCapabilities 打包执行上传任务：
+    - 同一账号在同一平台上的任务串行执行，开始前经过 RateLimiter 限流(默认间隔为 min_spacing 秒)
+    - 每个平台同时进行的会话数不超过 max_concurrent_sessions(多进程时按 session_shares 只取本进程的份额)
+    - 所有正在运行的会话的 memory_cost 之和不超过 memory_budget
+    - 配置了 transcoder(utils.transcode.Transcoder)时，轮到该任务后先等它的转码结果(转码本身提前在后台进行)
+    - 配置了 stager(utils.staging.VideoStager)时，拿到会话后才把视频换成本地暂存副本
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, rate_limiter: RateLimiter = None, stager=None,
+                 transcoder=None, session_shares=None):
+        self.memory_budget = memory_budget
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.stager = stager
+        self.transcoder = transcoder
+        self.session_shares = session_shares or {}  # 平台 -> (本进程序号, 有该平台任务的进程数)
+        self._memory_free = memory_budget
+        self._memory_cond = asyncio.Condition()
+        self._platform_slots = {}
+        self._account_locks = {}
+
+    def _platform_slot(self, platform, limit):
+        if platform not in self._platform_slots:
+            if platform in self.session_shares:
+                # 平台会话上限按进程平分，余数给前面的进程；每个进程至少 1 个
+                position, shards = self.session_shares[platform]
+                limit = limit // shards + (1 if position < limit % shards else 0)
+            self._platform_slots[platform] = asyncio.Semaphore(max(1, limit))
+        return self._platform_slots[platform]
+
+    def _account_lock(self, key):
+        if key not in self._account_locks:
+            self._account_locks[key] = asyncio.Lock()
+        return self._account_locks[key]
+
+    async def _acquire_memory(self, cost):
+        cost = min(cost, self.memory_budget)
+        async with self._memory_cond:
+            await self._memory_cond.wait_for(lambda: self._memory_free >= cost)
+            self._memory_free -= cost
+        return cost
+
+    async def _release_memory(self, cost):
+        async with self._memory_cond:
+            self._memory_free += cost
+            self._memory_cond.notify_all()
+
+    async def run_job(self, job: UploadJob, uploader) -> bool:
+        caps = uploader.capabilities
+        key = (job.platform, job.account_name)
+        async with self._account_lock(key), self.transcoder.staged(job) if self.transcoder else nullcontext(job):
+            await self.rate_limiter.acquire(job.platform, job.account_name, caps.min_spacing)
+            async with self._platform_slot(job.platform, caps.max_concurrent_sessions):
+                cost = await self._acquire_memory(caps.memory_cost)
+                try:
+                    async with self.stager.staged(job) if self.stager else nullcontext(job):
+                        result = await uploader.upload(job)
+                        ok = await uploader.verify(result)
+                        if ok and self.stager:
+                            self.stager.published(job)
+                    return ok
+                finally:
+                    await self._release_memory(cost)
+
+
+def build_workflow_jobs(workflow_config: dict, generated_schedule_times=None):
+    """
+    把 workflow 配置展开成 UploadJob 列表，顺序与目录扫描顺序一致。
+    配置了 "archive" 时只扫描待发布的视频，已在某平台发布成功的视频不再生成该平台的任务。
+    """
+    from utils.archive import get_archive
+    from utils.files_times import get_title_and_hashtags
+
+    base_videos_path = Path(BASE_DIR) / "videos"
+    archive = get_archive(workflow_config)
+    jobs = []
+    video_index_counter = 0  # 跨账号/类型的全局视频序号，用于取 generated_schedule
+
+    for account in workflow_config.get('accounts', []):
+        account_name = account.get('name')
+        video_types = account.get('video_types', [])
+        platforms = account.get('platforms', [])
+
+        if not account_name:
+            print("Warning: Skipping account with no name defined in config.")
+            continue
+
+        options = {k: v for k, v in account.items() if k not in ACCOUNT_RESERVED_KEYS}
+        print(f"\nProcessing account: {account_name}")
+        print(f"Video types: {video_types}")
+        print(f"Platforms: {platforms}")
+
+        for platform in platforms:
+            if platform not in PLATFORM_REGISTRY:
+                print(f"Warning: Unsupported platform '{platform}' for account '{account_name}'. Skipping.")
+
+        for video_type in video_types:
+            video_type_path = base_videos_path / account_name / video_type
+            if not video_type_path.exists() or not video_type_path.is_dir():
+                print(f"Warning: Video type directory not found: {video_type_path}. Skipping.")
+                continue
+
+            # Sort to process in a consistent order, recursively
+            video_files = archive.pending_videos(video_type_path) if archive else sorted(video_type_path.glob("**/*.mp4"))
+            if not video_files:
+                print(f"No MP4 videos found for video type '{video_type}' in {video_type_path}. Skipping.")
+                continue
+
+            print(f"Found {len(video_files)} videos for type '{video_type}': {[f.name for f in video_files]}")
+
+            for video_file in video_files:
+                title, tags = get_title_and_hashtags(str(video_file))
+
+                publish_date = 0  # 没有生成的排期时立即发布
+                if generated_schedule_times and video_index_counter < len(generated_schedule_times):
+                    publish_date_str = generated_schedule_times[video_index_counter]
+                    try:
+                        publish_date = datetime.strptime(publish_date_str, '%Y-%m-%d %H:%M')
+                    except ValueError as e:
+                        print(f"Warning: Failed to parse generated schedule time '{publish_date_str}' for video {video_file.name}: {e}. Using immediate publish.")
+                elif generated_schedule_times is not None:
+                    print(f"Warning: No generated schedule time available for video {video_file.name}. Using immediate publish.")
+                video_index_counter += 1
+
+                if not title:
+                    print(f"Warning: Skipping video {video_file.name} due to missing title (.txt file).")
+                    continue
+
+                thumbnail_path = video_file.with_suffix('.png')
+                published = archive.published_platforms(video_file) if archive else set()
+                for platform in platforms:
+                    if platform not in PLATFORM_REGISTRY or platform in published:
+                        continue
+                    jobs.append(UploadJob(account_name, platform, video_file, title, tags, publish_date,
+                                          video_type=video_type,
+                                          thumbnail_path=str(thumbnail_path) if thumbnail_path.exists() else None,
+                                          options=options))
+    return group_multipart_jobs(jobs)
+
+
+def group_multipart_jobs(jobs):
+    """
+    账号配置 "bilibili_multipart": true 时，把该账号同一视频类型下的 B 站任务合并成一个多P投稿，
+    以第一个视频为主任务(标题、排期都用它的)，其余视频作为后续分P。
+    """
+    grouped = []
+    heads = {}
+    for job in jobs:
+        if job.platform != SOCIAL_MEDIA_BILIBILI or not job.options.get('bilibili_multipart'):
+            grouped.append(job)
+            continue
+        part = {"video_file": job.video_file, "title": job.title}
+        head = heads.get((job.account_name, job.video_type))
+        if head is None:
+            job.parts = [part]
+            heads[(job.account_name, job.video_type)] = job
+            grouped.append(job)
+        else:
+            head.parts.append(part)
+    return grouped
+
+
+def _mark_cookie_checked(account_file, valid):
+    from utils.cookie_store import account_key, get_cookie_store
+    store = get_cookie_store()
+    store.import_file(account_file)
+    store.mark_checked(*account_key(account_file), valid)
+
+
+async def prepare_uploaders(jobs):
+    """每个 (平台, 账号) 只创建并校验一次上传器，返回 {(platform, account): uploader}，校验失败的不在其中。"""
+    from utils.log import workflow_logger
+
+    keys = []
+    for job in jobs:
+        if (job.platform, job.account_name) not in keys:
+            keys.append((job.platform, job.account_name))
+
+    semaphore = asyncio.Semaphore(VALIDATE_CONCURRENCY)
+    uploaders = {}
+
+    async def validate(key):
+        platform, account_name = key
+        account_file = get_account_file(platform, account_name)
+        if not account_file.exists():
+            workflow_logger.error(f"Cookie file not found for account '{account_name}' on platform '{platform}' at {account_file}. Skipping.")
+            return
+        uploader = get_uploader(platform, account_file)
+        async with semaphore:
+            try:
+                valid = await uploader.validate()
+            except Exception as e:
+                workflow_logger.error(f"Validating cookie for account '{account_name}' on platform '{platform}' failed: {e}")
+                valid = False
+        # 记录到 cookie 库，之后按平台查询有效账号不用再逐个校验
+        await asyncio.to_thread(_mark_cookie_checked, account_file, valid)
+        if valid:
+            uploaders[key] = uploader
+        else:
+            workflow_logger.error(f"Cookie for account '{account_name}' on platform '{platform}' is invalid. Skipping.")
+
+    # 登录态探测共用一个 HTTP 连接池，几百个账号也只需要几秒
+    from utils.session_probe import shared_prober
+    async with shared_prober():
+        await asyncio.gather(*[validate(key) for key in keys])
+    return uploaders
+
+
+async def execute_jobs(jobs, memory_budget=DEFAULT_MEMORY_BUDGET, rate_limits=None, on_result=None, staging=None,
+                       transcoder=None, session_shares=None):
+    """
+    校验 cookie 后交给 WorkflowScheduler 执行，返回 {job.key: 是否成功}。
+    on_result(job, ok) 在每个任务结束(或因 cookie 无效被跳过)时调用，多进程模式下用来上报进度。
+    staging: VideoStager，或者为 None(直接读 videos/ 下的源文件)。
+    transcoder: Transcoder，或者为 None(上传原始文件)。
+    session_shares: 多进程时本进程在各平台会话上限里的份额，见 shard_session_shares。
+    """
+    from utils.log import workflow_logger
+    try:
+        from playwright.async_api import TargetClosedError
+    except ImportError:
+        TargetClosedError = None
+
+    uploaders = await prepare_uploaders(jobs)
+    scheduler = WorkflowScheduler(memory_budget, RateLimiter(rate_limits), staging, transcoder, session_shares)
+    results = {job.key: False for job in jobs}
+
+    async def run(job):
+        print(f"\n  Processing video: {Path(job.video_file).name} -> {job.platform} ({job.account_name})")
+        print(f"    Title: {job.title}")
+        print(f"    Tags: {job.tags}")
+        print(f"    Scheduled for: {job.publish_date if job.publish_date != 0 else 'Immediate'}")
+        # 该任务内所有业务日志都带上 job/account/platform 字段(结构化日志时输出)
+        with workflow_logger.contextualize(job=job.name, account=job.account_name, platform=job.platform):
+            try:
+                ok = await scheduler.run_job(job, uploaders[(job.platform, job.account_name)])
+            except Exception as e:
+                ok = False
+                if TargetClosedError is not None and isinstance(e, TargetClosedError):
+                    # 发布完成后关闭浏览器时偶尔出现，不影响结果
+                    workflow_logger.warning(f"Upload task {job.name} encountered TargetClosedError: {e}")
+                else:
+                    workflow_logger.opt(exception=e).error(f"Upload {job.name} failed with unexpected error: {e}")
+            else:
+                if ok:
+                    workflow_logger.success(f"Upload {job.name} completed successfully.")
+                else:
+                    workflow_logger.error(f"Upload {job.name} was not confirmed by the platform.")
+        results[job.key] = ok
+        if on_result is not None:
+            on_result(job, ok)
+
+    for job in jobs:
+        if (job.platform, job.account_name) not in uploaders and on_result is not None:
+            on_result(job, False)
+    runnable = [job for job in jobs if (job.platform, job.account_name) in uploaders]
+    if transcoder is not None:
+        await transcoder.start(runnable)
+    if staging is not None:
+        # 转码的任务上传的是本地的转码结果，不用暂存源文件
+        await staging.start([job for job in runnable if transcoder is None or not transcoder.applies(job)])
+    try:
+        await asyncio.gather(*[run(job) for job in runnable])
+    finally:
+        if staging is not None:
+            await staging.close()
+        if transcoder is not None:
+            await transcoder.close()
+    flush_asset_cache(workflow_logger)
+    return results
+
+
+def shard_jobs_by_account(jobs, workers):
+    """按账号把任务分成最多 workers 份：同一账号的任务总在同一个进程里，任务多的账号优先分到最空的分片。"""
+    by_account = {}
+    for job in jobs:
+        by_account.setdefault(job.account_name, []).append(job)
+    shards = [[] for _ in range(max(1, min(workers, len(by_account))))]
+    for account_jobs in sorted(by_account.values(), key=len, reverse=True):
+        min(shards, key=len).extend(account_jobs)
+    return shards
+
+
+def shard_rate_limits(rate_limits, shards):
+    """账号级限流天然按分片隔离；平台全局限流按分片数平摊到每个进程。"""
+    if not rate_limits or shards <= 1:
+        return rate_limits
+    sharded = {}
+    for platform, rules in rate_limits.items():
+        sharded[platform] = dict(rules)
+        if 'global' in rules:
+            rule = rules['global']
+            sharded[platform]['global'] = {'interval': rule.get('interval', 0) * shards,
+                                           'burst': max(1, rule.get('burst', 1) // shards)}
+    return sharded
+
+
+def shard_session_shares(shards) -> list:
+    """
+    平台的 max_concurrent_sessions 是所有账号合计的上限，多进程时按有该平台任务的进程平分。
+    返回每个分片的 {平台: (序号, 进程数)}，由各进程的 WorkflowScheduler 换算成自己的会话数。
+    """
+    holders = {}
+    for index, shard in enumerate(shards):
+        for platform in {job.platform for job in shard}:
+            holders.setdefault(platform, []).append(index)
+    shares = [{} for _ in shards]
+    for platform, indexes in holders.items():
+        for position, index in enumerate(indexes):
+            shares[index][platform] = (position, len(indexes))
+    return shares
+
+
+def max_workers_for_memory(jobs, memory_budget) -> int:
+    """内存预算平分给各进程后，每个进程至少要放得下一个最耗内存的会话。"""
+    from utils.base_social_media import get_uploader_class
+    costs = []
+    for platform in {job.platform for job in jobs}:
+        try:
+            costs.append(get_uploader_class(platform).capabilities.memory_cost)
+        except ImportError:
+            continue  # 缺依赖的平台在 worker 里校验时会被跳过
+    return max(1, memory_budget // max(costs, default=1))
+
+
+def _stages(stage_config, shards=1) -> dict:
+    """
+    按 workflow 配置的 "staging" / "transcode" 创建上传前的处理阶段，返回 execute_jobs 的关键字参数。
+    多进程时各阶段的资源预算平分给每个进程。
+    """
+    stages = {}
+    if stage_config and stage_config.get('staging'):
+        from utils.staging import VideoStager
+        stages['staging'] = VideoStager.from_config(stage_config['staging'], shards)
+    if stage_config and stage_config.get('transcode'):
+        from utils.transcode import Transcoder
+        stages['transcoder'] = Transcoder.from_config(stage_config['transcode'], shards)
+    return stages
+
+
+def _shard_worker(index, jobs, memory_budget, rate_limits, stage_config, shards, session_shares, queue):
+    """worker 进程入口：独立的事件循环和浏览器，进度和日志通过 queue 交给 coordinator。"""
+    from utils.log import forward_logs
+    forward_logs(queue)
+    try:
+        asyncio.run(execute_jobs(jobs, memory_budget, rate_limits,
+                                 on_result=lambda job, ok: queue.put(("job", job.key, ok)),
+                                 session_shares=session_shares, **_stages(stage_config, shards)))
+    finally:
+        queue.put(("exit", index))
+
+
+async def execute_sharded(jobs, workers, memory_budget=DEFAULT_MEMORY_BUDGET, rate_limits=None, stage_config=None):
+    """
+    多进程执行：按账号分片，每个分片一个 spawn 出来的 worker 进程(各自的事件循环和浏览器)，
+    内存预算、平台会话上限、暂存预算和转码进程数平均分给各进程；进程数不超过内存预算放得下的数量。
+    当前进程作为 coordinator 汇总进度、日志和结果。
+    stage_config: workflow 配置里的 {"staging": ..., "transcode": ...}。
+    """
+    from utils.log import replay_log_record, workflow_logger
+
+    max_workers = max_workers_for_memory(jobs, memory_budget)
+    if workers > max_workers:
+        workflow_logger.warning(f"memory_budget_mb {memory_budget} only fits {max_workers} workers, "
+                                f"using {max_workers} instead of {workers}")
+        workers = max_workers
+    shards = shard_jobs_by_account(jobs, workers)
+    if len(shards) == 1:
+        return await execute_jobs(jobs, memory_budget, rate_limits, **_stages(stage_config))
+
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    shard_budget = max(1, memory_budget // len(shards))
+    session_shares = shard_session_shares(shards)
+    processes = []
+    for index, shard in enumerate(shards):
+        process = context.Process(target=_shard_worker, name=f"workflow-worker-{index}",
+                                  args=(index, shard, shard_budget, shard_rate_limits(rate_limits, len(shards)),
+                                        stage_config, len(shards), session_shares[index], queue))
+        process.start()
+        processes.append(process)
+        accounts = sorted({job.account_name for job in shard})
+        workflow_logger.info(f"Worker {index} (pid {process.pid}): {len(shard)} jobs, accounts {accounts}")
+
+    results = {job.key: False for job in jobs}
+    finished = 0
+    running = len(processes)
+    while running:
+        try:
+            message = await asyncio.to_thread(queue.get, True, 1)
+        except Empty:
+            if not any(process.is_alive() for process in processes):
+                # worker 异常退出，没来得及发 exit
+                break
+            continue
+        if message[0] == "log":
+            replay_log_record(message[1])
+        elif message[0] == "job":
+            _, key, ok = message
+            results[key] = ok
+            finished += 1
+            print(f"[workflow] progress {finished}/{len(jobs)}: {key} {'succeeded' if ok else 'failed'}")
+        elif message[0] == "exit":
+            running -= 1
+
+    for process in processes:
+        process.join()
+        if process.exitcode:
+            workflow_logger.error(f"{process.name} exited with code {process.exitcode}")
+    return results
+
+
+async def enqueue_workflow(config: dict | str, queue_path):
+    """分布式模式：展开 workflow 任务(含发布排期)写入共享队列，由各节点的 `cli_main.py worker` 执行。"""
+    from utils.job_queue import JobQueue
+    from utils.publish_plan import plan_key
+
+    workflow_config = load_workflow_config(config) if isinstance(config, str) else config
+    generated_schedule_times = workflow_config.pop('generated_schedule', None)
+    jobs = build_workflow_jobs(workflow_config, generated_schedule_times)
+    if generated_schedule_times is None and workflow_config.get('publish_plan') is not None:
+        jobs = apply_publish_plan(jobs, workflow_config['publish_plan'])
+    queue = JobQueue(queue_path)
+    try:
+        added = queue.enqueue(jobs, plan_key)
+        print(f"Enqueued {added} new jobs ({len(jobs) - added} already in queue) into {queue.path}: {queue.stats()}")
+    finally:
+        queue.close()
+    return added
+
+
+async def run_workflow(config: dict | str, workers: int = 1):
+    """Runs the multi-account and multi-video-type workflow. workers > 1 时按账号分到多个进程执行。"""
+    generated_schedule_times = None
+
+    if isinstance(config, str):
+        print(f"Loading workflow config from {config}")
+        workflow_config = load_workflow_config(config)
+    else:
+        print("Using provided workflow config dictionary.")
+        workflow_config = config
+    if 'generated_schedule' in workflow_config:
+        generated_schedule_times = workflow_config.pop('generated_schedule')
+        print(f"Found generated schedule with {len(generated_schedule_times)} entries.")
+
+    print("Starting workflow execution...")
+    jobs = build_workflow_jobs(workflow_config, generated_schedule_times)
+    if generated_schedule_times is None and workflow_config.get('publish_plan') is not None:
+        # 没有预先生成的排期时，按 publish_plan 给每个 (账号, 平台) 分配发布时刻
+        jobs = apply_publish_plan(jobs, workflow_config['publish_plan'])
+    if not jobs:
+        print("No upload jobs found. Workflow execution finished.")
+        return {}
+
+    memory_budget = workflow_config.get('memory_budget_mb', DEFAULT_MEMORY_BUDGET)
+    stage_config = {key: workflow_config.get(key) for key in ('staging', 'transcode')}
+    if workers > 1:
+        results = await execute_sharded(jobs, workers, memory_budget, workflow_config.get('rate_limits'),
+                                        stage_config)
+    else:
+        results = await execute_jobs(jobs, memory_budget, workflow_config.get('rate_limits'),
+                                     **_stages(stage_config))
+    succeeded = sum(1 for ok in results.values() if ok)
+    print(f"Workflow execution finished: {succeeded}/{len(results)} uploads succeeded.")
+    archive_published(workflow_config, jobs, results)
+    return results